@@ -10,10 +10,11 @@ Author: Elias Niederwieser
 Date: 23.07.2024
 """
 from operator import itemgetter
-from langchain.callbacks import get_openai_callback
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.output_parser import StrOutputParser
+from typing import AsyncIterator
+from ai_tools.intellichek.chains import invoke_with_cost, ainvoke_with_cost, astream_with_cost, with_stream_usage
 
 
 SYSTEM_PROMPT = (
@@ -35,6 +36,22 @@ Answer in this language: {language}
 """)
 
 
+def _basic_chat_chain(model: ChatOpenAI):
+    prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", "{question}"),
+        ])
+
+    return (
+        {
+            "question": itemgetter("question"),
+            "language": itemgetter("language"),
+        }
+        | prompt
+        | model
+        | StrOutputParser()
+    )
+
 def basic_ai_chat(
     inputs: str, 
     language: str, 
@@ -51,30 +68,51 @@ def basic_ai_chat(
     str: The model's response to the user input.
     """
     try:
+        chain = _basic_chat_chain(model)
+        return invoke_with_cost(chain, {"question": inputs, "language": language})
+
+    except Exception as e:
+        print(f"Error in chat_with_user: {str(e)}")
+        raise  
+
+async def abasic_ai_chat(
+    inputs: str, 
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Asynchronously chat with the user using the specified model.
+
+    Parameters:
+    - inputs (str): User input for the conversation.
+    - model (ChatOpenAi): The chat model to be used.
 
-        prompt = ChatPromptTemplate.from_messages([
-                ("system", SYSTEM_PROMPT),
-                ("human", "{question}"),
-            ])
-
-
-        chain = (
-            {
-                "question": itemgetter("question"),
-                "language": itemgetter("language"),
-            }
-            | prompt
-            | model
-            | StrOutputParser()
-        
-        )
-
-        with get_openai_callback() as cb:
-            response = chain.invoke({"question": inputs, "language": language})
-            total_cost = float(cb.total_cost)
-        
-        return response, total_cost
+    Returns:
+    str: The model's response to the user input.
+    """
+    try:
+        chain = _basic_chat_chain(model)
+        return await ainvoke_with_cost(chain, {"question": inputs, "language": language})
 
     except Exception as e:
         print(f"Error in chat_with_user: {str(e)}")
-        raise  
\ No newline at end of file
+        raise  
+
+async def astream_basic_ai_chat(
+    inputs: str, 
+    language: str, 
+    model: ChatOpenAI
+    ) -> AsyncIterator[str]:
+    """
+    Asynchronously chat with the user using the specified model, streaming the response.
+
+    Parameters:
+    - inputs (str): User input for the conversation.
+    - model (ChatOpenAi): The chat model to be used.
+
+    Yields:
+    str: The chunks of the model's response to the user input.
+    """
+    chain = _basic_chat_chain(with_stream_usage(model))
+    async for chunk in astream_with_cost(chain, {"question": inputs, "language": language}):
+        yield chunk
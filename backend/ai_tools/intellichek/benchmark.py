@@ -0,0 +1,112 @@
+"""
+This module provides the CHEK benchmark catalogue of `chek_database/benchmark.json`.
+
+The catalogue is loaded once per process, validated, normalized and indexed, so that a
+benchmark evaluation does no file I/O and no linear scans. Fields that may be a string or
+a list in the JSON file are always lists, empty strings are dropped and the placeholder
+"No previous action needed" is removed from the dependencies. The file is reloaded
+automatically when its modification time changes.
+
+- `BenchmarkEntry`: The validated benchmark of one KMA (Key Maturity Area).
+- `BenchmarkCatalogue`: The entries indexed by KMA label and by action.
+- `get_benchmark_catalogue`: Returns the current catalogue of the process.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+BENCHMARK_PATH = "./ai_tools/chek_database/benchmark.json"
+NO_DEPENDENCY = "No previous action needed"
+
+class BenchmarkEntry(BaseModel):
+    """The CHEK benchmark of one KMA."""
+    model_config = ConfigDict(populate_by_name=True, frozen=True)
+
+    kma: str
+    check_level: int = Field(alias="check level")
+    dependencies: List[str] = []
+    actions: List[str] = []
+    chek_tools: List[str] = Field(default=[], alias="check tools")
+
+    @field_validator("dependencies", "actions", "chek_tools", mode="before")
+    @classmethod
+    def _as_list(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = [value]
+        return [item.strip() for item in value if isinstance(item, str) and item.strip()]
+
+    @field_validator("dependencies")
+    @classmethod
+    def _without_placeholder(cls, value):
+        return [item for item in value if item != NO_DEPENDENCY]
+
+class BenchmarkCatalogue:
+    """The benchmark entries indexed by KMA label and by action."""
+
+    def __init__(self, entries: List[BenchmarkEntry], mtime: float = 0.0):
+        self.entries = entries
+        self.mtime = mtime
+        self.by_kma: Dict[str, BenchmarkEntry] = {entry.kma: entry for entry in entries}
+        self.by_action: Dict[str, List[BenchmarkEntry]] = {}
+        for entry in entries:
+            for action in entry.actions:
+                self.by_action.setdefault(action, []).append(entry)
+
+    @classmethod
+    def load(cls, path: str = BENCHMARK_PATH) -> "BenchmarkCatalogue":
+        """
+        Load and validate a benchmark file.
+
+        Args:
+            path (str): Path to the benchmark JSON file.
+
+        Returns:
+            BenchmarkCatalogue: The catalogue of the file.
+
+        Raises:
+            pydantic.ValidationError: If an entry of the file is invalid.
+        """
+        mtime = os.stat(path).st_mtime
+        with open(path, 'r') as file:
+            data = json.load(file)
+        entries = [BenchmarkEntry.model_validate(item) for item in data["Key Maturity Areas"]]
+        return cls(entries, mtime)
+
+    def get(self, kma: str) -> Optional[BenchmarkEntry]:
+        """Return the benchmark of a KMA label, or None if the KMA is not in the catalogue."""
+        return self.by_kma.get(kma)
+
+    def providers(self, action: str) -> List[BenchmarkEntry]:
+        """Return the benchmarks of the KMAs that work on an action."""
+        return self.by_action.get(action, [])
+
+_catalogues: Dict[str, BenchmarkCatalogue] = {}
+_catalogues_lock = threading.Lock()
+
+def get_benchmark_catalogue(path: str = BENCHMARK_PATH) -> BenchmarkCatalogue:
+    """
+    Return the benchmark catalogue of a file, loading it again if the file has changed.
+
+    Args:
+        path (str): Path to the benchmark JSON file.
+
+    Returns:
+        BenchmarkCatalogue: The current catalogue of the file.
+    """
+    mtime = os.stat(path).st_mtime
+    catalogue = _catalogues.get(path)
+    if catalogue is not None and catalogue.mtime == mtime:
+        return catalogue
+
+    with _catalogues_lock:
+        catalogue = _catalogues.get(path)
+        if catalogue is None or catalogue.mtime != mtime:
+            catalogue = BenchmarkCatalogue.load(path)
+            _catalogues[path] = catalogue
+        return catalogue
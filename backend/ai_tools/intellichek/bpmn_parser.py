@@ -0,0 +1,325 @@
+"""
+This module provides a deterministic parser for the BPMN process maps of the CHEK tool.
+
+Instead of sending the raw XML (namespaces, ids, extension elements and diagram
+information) to the language model, the process map is reduced to a compact typed model
+of its tasks, events and gateways with their names, the user descriptions and maturity
+levels of the CHEK extension (`maturity:user_description`, `maturity:maturity_level`),
+their pools (the participants of the collaboration) and lanes, the order given by the
+sequence flows of every pool starting at its start events, and the message flows between
+the pools.
+
+The XML is read with `iterparse` and every element is released as soon as it has been
+processed, so the memory used does not grow with the size of the diagram, only with the
+number of tasks, events and gateways.
+
+- `parse_bpmn`: Parses a BPMN XML into a `BPMNModel`.
+- `BPMNModel.to_text`: Renders the compact text used in the prompts.
+- `line_lane`: Returns the pool and lane of a line of the compact text.
+- `BPMNModel.to_dict`: Returns the JSON form used by the API.
+- `BPMNParseError`: Exception raised when the input is not a valid BPMN XML.
+"""
+
+import io
+import xml.etree.ElementTree as ET
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+BPMN_NAMESPACE = "http://www.omg.org/spec/BPMN/20100524/MODEL"
+MATURITY_NAMESPACE = "http://maturity"
+
+TASK_TYPES = {
+    "task", "userTask", "serviceTask", "manualTask", "scriptTask", "sendTask",
+    "receiveTask", "businessRuleTask", "callActivity", "subProcess",
+}
+EVENT_TYPES = {
+    "startEvent", "endEvent", "intermediateCatchEvent", "intermediateThrowEvent", "boundaryEvent",
+}
+GATEWAY_TYPES = {
+    "exclusiveGateway", "parallelGateway", "inclusiveGateway", "eventBasedGateway", "complexGateway",
+}
+
+class BPMNParseError(Exception):
+    """Exception raised when the input is not a valid BPMN XML."""
+    pass
+
+@dataclass
+class BPMNElement:
+    """A task, event or gateway of a process map."""
+    id: str
+    category: str
+    type: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    maturity_level: Optional[str] = None
+    pool: Optional[str] = None
+    lane: Optional[str] = None
+    documentation: Optional[str] = None
+    next: List[str] = field(default_factory=list)
+
+@dataclass
+class BPMNFlow:
+    """A sequence flow between two elements, or a message flow between two elements or pools."""
+    source: str
+    target: str
+    name: Optional[str] = None
+
+@dataclass
+class BPMNModel:
+    """The tasks, events and gateways of a process map in sequence-flow order."""
+    elements: List[BPMNElement]
+    flows: List[BPMNFlow]
+    messages: List[BPMNFlow] = field(default_factory=list)
+    # Names of the pools by participant ID, for message flows that start or end at a pool
+    pools: Dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        """Return the JSON form of the model."""
+        return {
+            "elements": [asdict(element) for element in self.elements],
+            "flows": [asdict(flow) for flow in self.flows],
+            "messages": [asdict(message) for message in self.messages],
+        }
+
+    def to_text(self) -> str:
+        """
+        Render the model as a numbered list, one line per task, event or gateway, followed by
+        one line per message flow (`Message flow: 3 (APPLICANT) -> 17 (BUILDING AUTHORITY)`).
+
+        Returns:
+            str: The compact text rendering of the process map.
+        """
+        positions = {element.id: index for index, element in enumerate(self.elements, start=1)}
+        flow_names = {(flow.source, flow.target): flow.name for flow in self.flows if flow.name}
+
+        lines = []
+        for index, element in enumerate(self.elements, start=1):
+            parts = [f"{index}. {_label(element.type)}: {element.name or 'Unnamed'}"]
+            if element.pool:
+                parts.append(f"Pool: {element.pool}")
+            if element.lane:
+                parts.append(f"Lane: {element.lane}")
+            if element.description:
+                parts.append(f"Description: {element.description}")
+            if element.documentation:
+                parts.append(f"Documentation: {element.documentation}")
+            if element.maturity_level:
+                parts.append(f"Maturity level: {element.maturity_level}")
+            if element.next:
+                successors = []
+                for target in element.next:
+                    successor = str(positions[target])
+                    if (element.id, target) in flow_names:
+                        successor += f" ({flow_names[(element.id, target)]})"
+                    successors.append(successor)
+                parts.append(f"Next: {', '.join(successors)}")
+            lines.append(" | ".join(parts))
+
+        elements = {element.id: element for element in self.elements}
+        for message in self.messages:
+            line = f"Message flow: {self._endpoint(message.source, positions, elements)} -> {self._endpoint(message.target, positions, elements)}"
+            if message.name:
+                line += f" | Message: {message.name}"
+            lines.append(line)
+
+        return "\n".join(lines)
+
+    def _endpoint(self, ref: str, positions: Dict[str, int], elements: Dict[str, BPMNElement]) -> str:
+        if ref in positions:
+            pool = elements[ref].pool
+            return f"{positions[ref]} ({pool})" if pool else str(positions[ref])
+        return self.pools.get(ref) or "Unnamed pool"
+
+def line_lane(line: str) -> Optional[str]:
+    """
+    Return the pool and lane of a line of `BPMNModel.to_text`.
+
+    Args:
+        line (str): One line of the compact text, i.e. one task, event or gateway, or a message flow.
+
+    Returns:
+        str or None: The pool and the lane as `Pool / Lane`, or None if the element is neither
+        in a pool nor in a lane and for message flows.
+    """
+    swimlanes = [
+        part.split(": ", 1)[1] for part in line.split(" | ")[1:]
+        if part.startswith(("Pool: ", "Lane: "))
+    ]
+    return " / ".join(swimlanes) or None
+
+def _label(element_type: str) -> str:
+    """Turn a BPMN tag name like `exclusiveGateway` into `Exclusive Gateway`."""
+    label = "".join(f" {char}" if char.isupper() else char for char in element_type)
+    return label[:1].upper() + label[1:]
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _text(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    value = " ".join(value.split())
+    return value or None
+
+def _category(element_type: str) -> Optional[str]:
+    if element_type in TASK_TYPES:
+        return "task"
+    if element_type in EVENT_TYPES:
+        return "event"
+    if element_type in GATEWAY_TYPES:
+        return "gateway"
+    return None
+
+def _order(elements: Dict[str, BPMNElement], flows: List[BPMNFlow], processes: Dict[str, List[str]]) -> List[BPMNElement]:
+    """
+    Order the elements pool by pool, breadth-first along the sequence flows of the pool.
+
+    Every pool is traversed from its start events first, then from its elements without an
+    incoming sequence flow; elements that are only reachable through cycles keep their
+    document order at the end of the pool.
+    """
+    incoming = {flow.target for flow in flows}
+
+    ordered = []
+    visited = set()
+
+    def traverse(starts: List[str]) -> None:
+        queue = deque(starts)
+        while queue:
+            element_id = queue.popleft()
+            if element_id in visited:
+                continue
+            visited.add(element_id)
+            ordered.append(elements[element_id])
+            queue.extend(target for target in elements[element_id].next if target not in visited)
+
+    for element_ids in processes.values():
+        traverse([element_id for element_id in element_ids if elements[element_id].type == "startEvent"])
+        traverse([element_id for element_id in element_ids if element_id not in incoming])
+        traverse(element_ids)
+
+    return ordered
+
+def parse_bpmn(source: Union[str, bytes, io.IOBase]) -> BPMNModel:
+    """
+    Parse a BPMN XML into a compact typed model.
+
+    Args:
+        source (str, bytes or file): The BPMN XML, or a binary file object to stream it from.
+
+    Returns:
+        BPMNModel: The tasks, events and gateways in sequence-flow order and the sequence flows.
+
+    Raises:
+        BPMNParseError: If the input is not well-formed XML.
+    """
+    if isinstance(source, str):
+        source = io.BytesIO(source.encode("utf-8"))
+    elif isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    elements: Dict[str, BPMNElement] = {}
+    flows: List[BPMNFlow] = []
+    messages: List[BPMNFlow] = []
+    lanes: Dict[str, str] = {}
+    # Participant ID and name of the pool by process ID, in the order of the collaboration
+    participants: Dict[str, Tuple[str, Optional[str]]] = {}
+    # IDs of the elements by process ID, in document order
+    processes: Dict[Optional[str], List[str]] = {}
+
+    stack = []
+    lane_names = []
+    process_id = None
+    # Open tasks, events and gateways with the depth of their start tag
+    open_elements = []
+
+    try:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            local_name = _local_name(elem.tag)
+
+            if event == "start":
+                stack.append(elem)
+                element_type = local_name if elem.tag.startswith(f"{{{BPMN_NAMESPACE}}}") else None
+                category = _category(element_type) if element_type else None
+
+                if category and elem.get("id"):
+                    element = BPMNElement(
+                        id=elem.get("id"),
+                        category=category,
+                        type=element_type,
+                        name=_text(elem.get("name")),
+                        description=_text(elem.get(f"{{{MATURITY_NAMESPACE}}}user_description")),
+                        maturity_level=_text(elem.get(f"{{{MATURITY_NAMESPACE}}}maturity_level")),
+                    )
+                    elements[element.id] = element
+                    processes.setdefault(process_id, []).append(element.id)
+                    open_elements.append((element, len(stack)))
+                elif element_type == "sequenceFlow":
+                    flows.append(BPMNFlow(
+                        source=elem.get("sourceRef"),
+                        target=elem.get("targetRef"),
+                        name=_text(elem.get("name")),
+                    ))
+                elif element_type == "messageFlow":
+                    messages.append(BPMNFlow(
+                        source=elem.get("sourceRef"),
+                        target=elem.get("targetRef"),
+                        name=_text(elem.get("name")),
+                    ))
+                elif element_type == "participant" and elem.get("id"):
+                    participants[elem.get("processRef")] = (elem.get("id"), _text(elem.get("name")))
+                elif element_type == "process":
+                    process_id = elem.get("id")
+                elif element_type == "lane":
+                    lane_names.append(_text(elem.get("name")))
+                continue
+
+            depth = len(stack)
+            stack.pop()
+            if open_elements and open_elements[-1][1] == depth:
+                open_elements.pop()
+            elif local_name == "documentation" and open_elements and open_elements[-1][1] == depth - 1:
+                open_elements[-1][0].documentation = _text(elem.text)
+            elif local_name == "flowNodeRef" and lane_names and lane_names[-1] and elem.text:
+                lanes[elem.text.strip()] = lane_names[-1]
+            elif local_name == "lane":
+                lane_names.pop()
+            elif local_name == "process":
+                process_id = None
+
+            # Release the processed subtree, only the open ancestors stay in memory
+            if stack:
+                stack[-1].clear()
+            else:
+                elem.clear()
+    except ET.ParseError as e:
+        raise BPMNParseError(f"Invalid BPMN XML: {e}") from e
+
+    flows = [flow for flow in flows if flow.source in elements and flow.target in elements]
+    for flow in flows:
+        elements[flow.source].next.append(flow.target)
+    for element_id, lane in lanes.items():
+        if element_id in elements:
+            elements[element_id].lane = lane
+
+    pools = {participant_id: name for participant_id, name in participants.values() if name}
+    for process, element_ids in processes.items():
+        pool = participants.get(process, (None, None))[1]
+        for element_id in element_ids:
+            elements[element_id].pool = pool
+    messages = [
+        message for message in messages
+        if (message.source in elements or message.source in pools)
+        and (message.target in elements or message.target in pools)
+    ]
+
+    # The pools in the order of the collaboration, then the processes without a participant
+    processes = {
+        **{process: processes[process] for process in participants if process in processes},
+        **processes
+    }
+    ordered = _order(elements, flows, processes)
+    positions = {element.id: index for index, element in enumerate(ordered)}
+    messages.sort(key=lambda message: positions.get(message.source, len(positions)))
+    return BPMNModel(elements=ordered, flows=flows, messages=messages, pools=pools)
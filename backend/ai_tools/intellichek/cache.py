@@ -0,0 +1,220 @@
+"""
+This module provides the content-addressed response cache for deterministic Intellichek
+chains.
+
+A chain is only cached when all of its chat models run with temperature 0. The cache key
+is the SHA-256 of the prompt templates, the model names and temperatures, the versions of
+the retriever indexes and all inputs of the chain (including the language), so a changed
+prompt, model or CHEK database never returns an outdated answer. Cache hits are returned
+with a cost of zero.
+
+The backend is selected with `config.LLM_CACHE_BACKEND`:
+
+- `memory`: A per-process LRU cache.
+- `database`: The `llm_response_cache` table, shared by all workers. The backend belongs to
+  the API layer (`api.utils.llm_cache`), which registers it with `register_backend` on startup.
+- `none`: Caching disabled.
+
+Both backends evict entries older than `config.LLM_CACHE_TTL_SECONDS` and keep at most
+`config.LLM_CACHE_MAX_ENTRIES` entries, dropping the least recently used ones first.
+
+- `call_fingerprint`: Returns the fingerprint of a chain call and whether the chain is deterministic.
+- `cache_key`: Returns the cache key of a chain call, or None if the chain is not cacheable.
+- `register_backend`: Registers a cache backend under a name.
+- `get_cache`: Returns the configured cache backend of the process.
+- `cache_stats`: Returns the hit and miss counters of the process.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple, Type
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+import config
+
+# Returned by `ResponseCache.get` when a key is not cached
+MISSING = object()
+
+def call_fingerprint(chain: Runnable, inputs: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+    """
+    Compute the content-addressed fingerprint of a chain call.
+
+    Identical calls, i.e. the same prompts, models, retriever indexes and inputs, have the
+    same fingerprint, whatever the temperature of their models.
+
+    Args:
+        chain (Runnable): The chain to invoke.
+        inputs (dict): The inputs of the chain.
+
+    Returns:
+        tuple: The hex digest of the call, or None if the chain cannot be fingerprinted, and
+        whether all chat models of the chain run with temperature 0.
+    """
+    try:
+        prompts = [prompt.pretty_repr() for prompt in chain.get_prompts()]
+        chat_models = []
+        retrievers = []
+        for node in chain.get_graph().nodes.values():
+            if isinstance(node.data, BaseChatModel):
+                temperature = getattr(node.data, "temperature", None)
+                chat_models.append([getattr(node.data, "model_name", type(node.data).__name__), temperature])
+            elif isinstance(node.data, BaseRetriever):
+                retrievers.append(sorted(node.data.tags or []))
+        if not chat_models:
+            return None, False
+
+        payload = json.dumps(
+            {"prompts": prompts, "models": chat_models, "retrievers": retrievers, "inputs": inputs},
+            sort_keys=True,
+            default=str
+        )
+    except Exception:
+        return None, False
+
+    deterministic = all(temperature == 0 for _, temperature in chat_models)
+    return hashlib.sha256(payload.encode()).hexdigest(), deterministic
+
+def cache_key(chain: Runnable, inputs: Dict[str, Any]) -> Optional[str]:
+    """
+    Compute the content-addressed cache key of a chain call.
+
+    Args:
+        chain (Runnable): The chain to invoke.
+        inputs (dict): The inputs of the chain.
+
+    Returns:
+        str or None: The fingerprint of the call, or None if the chain is not deterministic
+        or cannot be fingerprinted.
+    """
+    fingerprint, deterministic = call_fingerprint(chain, inputs)
+    return fingerprint if deterministic else None
+
+class ResponseCache:
+    """Base class of the cache backends, counting hits and misses. Caches nothing."""
+
+    name = "none"
+    # Whether get/set block on I/O and should run in a thread when called from async code
+    blocking = False
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Return the cached response for a key, or `MISSING`."""
+        value = self._get(key)
+        with self._stats_lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        """Store the response for a key."""
+        self._set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the hit and miss counters of this process."""
+        total = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.size(),
+        }
+
+    def _get(self, key: str) -> Any:
+        return MISSING
+
+    def _set(self, key: str, value: Any):
+        pass
+
+    def size(self) -> int:
+        return 0
+
+class MemoryResponseCache(ResponseCache):
+    """Per-process LRU cache with TTL."""
+
+    name = "memory"
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            created_at, value = entry
+            if datetime.utcnow() - created_at > timedelta(seconds=self.ttl_seconds):
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def _set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (datetime.utcnow(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+_BACKENDS: Dict[str, Type[ResponseCache]] = {
+    "none": ResponseCache,
+    "memory": MemoryResponseCache,
+}
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def register_backend(name: str, backend: Type[ResponseCache]) -> None:
+    """
+    Register a cache backend, e.g. one that stores the responses in the application database.
+
+    Backends must be registered before the first call of `get_cache`.
+
+    Args:
+        name (str): The name used in `config.LLM_CACHE_BACKEND`.
+        backend (type): The `ResponseCache` subclass, created with the TTL and the maximum entries.
+    """
+    _BACKENDS[name] = backend
+
+def get_cache() -> ResponseCache:
+    """
+    Return the response cache of the process, creating it on first use.
+
+    Returns:
+        ResponseCache: The backend selected by `config.LLM_CACHE_BACKEND`.
+
+    Raises:
+        ValueError: If the configured backend is unknown.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = _BACKENDS.get(config.LLM_CACHE_BACKEND)
+                if backend is None:
+                    raise ValueError(f"Unknown LLM cache backend: {config.LLM_CACHE_BACKEND}")
+                _cache = backend(config.LLM_CACHE_TTL_SECONDS, config.LLM_CACHE_MAX_ENTRIES)
+    return _cache
+
+def cache_stats() -> Dict[str, Any]:
+    """Return the hit and miss counters of the response cache of this process."""
+    return get_cache().stats()
@@ -0,0 +1,444 @@
+"""
+This module provides the shared helpers to run the Intellichek langchain chains while
+tracking the OpenAI cost of every call.
+
+Every function in the intellichek package builds its chain and hands it to one of these
+helpers, so that the sync and the async variant of a function behave the same way and
+cost tracking lives in one place.
+
+Calls of deterministic chains (temperature 0) go through the response cache of
+`ai_tools.intellichek.cache`; a cache hit skips the model and costs nothing.
+
+Every call is also reported to the usage tracker of the current context (set up per request
+by `api.utils.costs.LLMUsageMiddleware`), with the model and the prompt and completion
+tokens, so that the cost ledger records every call. Cache hits and identical calls that
+shared a call in flight are reported as calls without tokens and cost, so that the ledger
+shows how often the model was not needed.
+
+- `invoke_with_cost`: Runs a chain synchronously and returns the response and its cost.
+- `ainvoke_with_cost`: Runs a chain on the event loop and returns the response and its cost;
+  identical concurrent calls share one model call, which is recorded once.
+- `astream_with_cost`: Streams the output of a chain on the event loop and tracks its cost.
+- `with_stream_usage`: Makes a chat model report its token usage when streaming.
+- `track_usage`: Collects the model calls made within a context.
+- `single_flight_stats`: Returns the counters of the shared identical calls.
+"""
+
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from langchain.callbacks import get_openai_callback
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+import config
+from ai_tools.intellichek import cache
+
+logger = logging.getLogger(__name__)
+
+# Sources of the response of a call: the model, the response cache or an identical call in flight
+MODEL = "model"
+CACHE = "cache"
+SHARED = "shared"
+
+@dataclass
+class LLMCall:
+    """The usage of one call; only calls answered by the model have tokens and a cost."""
+    model: Optional[str]
+    prompt_tokens: int
+    completion_tokens: int
+    total_cost: float
+    source: str = MODEL
+
+class UsageTracker:
+    """
+    Collects the model calls of one request, including calls made in concurrent tasks, and the
+    user and project they are charged to, so that calls left in it can still be recorded.
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, user_id: Optional[int] = None, project_id: Optional[int] = None):
+        self.endpoint = endpoint
+        self.user_id = user_id
+        self.project_id = project_id
+        self._calls: List[LLMCall] = []
+        self._lock = threading.Lock()
+
+    def attribute(self, user_id: int, project_id: Optional[int] = None) -> None:
+        """Charge the calls to a user and, if given, a project."""
+        self.user_id = user_id
+        if project_id is not None:
+            self.project_id = project_id
+
+    def add(self, call: LLMCall) -> None:
+        with self._lock:
+            self._calls.append(call)
+
+    def drain(self) -> List[LLMCall]:
+        """Return the calls collected so far and forget them, so that they are recorded once."""
+        with self._lock:
+            calls, self._calls = self._calls, []
+        return calls
+
+_usage_tracker: ContextVar[Optional[UsageTracker]] = ContextVar("llm_usage_tracker", default=None)
+
+@contextmanager
+def track_usage(
+    endpoint: Optional[str] = None,
+    user_id: Optional[int] = None,
+    project_id: Optional[int] = None
+) -> Iterator[UsageTracker]:
+    """
+    Collect the model calls made within the context.
+
+    Tasks and threads started within the context share the tracker, because they inherit
+    the context.
+
+    Args:
+        endpoint (str, optional): The endpoint the calls are made for.
+        user_id (int, optional): The user the calls are charged to, if already known.
+        project_id (int, optional): The project the calls are made for, if already known.
+
+    Yields:
+        UsageTracker: The tracker collecting the calls.
+    """
+    tracker = UsageTracker(endpoint, user_id, project_id)
+    token = _usage_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _usage_tracker.reset(token)
+
+def current_usage_tracker() -> Optional[UsageTracker]:
+    """Return the usage tracker of the current context, or None."""
+    return _usage_tracker.get()
+
+def _model_name(chain: Runnable) -> Optional[str]:
+    try:
+        for node in chain.get_graph().nodes.values():
+            if isinstance(node.data, BaseChatModel):
+                return getattr(node.data, "model_name", type(node.data).__name__)
+    except Exception:
+        pass
+    return None
+
+def _track_call(chain: Runnable, cb, total_cost: float) -> None:
+    tracker = _usage_tracker.get()
+    if tracker is not None:
+        tracker.add(LLMCall(
+            model=_model_name(chain),
+            prompt_tokens=int(cb.prompt_tokens),
+            completion_tokens=int(cb.completion_tokens),
+            total_cost=total_cost
+        ))
+
+def _cache_get(response_cache: cache.ResponseCache, key: str) -> Any:
+    # A failing cache is bypassed, the call is made as if the response was not cached
+    try:
+        return response_cache.get(key)
+    except Exception:
+        logger.exception("LLM cache lookup failed")
+        return cache.MISSING
+
+def _cache_set(response_cache: cache.ResponseCache, key: str, response: Any) -> None:
+    try:
+        response_cache.set(key, response)
+    except Exception:
+        logger.exception("LLM cache write failed")
+
+def _track_reuse(model: Optional[str], source: str) -> None:
+    tracker = _usage_tracker.get()
+    if tracker is not None:
+        tracker.add(LLMCall(model=model, prompt_tokens=0, completion_tokens=0, total_cost=0.0, source=source))
+
+def invoke_with_cost(chain: Runnable, inputs: Dict[str, Any]) -> Tuple[Any, float]:
+    """
+    Invoke a chain and measure the cost of the OpenAI calls it makes.
+
+    Args:
+        chain (Runnable): The chain to invoke.
+        inputs (dict): The inputs of the chain.
+
+    Returns:
+        tuple: A tuple containing the response of the chain and the total cost of the API calls.
+    """
+    key = cache.cache_key(chain, inputs)
+    response_cache = cache.get_cache()
+    if key is not None:
+        response = _cache_get(response_cache, key)
+        if response is not cache.MISSING:
+            _track_reuse(_model_name(chain), CACHE)
+            return response, 0.0
+
+    with get_openai_callback() as cb:
+        response = chain.invoke(inputs)
+        total_cost = float(cb.total_cost)
+    _track_call(chain, cb, total_cost)
+
+    if key is not None:
+        _cache_set(response_cache, key, response)
+
+    return response, total_cost
+
+# Interval in which a worker waiting for the call of another worker checks the advisory lock
+WORKER_LOCK_POLL_SECONDS = 0.25
+
+class _Flight:
+    """A call in flight in this process and the identical calls awaiting it."""
+
+    def __init__(self, fingerprint: str, task: "asyncio.Task[Tuple[Any, float, List[LLMCall]]]"):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.waiters = 0
+        self.claimed = False
+        task.add_done_callback(lambda _: self.forget())
+
+    def forget(self) -> None:
+        if _in_flight.get(self.fingerprint) is self:
+            del _in_flight[self.fingerprint]
+
+    async def wait(self) -> Tuple[Any, float]:
+        """
+        Await the response of the call.
+
+        The first caller that receives the response is charged with the call: its usage is
+        reported to the caller's tracker and the cost returned, the other callers get a cost of
+        zero and report a shared call without tokens. So the call is recorded once, also if the
+        caller that started it was cancelled.
+        If every caller is cancelled, the call is cancelled as an unshared call would be.
+        """
+        self.waiters += 1
+        try:
+            response, total_cost, calls = await asyncio.shield(self.task)
+        except asyncio.CancelledError:
+            if self.waiters == 1 and not self.task.done():
+                self.forget()
+                self.task.cancel()
+            raise
+        finally:
+            self.waiters -= 1
+
+        if self.claimed:
+            for call in calls:
+                _track_reuse(call.model, SHARED)
+            return response, 0.0
+        self.claimed = True
+        tracker = _usage_tracker.get()
+        if tracker is not None:
+            for call in calls:
+                tracker.add(call)
+        return response, total_cost
+
+# Calls in flight in this process by fingerprint; identical concurrent calls await the same task
+_in_flight: Dict[str, _Flight] = {}
+_single_flight_counters = {"calls": 0, "shared": 0}
+# Advisory locks of this process that are held or being acquired, at most one per lock connection
+_worker_locks = 0
+# Engine of the connections the advisory locks are held on, set by the application on startup
+_lock_engine: Optional[AsyncEngine] = None
+
+def set_lock_engine(engine: Optional[AsyncEngine]) -> None:
+    """
+    Set the engine whose connections hold the advisory locks of `LLM_SINGLE_FLIGHT_ACROSS_WORKERS`.
+
+    Without an engine, identical calls are only shared within the process.
+
+    Args:
+        engine (AsyncEngine): A small pool separate from the request pool, or None.
+    """
+    global _lock_engine
+    _lock_engine = engine
+
+def single_flight_stats() -> Dict[str, int]:
+    """Return the number of model calls made and of identical calls that shared one, in this process."""
+    return {**_single_flight_counters, "in_flight": len(_in_flight)}
+
+def _advisory_lock_id(fingerprint: str) -> int:
+    return int.from_bytes(bytes.fromhex(fingerprint[:16]), "big", signed=True)
+
+@asynccontextmanager
+async def _worker_lock(fingerprint: str) -> AsyncIterator[bool]:
+    """
+    Hold a Postgres advisory lock on the fingerprint, so that one worker process at a time makes the call.
+
+    The lock is held on a connection of the engine set with `set_lock_engine`, never of the request
+    pool. While another worker holds the lock, this one polls with `pg_try_advisory_lock` and holds
+    no connection in between. Yields False, without a lock, if no engine is set or all lock
+    connections of this process are in use.
+    """
+    global _worker_locks
+    if _lock_engine is None or _worker_locks >= config.LLM_SINGLE_FLIGHT_LOCK_CONNECTIONS:
+        yield False
+        return
+
+    _worker_locks += 1
+    try:
+        lock_id = _advisory_lock_id(fingerprint)
+        while True:
+            connection = await _lock_engine.connect()
+            try:
+                locked = await connection.scalar(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": lock_id})
+            except BaseException:
+                await connection.close()
+                raise
+            if locked:
+                break
+            await connection.close()
+            await asyncio.sleep(WORKER_LOCK_POLL_SECONDS)
+
+        try:
+            yield True
+        finally:
+            try:
+                await connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": lock_id})
+            finally:
+                await connection.close()
+    finally:
+        _worker_locks -= 1
+
+async def _acache_get(response_cache: cache.ResponseCache, key: str) -> Any:
+    if response_cache.blocking:
+        return await asyncio.to_thread(_cache_get, response_cache, key)
+    return _cache_get(response_cache, key)
+
+async def _acache_set(response_cache: cache.ResponseCache, key: str, response: Any) -> None:
+    if response_cache.blocking:
+        await asyncio.to_thread(_cache_set, response_cache, key, response)
+    else:
+        _cache_set(response_cache, key, response)
+
+async def _ainvoke(chain: Runnable, inputs: Dict[str, Any], key: Optional[str]) -> Tuple[Any, float]:
+    response_cache = cache.get_cache()
+    shared_cache = key is not None and response_cache.name == "database"
+    if config.LLM_SINGLE_FLIGHT_ACROSS_WORKERS and shared_cache:
+        async with _worker_lock(key) as locked:
+            if locked:
+                # Another worker may have made the call while this one waited for the lock
+                response = await _acache_get(response_cache, key)
+                if response is not cache.MISSING:
+                    _track_reuse(_model_name(chain), CACHE)
+                    return response, 0.0
+            return await _ainvoke_model(chain, inputs, key, response_cache)
+    return await _ainvoke_model(chain, inputs, key, response_cache)
+
+async def _ainvoke_model(
+    chain: Runnable,
+    inputs: Dict[str, Any],
+    key: Optional[str],
+    response_cache: cache.ResponseCache
+) -> Tuple[Any, float]:
+    _single_flight_counters["calls"] += 1
+    with get_openai_callback() as cb:
+        response = await chain.ainvoke(inputs)
+        total_cost = float(cb.total_cost)
+    _track_call(chain, cb, total_cost)
+
+    if key is not None:
+        await _acache_set(response_cache, key, response)
+
+    return response, total_cost
+
+async def _flight_call(chain: Runnable, inputs: Dict[str, Any], key: Optional[str]) -> Tuple[Any, float, List[LLMCall]]:
+    # The usage is collected here and reported by the caller that is charged with the call
+    with track_usage() as tracker:
+        response, total_cost = await _ainvoke(chain, inputs, key)
+    return response, total_cost, tracker.drain()
+
+async def ainvoke_with_cost(chain: Runnable, inputs: Dict[str, Any]) -> Tuple[Any, float]:
+    """
+    Asynchronously invoke a chain and measure the cost of the OpenAI calls it makes.
+
+    The call does not block the event loop and does not occupy a threadpool thread
+    while waiting for the model.
+
+    Identical concurrent calls (same prompts, models and inputs, see `cache.call_fingerprint`)
+    are made once: while a call is in flight, the others await its response. The first caller
+    that receives it is charged with the call, the others get a cost of zero, so that the call
+    is recorded once in the cost ledger, also if the caller that started it disconnected. With
+    `LLM_SINGLE_FLIGHT_ACROSS_WORKERS` and the `database` response cache, worker processes
+    also wait for an identical deterministic call of another worker and read its response
+    from the cache.
+
+    Args:
+        chain (Runnable): The chain to invoke.
+        inputs (dict): The inputs of the chain.
+
+    Returns:
+        tuple: A tuple containing the response of the chain and the total cost of the API calls.
+    """
+    fingerprint, deterministic = cache.call_fingerprint(chain, inputs)
+    key = fingerprint if deterministic else None
+    if key is not None:
+        response = await _acache_get(cache.get_cache(), key)
+        if response is not cache.MISSING:
+            _track_reuse(_model_name(chain), CACHE)
+            return response, 0.0
+
+    if fingerprint is None:
+        return await _ainvoke(chain, inputs, key)
+
+    flight = _in_flight.get(fingerprint)
+    if flight is not None:
+        _single_flight_counters["shared"] += 1
+        return await flight.wait()
+
+    # The call runs in its own task, so that a cancelled caller does not fail the callers awaiting it
+    flight = _Flight(fingerprint, asyncio.ensure_future(_flight_call(chain, inputs, key)))
+    _in_flight[fingerprint] = flight
+    return await flight.wait()
+
+def with_stream_usage(model: BaseChatModel) -> Runnable:
+    """
+    Return the model configured to report its token usage at the end of a stream.
+
+    OpenAI only reports the usage of a streamed response on request; without it the
+    streamed calls would be recorded without tokens and cost.
+
+    Args:
+        model (BaseChatModel): The chat model.
+
+    Returns:
+        Runnable: The model bound to `stream_usage=True`.
+    """
+    return model.bind(stream_usage=True)
+
+async def astream_with_cost(chain: Runnable, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Asynchronously stream the output of a chain and measure the cost of the OpenAI calls it makes.
+
+    The chunks are yielded as the model produces them. The call is reported to the usage
+    tracker when the stream ends, also if the client disconnects before, and the complete
+    response is cached like in `ainvoke_with_cost`. A cached response is yielded as one chunk.
+    The chat models of the chain should be configured with `with_stream_usage`.
+
+    Args:
+        chain (Runnable): The chain to stream, ending with a string output parser.
+        inputs (dict): The inputs of the chain.
+
+    Yields:
+        str: The chunks of the response.
+    """
+    key = cache.cache_key(chain, inputs)
+    response_cache = cache.get_cache()
+    if key is not None:
+        response = await _acache_get(response_cache, key)
+        if response is not cache.MISSING:
+            _track_reuse(_model_name(chain), CACHE)
+            yield response
+            return
+
+    chunks: List[str] = []
+    with get_openai_callback() as cb:
+        try:
+            async for chunk in chain.astream(inputs):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            _track_call(chain, cb, float(cb.total_cost))
+
+    if key is not None:
+        await _acache_set(response_cache, key, "".join(chunks))
@@ -15,54 +15,20 @@ Date: 23.07.2024
 """
 
 from operator import itemgetter
-from langchain.document_loaders import TextLoader
 from langchain.chat_models import ChatOpenAI
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.callbacks import get_openai_callback
 from langchain.prompts import ChatPromptTemplate
-from langchain.vectorstores import FAISS
 from langchain_core.output_parsers import StrOutputParser
-import config
 from langchain.output_parsers.json import SimpleJsonOutputParser
 from typing import Union, List
 from pydantic import BaseModel
-
-path_to_maturity="./ai_tools/chek_database/maturity.txt"
-loader = TextLoader(path_to_maturity)
-data = loader.load()
-
-embeddings_model = OpenAIEmbeddings(
-    openai_api_key=config.OPENAI_API_KEY, 
-    model="text-embedding-3-large"
-    )
-
-vectorstore = FAISS.from_documents(
-    data, 
-    embedding=embeddings_model
-    )
-
-retriever = vectorstore.as_retriever()
+from ai_tools.intellichek.providers import get_retriever, aget_retriever
+from ai_tools.intellichek.chains import invoke_with_cost, ainvoke_with_cost
 
 class CustomObject(BaseModel):
     status: str
     actions: Union[str, List[str]]
     
-def chat_with_maturity_intro(
-    action: str, 
-    language: str,
-    model: ChatOpenAI) -> str:
-    """
-    Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
-
-    Args:
-        action (str): The input action for the chat.
-        language (str): The language for the response.
-        model (ChatOpenAI): The ChatOpenAI model for generating responses.
-
-    Returns:
-        tuple: A tuple containing the generated response and the total cost of the API call.
-    """
-  
+def _chat_with_maturity_intro_chain(model: ChatOpenAI):
     template = """
     You are an AI assisstant that should evaluate a building permit process according to a maturity model.
 
@@ -94,31 +60,45 @@ def chat_with_maturity_intro(
         | StrOutputParser()
     )
 
-    with get_openai_callback() as cb:
-        response = chain.invoke({"action": action, "language": language})
-        total_cost = float(cb.total_cost)
-        
-    return response, total_cost
+    return chain
 
-def evaluate_level_of_maturity_with_chat(
-    action: str,
-    inputs: str,
-    language: str, 
-    model: ChatOpenAI
-    ) -> str:
+def chat_with_maturity_intro(
+    action: str, 
+    language: str,
+    model: ChatOpenAI) -> str:
     """
     Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
 
     Args:
         action (str): The input action for the chat.
-        inputs (str): The input question or statement for the chat.
         language (str): The language for the response.
         model (ChatOpenAI): The ChatOpenAI model for generating responses.
 
     Returns:
         tuple: A tuple containing the generated response and the total cost of the API call.
     """
-  
+    chain = _chat_with_maturity_intro_chain(model)
+    return invoke_with_cost(chain, {"action": action, "language": language})
+
+async def achat_with_maturity_intro(
+    action: str, 
+    language: str,
+    model: ChatOpenAI) -> str:
+    """
+    Asynchronously perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        action (str): The input action for the chat.
+        language (str): The language for the response.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _chat_with_maturity_intro_chain(model)
+    return await ainvoke_with_cost(chain, {"action": action, "language": language})
+
+def _evaluate_level_of_maturity_with_chat_chain(model: ChatOpenAI, retriever):
     template = """Answer the question based only on the following context:
     {context}
 
@@ -168,14 +148,10 @@ def evaluate_level_of_maturity_with_chat(
         | SimpleJsonOutputParser()
     )
 
-    with get_openai_callback() as cb:
-        response = chain.invoke({"action": action, "question": inputs, "language": language, "history": 'conversation_log'})
-        total_cost = float(cb.total_cost)
- 
-    return response, total_cost
+    return chain
 
-def evaluate_level_of_maturity_with_chat_final(
-    action: str, 
+def evaluate_level_of_maturity_with_chat(
+    action: str,
     inputs: str,
     language: str, 
     model: ChatOpenAI
@@ -192,6 +168,31 @@ def evaluate_level_of_maturity_with_chat_final(
     Returns:
         tuple: A tuple containing the generated response and the total cost of the API call.
     """
+    chain = _evaluate_level_of_maturity_with_chat_chain(model, get_retriever("maturity"))
+    return invoke_with_cost(chain, {"action": action, "question": inputs, "language": language, "history": 'conversation_log'})
+
+async def aevaluate_level_of_maturity_with_chat(
+    action: str,
+    inputs: str,
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Asynchronously perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        action (str): The input action for the chat.
+        inputs (str): The input question or statement for the chat.
+        language (str): The language for the response.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _evaluate_level_of_maturity_with_chat_chain(model, await aget_retriever("maturity"))
+    return await ainvoke_with_cost(chain, {"action": action, "question": inputs, "language": language, "history": 'conversation_log'})
+
+def _evaluate_level_of_maturity_with_chat_final_chain(model: ChatOpenAI, retriever):
     template = """Answer the question based only on the following context:
     {context}
 
@@ -240,15 +241,11 @@ def evaluate_level_of_maturity_with_chat_final(
         | SimpleJsonOutputParser() #StrOutputParser()
     )
 
-    with get_openai_callback() as cb:
-        response = chain.invoke({"action": action, "question": inputs, "language": language})
-        total_cost = float(cb.total_cost)
-
-    return response, total_cost
+    return chain
 
-def evaluate_level_of_maturity_pre(
-    action: str,
-    inputs: str, 
+def evaluate_level_of_maturity_with_chat_final(
+    action: str, 
+    inputs: str,
     language: str, 
     model: ChatOpenAI
     ) -> str:
@@ -264,6 +261,31 @@ def evaluate_level_of_maturity_pre(
     Returns:
         tuple: A tuple containing the generated response and the total cost of the API call.
     """
+    chain = _evaluate_level_of_maturity_with_chat_final_chain(model, get_retriever("maturity"))
+    return invoke_with_cost(chain, {"action": action, "question": inputs, "language": language})
+
+async def aevaluate_level_of_maturity_with_chat_final(
+    action: str, 
+    inputs: str,
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Asynchronously perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        action (str): The input action for the chat.
+        inputs (str): The input question or statement for the chat.
+        language (str): The language for the response.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _evaluate_level_of_maturity_with_chat_final_chain(model, await aget_retriever("maturity"))
+    return await ainvoke_with_cost(chain, {"action": action, "question": inputs, "language": language})
+
+def _evaluate_level_of_maturity_pre_chain(model: ChatOpenAI):
     template = """
 
     The user will provide you with an action: {action}.
@@ -308,8 +330,46 @@ def evaluate_level_of_maturity_pre(
         | SimpleJsonOutputParser()
     )
 
-    with get_openai_callback() as cb:
-        response = chain.invoke({"action": action, "evaluated_description": inputs, "language": language})
-        total_cost = float(cb.total_cost)
- 
-    return response, total_cost
\ No newline at end of file
+    return chain
+
+def evaluate_level_of_maturity_pre(
+    action: str,
+    inputs: str, 
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        action (str): The input action for the chat.
+        inputs (str): The input question or statement for the chat.
+        language (str): The language for the response.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _evaluate_level_of_maturity_pre_chain(model)
+    return invoke_with_cost(chain, {"action": action, "evaluated_description": inputs, "language": language})
+
+async def aevaluate_level_of_maturity_pre(
+    action: str,
+    inputs: str, 
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Asynchronously perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        action (str): The input action for the chat.
+        inputs (str): The input question or statement for the chat.
+        language (str): The language for the response.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _evaluate_level_of_maturity_pre_chain(model)
+    return await ainvoke_with_cost(chain, {"action": action, "evaluated_description": inputs, "language": language})
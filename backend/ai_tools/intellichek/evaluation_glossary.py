@@ -12,48 +12,14 @@ Date: 23.07.2024
 """
 
 from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import TextLoader
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.callbacks import get_openai_callback
 from langchain.prompts import ChatPromptTemplate
-from langchain.vectorstores import FAISS
 from langchain_core.output_parsers import StrOutputParser
 from langchain.output_parsers.json import SimpleJsonOutputParser
 from operator import itemgetter
-import config
+from ai_tools.intellichek.providers import get_retriever, aget_retriever
+from ai_tools.intellichek.chains import invoke_with_cost, ainvoke_with_cost
 
-path_to_glossary = "./ai_tools/chek_database/glossary.txt"
-loader = TextLoader(path_to_glossary)
-data = loader.load()
-
-embeddings_model = OpenAIEmbeddings(
-    openai_api_key=config.OPENAI_API_KEY,
-    model=config.EMBEDDING_MODEL
-    )
-
-vectorstore = FAISS.from_documents(
-    data, 
-    embedding=embeddings_model
-    )
-
-retriever = vectorstore.as_retriever()
-
-def get_glossary_task(
-    inputs: str, 
-    language: str,
-    model: ChatOpenAI
-    ) -> str:
-    """
-    Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
-
-    Args:
-        inputs (str): The input question or statement for the chat.
-        model (ChatOpenAI): The ChatOpenAI model for generating responses.
-
-    Returns:
-        tuple: A tuple containing the generated response and the total cost of the API call.
-    """
-  
+def _get_glossary_task_chain(model: ChatOpenAI, retriever):
     template = """Answer the question based only on the following context:
     {context}
 
@@ -94,17 +60,11 @@ def get_glossary_task(
      
     )
 
-    with get_openai_callback() as cb:
-        response = chain.invoke({"question": inputs, "language": language})
-        total_cost = float(cb.total_cost)
-    print(cb)
-   
-    return response, total_cost
+    return chain
 
-def transform_user_process_description(
+def get_glossary_task(
     inputs: str, 
-    glossary: str, 
-    language: str, 
+    language: str,
     model: ChatOpenAI
     ) -> str:
     """
@@ -117,7 +77,28 @@ def transform_user_process_description(
     Returns:
         tuple: A tuple containing the generated response and the total cost of the API call.
     """
-    
+    chain = _get_glossary_task_chain(model, get_retriever("glossary"))
+    return invoke_with_cost(chain, {"question": inputs, "language": language})
+
+async def aget_glossary_task(
+    inputs: str, 
+    language: str,
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Asynchronously perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        inputs (str): The input question or statement for the chat.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _get_glossary_task_chain(model, await aget_retriever("glossary"))
+    return await ainvoke_with_cost(chain, {"question": inputs, "language": language})
+
+def _transform_user_process_description_chain(model: ChatOpenAI):
     template = """
     The user provides a description of a building permit process.
 
@@ -163,8 +144,42 @@ def transform_user_process_description(
         | StrOutputParser()
     )
 
-    with get_openai_callback() as cb:
-        response = chain.invoke({"input": inputs, "glossary": glossary, "language": language})
-        total_cost = float(cb.total_cost)
-        
-    return response, total_cost
+    return chain
+
+def transform_user_process_description(
+    inputs: str, 
+    glossary: str, 
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        inputs (str): The input question or statement for the chat.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _transform_user_process_description_chain(model)
+    return invoke_with_cost(chain, {"input": inputs, "glossary": glossary, "language": language})
+
+async def atransform_user_process_description(
+    inputs: str, 
+    glossary: str, 
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Asynchronously perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    Args:
+        inputs (str): The input question or statement for the chat.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API call.
+    """
+    chain = _transform_user_process_description_chain(model)
+    return await ainvoke_with_cost(chain, {"input": inputs, "glossary": glossary, "language": language})
@@ -16,31 +16,12 @@ Date: 23.07.2024
 """
 
 from operator import itemgetter
-from langchain.document_loaders import TextLoader
 from langchain.chat_models import ChatOpenAI
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.callbacks import get_openai_callback
 from langchain.prompts import ChatPromptTemplate
-from langchain.vectorstores import FAISS
-import config
 from langchain.output_parsers import PydanticOutputParser
 from langchain.output_parsers.json import SimpleJsonOutputParser
-
-path_to_maturity_orga="./ai_tools/chek_database/maturity_organisation.txt"
-loader = TextLoader(path_to_maturity_orga)
-data = loader.load()
-
-embeddings_model = OpenAIEmbeddings(
-    openai_api_key=config.OPENAI_API_KEY,
-    model="text-embedding-3-large"
-    )
-
-vectorstore = FAISS.from_documents(
-    data, 
-    embedding=embeddings_model
-    )
-
-retriever = vectorstore.as_retriever()
+from ai_tools.intellichek.chains import ainvoke_with_cost
+from ai_tools.intellichek.providers import aget_retriever
 
 async def evaluate_organisation(
     inputs: str, 
@@ -98,7 +79,7 @@ async def evaluate_organisation(
 
     chain = (
         {
-            "context": itemgetter("description") | retriever,
+            "context": itemgetter("description") | await aget_retriever("maturity_organisation"),
             "description": itemgetter("description"),
             "language": itemgetter("language")
         }
@@ -107,11 +88,4 @@ async def evaluate_organisation(
         | SimpleJsonOutputParser()
     )
 
-    with get_openai_callback() as cb:
-        response = await chain.ainvoke({ "description": inputs, "language": language})
-        total_cost = float(cb.total_cost)
-    
-
-    return response, total_cost
-
-
+    return await ainvoke_with_cost(chain, { "description": inputs, "language": language})
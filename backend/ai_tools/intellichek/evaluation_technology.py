@@ -19,11 +19,11 @@ from operator import itemgetter
 from langchain.document_loaders import TextLoader
 from langchain.chat_models import ChatOpenAI
 from langchain.embeddings import OpenAIEmbeddings
-from langchain.callbacks import get_openai_callback
 from langchain.prompts import ChatPromptTemplate
 from langchain.vectorstores import FAISS
 import config
 from langchain.output_parsers.json import SimpleJsonOutputParser
+from ai_tools.intellichek.chains import ainvoke_with_cost
 
 path_to_maturity_tech = "./ai_tools/chek_database/maturity_technology.txt"
 with open(path_to_maturity_tech, 'r') as file:
@@ -91,10 +91,4 @@ async def evaluate_technology(
         | SimpleJsonOutputParser() 
     )
 
-    with get_openai_callback() as cb:
-        response = await chain.ainvoke({ "input": inputs, "language": language, "context":maturity_tech_content})
-        total_cost = float(cb.total_cost)
-
-    return response, total_cost
-
-
+    return await ainvoke_with_cost(chain, { "input": inputs, "language": language, "context":maturity_tech_content})
@@ -6,48 +6,37 @@ Utilizing the langchain library, Intellichek offers expertise in this domain, pr
 smooth and informed assistance.
 The module includes a function to facilitate AI chat interactions with users, specifying
 responses in the user's chosen language, and extracts tasks, events, and gateways from 
-provided BPMN XML snippets.
+the compact rendering of a BPMN process map produced by `bpmn_parser`.
 
 The primary function, `extraction_process`, performs asynchronous evaluations of user 
-inputs, extracting and describing tasks, events, and gateways based on the given BPMN 
-XML snippet and providing justifications for each extraction.
+inputs, extracting and describing tasks, events, and gateways based on the given process
+map and providing justifications for each extraction. Process maps above the token budget
+are split into parts by `token_budget`; `estimate_extraction_process` returns the token
+estimate of the calls before they are made.
 
 Author: Elias Niederwieser
 Date: 23.07.2024
 """
 
 from operator import itemgetter
+from typing import Any, Dict
 from langchain.chat_models import ChatOpenAI
-from langchain.callbacks import get_openai_callback
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from ai_tools.intellichek.token_budget import amap_chunks, chunk_inputs, estimate_tokens, model_name_of
 
-async def extraction_process(
-    string: str, 
-    language: str, 
-    model: ChatOpenAI
-    ) -> str:
-    """
-    Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
-
-    Args:
-        action (str): The input action for the chat.
-        language (str): The language for the response.
-        model (ChatOpenAI): The ChatOpenAI model for generating responses.
-
-    Returns:
-        tuple: A tuple containing the generated response and the total cost of the API call.
-    """
-    
+def _extraction_chain(model: ChatOpenAI):
     template = """
     You are a BPMN interpreter for building permits in the European Union.
 
-    The user will provide you with a portion of the XML from a BPMN file describing a building permit process:
+    The user will provide you with the tasks, events, and gateways of a BPMN process map describing 
+    a building permit process, one per line in the order of the sequence flows of every pool, followed by
+    the message flows between the pools. The pool and lane of an element name the party that performs it:
     
     {string}
 
     Based on this, extract all tasks, events, and gateways. 
-    For each, provide the corresponding DESCRIPTION that you find in the XML File. 
+    For each, provide the corresponding DESCRIPTION that you find in the process map. 
     
     Format your response as follows: 
    
@@ -72,10 +61,41 @@ async def extraction_process(
         | model
         | StrOutputParser()
     )
+    return chain
 
-    with get_openai_callback() as cb:
-        response = await chain.ainvoke({"string": string, "language": language})
-        total_cost = float(cb.total_cost)
-   
-    return response, total_cost
+async def extraction_process(
+    string: str, 
+    language: str, 
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+
+    A process map whose prompt exceeds `config.LLM_INPUT_TOKEN_BUDGET` tokens is split into parts
+    that are extracted concurrently; the extractions are joined in sequence-flow order.
 
+    Args:
+        string (str): The compact rendering of the process map.
+        language (str): The language for the response.
+        model (ChatOpenAI): The ChatOpenAI model for generating responses.
+
+    Returns:
+        tuple: A tuple containing the generated response and the total cost of the API calls.
+    """
+    chain = _extraction_chain(model)
+    return await amap_chunks(chain, chunk_inputs(chain, string, model, language=language))
+
+def estimate_extraction_process(string: str, language: str, model: ChatOpenAI) -> Dict[str, Any]:
+    """
+    Estimate the prompt tokens and cost of `extraction_process` without calling the model.
+
+    Args:
+        string (str): The compact rendering of the process map.
+        language (str): The language for the response.
+        model (ChatOpenAI): The ChatOpenAI model whose tokenizer and prices are used.
+
+    Returns:
+        dict: The token estimate of `token_budget.estimate_tokens`.
+    """
+    chain = _extraction_chain(model)
+    return estimate_tokens(chain, chunk_inputs(chain, string, model, language=language), model_name_of(model))
@@ -7,10 +7,10 @@ that outlines the bot's behavior and responses.
 Author: Elias Niederwieser
 Date: 23.07.2024
 """
-from langchain.callbacks import get_openai_callback
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from typing import Dict
+from ai_tools.intellichek.chains import invoke_with_cost, ainvoke_with_cost
 
 SYSTEM_PROMPT = (
 """
@@ -38,6 +38,14 @@ SYSTEM_PROMPT = (
 """)
 
 
+def _introduction_chain(model: ChatOpenAI):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        ("human", "{input}"),
+    ])
+
+    return prompt | model
+
 def chat_introduction(
     inputs: str,
     model: ChatOpenAI
@@ -53,22 +61,33 @@ def chat_introduction(
     str: The model's response to the user input.
     """
     try:
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", SYSTEM_PROMPT),
-            ("human", "{input}"),
-        ])
+        inputs_dict: Dict[str, str] = {"input": inputs}
+        response, total_cost = invoke_with_cost(_introduction_chain(model), inputs_dict)
 
-        chain = (
-            prompt | model
-        )
+        return response.content, total_cost
+    except Exception as e:
+        print(f"Error in chat_with_user: {str(e)}")
+        raise  
 
-        inputs_dict: Dict[str, str] = {"input": inputs}
+async def achat_introduction(
+    inputs: str,
+    model: ChatOpenAI
+    ) -> str:
+    """
+    Asynchronously chat with the user using the specified model.
+
+    Parameters:
+    - inputs (str): User input for the conversation.
+    - model (ChatOpenAi): The chat model to be used.
 
-        with get_openai_callback() as cb:
-            response = chain.invoke(inputs_dict)
-            total_cost = float(cb.total_cost)
+    Returns:
+    str: The model's response to the user input.
+    """
+    try:
+        inputs_dict: Dict[str, str] = {"input": inputs}
+        response, total_cost = await ainvoke_with_cost(_introduction_chain(model), inputs_dict)
 
         return response.content, total_cost
     except Exception as e:
         print(f"Error in chat_with_user: {str(e)}")
-        raise  
\ No newline at end of file
+        raise  
@@ -0,0 +1,114 @@
+"""
+This module provides the shared, per-process registry of the models and retrievers used
+by Intellichek.
+
+Nothing is created at import time. Chat models and retrievers are built on first use and
+then shared by all requests of the worker. The async accessors serialise the first build
+behind an asyncio lock and run blocking work (loading or embedding a FAISS index) in a
+thread, so concurrent requests wait on the event loop instead of building twice.
+
+- `get_chat_model` / `aget_chat_model`: The configured ChatOpenAI model.
+- `get_retriever` / `aget_retriever`: The retriever of a CHEK database index.
+- `warm_up`: Builds everything up front, e.g. as an optional startup hook.
+"""
+
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+from langchain.chat_models import ChatOpenAI
+import config
+from ai_tools.intellichek import vectorstore
+
+_chat_models: Dict[Tuple[str, float], ChatOpenAI] = {}
+_chat_models_lock = threading.Lock()
+_retrievers: Dict[str, object] = {}
+_async_locks: Dict[str, asyncio.Lock] = {}
+
+def _async_lock(key: str) -> asyncio.Lock:
+    lock = _async_locks.get(key)
+    if lock is None:
+        lock = _async_locks.setdefault(key, asyncio.Lock())
+    return lock
+
+def get_chat_model(
+    model_name: Optional[str] = None,
+    temperature: Optional[float] = None
+    ) -> ChatOpenAI:
+    """
+    Return the shared ChatOpenAI model, creating it on first use.
+
+    Args:
+        model_name (str, optional): Name of the GPT model. Defaults to `config.GPT_MODEL`.
+        temperature (float, optional): Sampling temperature. Defaults to `config.TEMPERATURE`.
+
+    Returns:
+        ChatOpenAI: The chat model.
+
+    Raises:
+        ValueError: If no OpenAI API key is configured.
+    """
+    key = (model_name or config.GPT_MODEL, float(config.TEMPERATURE if temperature is None else temperature))
+
+    model = _chat_models.get(key)
+    if model is not None:
+        return model
+
+    if not config.OPENAI_API_KEY:
+        raise ValueError("OpenAI API key not found in environment variables.")
+
+    with _chat_models_lock:
+        if key not in _chat_models:
+            _chat_models[key] = ChatOpenAI(model=key[0], temperature=key[1])
+        return _chat_models[key]
+
+async def aget_chat_model() -> ChatOpenAI:
+    """
+    Return the configured ChatOpenAI model without blocking the event loop.
+
+    Usable as a FastAPI dependency.
+
+    Returns:
+        ChatOpenAI: The chat model.
+    """
+    return get_chat_model()
+
+def get_retriever(name: str):
+    """
+    Return the retriever of a CHEK database index, loading or building it on first use.
+
+    Args:
+        name (str): Key of the index in `vectorstore.INDEX_SOURCES`.
+
+    Returns:
+        VectorStoreRetriever: The retriever of the index.
+    """
+    return vectorstore.get_retriever(name)
+
+async def aget_retriever(name: str):
+    """
+    Return the retriever of a CHEK database index without blocking the event loop.
+
+    The first call per index and process loads (or builds) it in a worker thread while
+    holding an asyncio lock; concurrent callers await that build.
+
+    Args:
+        name (str): Key of the index in `vectorstore.INDEX_SOURCES`.
+
+    Returns:
+        VectorStoreRetriever: The retriever of the index.
+    """
+    retriever = _retrievers.get(name)
+    if retriever is not None:
+        return retriever
+
+    async with _async_lock(f"retriever:{name}"):
+        if name not in _retrievers:
+            _retrievers[name] = await asyncio.to_thread(vectorstore.get_retriever, name)
+        return _retrievers[name]
+
+async def warm_up():
+    """Build the chat model and all retrievers of this process ahead of the first request."""
+    await aget_chat_model()
+    for name in vectorstore.INDEX_SOURCES:
+        await aget_retriever(name)
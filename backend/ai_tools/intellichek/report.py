@@ -1,71 +1,40 @@
 from operator import itemgetter
-from typing import  Tuple
+from typing import  Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from langchain.chat_models import ChatOpenAI
-from langchain.callbacks import get_openai_callback
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
+from ai_tools.intellichek import cache
+from ai_tools.intellichek.chains import invoke_with_cost, ainvoke_with_cost, astream_with_cost, with_stream_usage
+from ai_tools.intellichek.token_budget import amap_chunks, chunk_inputs, estimate_tokens, map_chunks, model_name_of
 
-def generate_building_permit_report(
-    string: str, 
-    language: str,
-    model: ChatOpenAI
-    ) -> Tuple[str, float]:
-    """
-    Generate a detailed description of a building permit process in the European Union based on the 
-    provided BPMN XML string.
-    
-    The function interacts with a ChatOpenAI model to create a comprehensive report on the process. 
-    The conversation history is updated during the chat.
-
-    Args:
-        string (str): A portion of the XML from a BPMN file describing a building permit process.
-        language (str): The desired language for the generated report.
-        model (ChatOpenAI): The ChatOpenAI model instance to generate responses.
-
-    Returns:
-        Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
-    """
-    
+def _building_permit_summary_chain(model: ChatOpenAI):
     template_summary = """
     You are an expert BPMN interpreter specializing in building permits within the European Union.
 
-    The user provides you with a segment of an XML from a BPMN file, describing a building permit process: {string}.
-    Based on this input, elaborate on the entire process in detail. Use a list and differentiate between the applicants.
+    The user provides you with the tasks, events, and gateways of a BPMN process map, describing a building permit process, 
+    one per line in the order of the sequence flows of every pool, followed by the message flows between the pools: {string}.
+    Based on this input, elaborate on the entire process in detail. Use a list and differentiate between the parties.
     
-    The names of tasks and events have the label 'name'.
-    The description how these are done have the label 'maturity:user_description'
+    The pools and lanes are the parties, e.g. the applicant and the building authority. The message flows are the
+    communication between them.
+    The description how these are done have the label 'Description'
     
     Do not incorporate the maturity levels
     The following represents the conversation history:
     Conversation History: {history}
     
-    Please respond in the following language: {language}
-    """
-  
-    template_report_v2 = """
-    You are a expert in building permits and you write official domuments for the municipallity you work for.
-    You will receive a list of processes involved in a building permit procedure, 
-    outlining events or tasks along with descriptions from the perspective of all applicants.
-    give this list back in form of a markdown table and
-    utilize this information to compose a comprehensive and very detailed final report for the process (A desription and not a list of things!!). 
-    Ensure a highly formal tone and include all relevant details, particularly the procedures 
-    and execution of tasks or events. Format the report using Markdown.
-    The titel should be: "Final CHEK Report: As-Is Process by IntelliCHEK".
-    The subtitles are the first the introduction, the table with tasks and description, in detail the different applicants, and a conclusion.
-    This is the building process: {report}
+    Please respond in English.
     """
-    
-    prompt_report = ChatPromptTemplate.from_template(template_report_v2)
+
     prompt_summary = ChatPromptTemplate.from_messages([
             ("system", template_summary),
             ("human", "{string}"),
         ])
 
-    chain_summary = (
+    return (
         {
             "string": itemgetter("string"),
-            "language": itemgetter("language"),
             "history": itemgetter("history"),
         }
         | prompt_summary
@@ -73,38 +42,29 @@ def generate_building_permit_report(
         | StrOutputParser()
     )
 
-    chain_report = (
-        {"report": chain_summary}
-        | prompt_report
-        | model
-        | StrOutputParser()
-    )
 
-    with get_openai_callback() as cb:
-        response = chain_report.invoke({"string": string, "language": language, "history": 'conversation_log'})
-        total_cost = float(cb.total_cost)
-    
-    return response, total_cost
+def _building_permit_report_chain(model: ChatOpenAI):
+    template_report_v2 = """
+    You are a expert in building permits and you write official domuments for the municipallity you work for.
+    You will receive a list of processes involved in a building permit procedure, 
+    outlining events or tasks along with descriptions from the perspective of all applicants.
+    give this list back in form of a markdown table and
+    utilize this information to compose a comprehensive and very detailed final report for the process (A desription and not a list of things!!). 
+    Ensure a highly formal tone and include all relevant details, particularly the procedures 
+    and execution of tasks or events. Format the report using Markdown.
+    The titel should be: "Final CHEK Report: As-Is Process by IntelliCHEK".
+    The subtitles are the first the introduction, the table with tasks and description, in detail the different applicants, and a conclusion.
+    This is the building process: {report}
 
-def generate_maturity_model_report(
-    string: str, 
-    language: str, 
-    model: ChatOpenAI
-    ) -> Tuple[str, float]:
+    Please respond in the following language: {language}
     """
-    Generate a comprehensive report on the maturity assessment of a building permit process in the European Union.
 
-    The function interacts with a ChatOpenAI model to create a detailed report, updating the conversation history during the chat.
+    prompt_report = ChatPromptTemplate.from_template(template_report_v2)
 
-    Args:
-        string (str): String describing a maturity evaluation.
-        language (str): Desired language for the generated report.
-        model (ChatOpenAI): Instance of the ChatOpenAI model for response generation.
+    return prompt_report | model | StrOutputParser()
 
-    Returns:
-        Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
-    """
-    
+
+def _maturity_model_summary_chain(model: ChatOpenAI):
     template_summary = """
     In the assessment of maturity models for building permits, expertise lies in evaluating four critical dimensions:
     Technology, Information, Organization, and Process. Each dimension is appraised on a scale from 0 (completely analogue)
@@ -113,9 +73,25 @@ def generate_maturity_model_report(
     understanding essential for a government-finalized report on the maturity of building permit processes.
     This is the text: {string}
 
-    Please respond in the following language: {language}
+    Please respond in English.
     """
-  
+
+    prompt_summary = ChatPromptTemplate.from_messages([
+            ("system", template_summary),
+            ("human", "{string}"),
+        ])
+
+    return (
+        {
+            "string": itemgetter("string"),
+        }
+        | prompt_summary
+        | model
+        | StrOutputParser()
+    )
+
+
+def _maturity_model_report_chain(model: ChatOpenAI):
     template_report = """
     You are a building permit expert working for the government, writing final reports. Please take the following text and format it as follows:
 
@@ -145,101 +121,369 @@ def generate_maturity_model_report(
     Format the report using Markdown. Dont use ```markdown in the beginning!
     
     This is the building process: {report}
+
+    Please respond in the following language: {language}
     """
-    
+
     prompt_report = ChatPromptTemplate.from_template(template_report)
+
+    return prompt_report | model | StrOutputParser()
+
+
+def _roadmap_summary_chain(model: ChatOpenAI):
+    template_summary = """
+    You will get some informations about a Roadmap that ensures, that a benchmark value is reached in the future. 
+    create a good structured list and do not miss any details! this is the text: {string}
+    
+    Please respond in English.
+    """
+
     prompt_summary = ChatPromptTemplate.from_messages([
             ("system", template_summary),
             ("human", "{string}"),
         ])
 
-    chain_summary = (
+    return (
         {
             "string": itemgetter("string"),
-            "language": itemgetter("language"),
         }
         | prompt_summary
         | model
         | StrOutputParser()
     )
 
-    chain_report = (
-        {"report": chain_summary}
-        | prompt_report
-        | model
-        | StrOutputParser()
-    )
 
-    with get_openai_callback() as cb:
-        response = chain_report.invoke({"string": string, "language": language})
-        total_cost = float(cb.total_cost)
+def _roadmap_report_chain(model: ChatOpenAI):
+    template_report = """
+    You are a building permit expert working for the government, writing final reports. Please take the following text and format it as follows:
+
+    - Title: "Final Report: Roadmap by IntelliCHEK"
+    - Markdown Table with the columns: KMA, Start Date, End Date, Dependencies, Actions and CHEK Tools
+      (If a field is empty or none AND the start_date and end date are the same write:
+      Chek benchmark level reached)
+    - Section: Write a Conclusion
+    
+    Format the report using Markdown. Dont use ```markdown in the beginning!
+    This is the building process for the markdown table: {report}
+
+    Please respond in the following language: {language}
+    """
+
+    prompt_report = ChatPromptTemplate.from_template(template_report)
+
+    return prompt_report | model | StrOutputParser()
+
+# Summary stages of the reports by kind: the summary chain, its inputs besides the input string
+# and whether the input is a process map that is split into parts above the token budget (see
+# `token_budget`). The summaries are written in English, independent of the language of the
+# report, so that a stored summary is reused for the report in any language.
+SUMMARY_STAGES: Dict[str, Tuple[Callable[[ChatOpenAI], Any], Dict[str, Any], bool]] = {
+    "as_is": (_building_permit_summary_chain, {"history": 'conversation_log'}, True),
+    "maturity": (_maturity_model_summary_chain, {}, False),
+    "roadmap": (_roadmap_summary_chain, {}, False),
+}
+
+def _summary_calls(kind: str, string: str, model: ChatOpenAI) -> Tuple[Any, List[Dict[str, Any]]]:
+    chain_builder, inputs, chunked = SUMMARY_STAGES[kind]
+    chain = chain_builder(model)
+    calls = chunk_inputs(chain, string, model, **inputs) if chunked else [{"string": string, **inputs}]
+    return chain, calls
+
+def report_summary_key(kind: str, string: str, model: ChatOpenAI) -> Optional[str]:
+    """
+    Return the key of the summary stage of a report for the given input.
+
+    The key changes with the input, the summary prompt and the model, so a stored summary
+    is only reused for the same summary call.
+
+    Args:
+        kind (str): The kind of the report: "as_is", "maturity" or "roadmap".
+        string (str): The input of the report.
+        model (ChatOpenAI): The ChatOpenAI model instance to generate responses.
+
+    Returns:
+        str or None: The fingerprint of the summary call, or None if it cannot be computed.
+    """
+    chain, inputs, _ = SUMMARY_STAGES[kind]
+    fingerprint, _ = cache.call_fingerprint(chain(model), {"string": string, **inputs})
+    return fingerprint
+
+def generate_report_summary(kind: str, string: str, model: ChatOpenAI) -> Tuple[str, float]:
+    """
+    Generate the summary stage of a report, which the report stage turns into the final report.
+
+    The process map of an As-Is report whose prompt exceeds `config.LLM_INPUT_TOKEN_BUDGET` tokens is
+    split into parts that are summarized separately; the summaries are joined in sequence-flow order.
+
+    Args:
+        kind (str): The kind of the report: "as_is", "maturity" or "roadmap".
+        string (str): The input of the report.
+        model (ChatOpenAI): The ChatOpenAI model instance to generate responses.
+
+    Returns:
+        Tuple[str, float]: A tuple containing the summary and the total cost incurred for the API call.
+    """
+    return map_chunks(*_summary_calls(kind, string, model))
+
+async def agenerate_report_summary(kind: str, string: str, model: ChatOpenAI) -> Tuple[str, float]:
+    """
+    Asynchronously generate the summary stage of a report, see `generate_report_summary`.
+
+    Args:
+        kind (str): The kind of the report: "as_is", "maturity" or "roadmap".
+        string (str): The input of the report.
+        model (ChatOpenAI): The ChatOpenAI model instance to generate responses.
+
+    Returns:
+        Tuple[str, float]: A tuple containing the summary and the total cost incurred for the API call.
+    """
+    return await amap_chunks(*_summary_calls(kind, string, model))
+
+def estimate_report_summary(kind: str, string: str, model: ChatOpenAI) -> Dict[str, Any]:
+    """
+    Estimate the prompt tokens and cost of the summary stage of a report without calling the model.
+
+    Args:
+        kind (str): The kind of the report: "as_is", "maturity" or "roadmap".
+        string (str): The input of the report.
+        model (ChatOpenAI): The ChatOpenAI model whose tokenizer and prices are used.
+
+    Returns:
+        dict: The token estimate of `token_budget.estimate_tokens`.
+    """
+    chain, calls = _summary_calls(kind, string, model)
+    return estimate_tokens(chain, calls, model_name_of(model))
+
+def _generate_report(kind: str, report_chain, string: str, language: str, model: ChatOpenAI, summary: Optional[str]) -> Tuple[str, float]:
+    summary_cost = 0.0
+    if summary is None:
+        summary, summary_cost = generate_report_summary(kind, string, model)
+    response, report_cost = invoke_with_cost(report_chain(model), {"report": summary, "language": language})
+    return response, summary_cost + report_cost
+
+async def _agenerate_report(kind: str, report_chain, string: str, language: str, model: ChatOpenAI, summary: Optional[str]) -> Tuple[str, float]:
+    summary_cost = 0.0
+    if summary is None:
+        summary, summary_cost = await agenerate_report_summary(kind, string, model)
+    response, report_cost = await ainvoke_with_cost(report_chain(model), {"report": summary, "language": language})
+    return response, summary_cost + report_cost
+
+async def _astream_report(kind: str, report_chain, string: str, language: str, model: ChatOpenAI, summary: Optional[str]) -> AsyncIterator[str]:
+    if summary is None:
+        summary, _ = await agenerate_report_summary(kind, string, model)
+    async for chunk in astream_with_cost(report_chain(with_stream_usage(model)), {"report": summary, "language": language}):
+        yield chunk
+
+def generate_building_permit_report(
+    string: str, 
+    language: str,
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> Tuple[str, float]:
+    """
+    Generate a detailed description of a building permit process in the European Union based on the 
+    provided BPMN XML string.
+    
+    The function interacts with a ChatOpenAI model to create a comprehensive report on the process. 
+    The process is described first (the summary stage, see `generate_report_summary`), then the final
+    report is written from the description.
+
+    Args:
+        string (str): A portion of the XML from a BPMN file describing a building permit process.
+        language (str): The desired language for the generated report.
+        model (ChatOpenAI): The ChatOpenAI model instance to generate responses.
+        summary (str, optional): A stored description of the same input; only the final report is generated.
+
+    Returns:
+        Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
+    """
+    return _generate_report("as_is", _building_permit_report_chain, string, language, model, summary)
+
+async def agenerate_building_permit_report(
+    string: str, 
+    language: str,
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> Tuple[str, float]:
+    """
+    Asynchronously generate a detailed description of a building permit process in the European Union based on the 
+    provided BPMN XML string.
+    
+    The function interacts with a ChatOpenAI model to create a comprehensive report on the process. 
+    The process is described first (the summary stage, see `generate_report_summary`), then the final
+    report is written from the description.
+
+    Args:
+        string (str): A portion of the XML from a BPMN file describing a building permit process.
+        language (str): The desired language for the generated report.
+        model (ChatOpenAI): The ChatOpenAI model instance to generate responses.
+        summary (str, optional): A stored description of the same input; only the final report is generated.
+
+    Returns:
+        Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
+    """
+    return await _agenerate_report("as_is", _building_permit_report_chain, string, language, model, summary)
+
+async def astream_building_permit_report(
+    string: str, 
+    language: str,
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> AsyncIterator[str]:
+    """
+    Asynchronously generate the As-Is report of `agenerate_building_permit_report`, streaming the final report.
 
-    return response, total_cost
+    The description of the process is generated first, unless it is given; the final report is then
+    yielded in chunks as the model writes it, so the first chunk arrives after about one model call.
+
+    Args:
+        string (str): A portion of the XML from a BPMN file describing a building permit process.
+        language (str): The desired language for the generated report.
+        model (ChatOpenAI): The ChatOpenAI model instance to generate responses.
+        summary (str, optional): A stored description of the same input; only the final report is generated.
+
+    Yields:
+        str: The chunks of the generated report.
+    """
+    async for chunk in _astream_report("as_is", _building_permit_report_chain, string, language, model, summary):
+        yield chunk
+
+def generate_maturity_model_report(
+    string: str, 
+    language: str, 
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> Tuple[str, float]:
+    """
+    Generate a comprehensive report on the maturity assessment of a building permit process in the European Union.
+
+    The function interacts with a ChatOpenAI model to create a detailed report: the evaluation is
+    summarized first (the summary stage, see `generate_report_summary`), then formatted as the final report.
+
+    Args:
+        string (str): String describing a maturity evaluation.
+        language (str): Desired language for the generated report.
+        model (ChatOpenAI): Instance of the ChatOpenAI model for response generation.
+        summary (str, optional): A stored summary of the same input; only the final report is generated.
+
+    Returns:
+        Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
+    """
+    return _generate_report("maturity", _maturity_model_report_chain, string, language, model, summary)
+
+async def agenerate_maturity_model_report(
+    string: str, 
+    language: str, 
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> Tuple[str, float]:
+    """
+    Asynchronously generate a comprehensive report on the maturity assessment of a building permit process in the European Union.
+
+    The function interacts with a ChatOpenAI model to create a detailed report: the evaluation is
+    summarized first (the summary stage, see `generate_report_summary`), then formatted as the final report.
+
+    Args:
+        string (str): String describing a maturity evaluation.
+        language (str): Desired language for the generated report.
+        model (ChatOpenAI): Instance of the ChatOpenAI model for response generation.
+        summary (str, optional): A stored summary of the same input; only the final report is generated.
+
+    Returns:
+        Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
+    """
+    return await _agenerate_report("maturity", _maturity_model_report_chain, string, language, model, summary)
+
+async def astream_maturity_model_report(
+    string: str, 
+    language: str, 
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> AsyncIterator[str]:
+    """
+    Asynchronously generate the maturity report of `agenerate_maturity_model_report`, streaming the final report.
+
+    The evaluation summary is generated first, unless it is given; the final report is then yielded
+    in chunks as the model writes it.
+
+    Args:
+        string (str): String describing a maturity evaluation.
+        language (str): Desired language for the generated report.
+        model (ChatOpenAI): Instance of the ChatOpenAI model for response generation.
+        summary (str, optional): A stored summary of the same input; only the final report is generated.
+
+    Yields:
+        str: The chunks of the generated report.
+    """
+    async for chunk in _astream_report("maturity", _maturity_model_report_chain, string, language, model, summary):
+        yield chunk
 
 def generate_roadmap_report(
     string: str,
     language: str, 
-    model: ChatOpenAI
+    model: ChatOpenAI,
+    summary: Optional[str] = None
     ) -> Tuple[str, float]:
     """
     Generate a comprehensive report on the roadmap for achieving a benchmark value in the future.
 
-    The function interacts with a ChatOpenAI model to create a detailed report based on the provided roadmap data.
+    The function interacts with a ChatOpenAI model to create a detailed report based on the provided roadmap data:
+    the roadmap is structured first (the summary stage, see `generate_report_summary`), then formatted as the final report.
 
     Args:
         string (str): String describing the roadmap details.
         language (str): Desired language for the generated report.
         model (ChatOpenAI): Instance of the ChatOpenAI model for response generation.
+        summary (str, optional): A stored structured list of the same input; only the final report is generated.
 
     Returns:
         Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
     """
+    return _generate_report("roadmap", _roadmap_report_chain, string, language, model, summary)
 
-    template_summary = """
-    You will get some informations about a Roadmap that ensures, that a benchmark value is reached in the future. 
-    create a good structured list and do not miss any details! this is the text: {string}
-    
-    Please respond in the following language: {language}
+async def agenerate_roadmap_report(
+    string: str,
+    language: str, 
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> Tuple[str, float]:
     """
-  
-    template_report = """
-    You are a building permit expert working for the government, writing final reports. Please take the following text and format it as follows:
+    Asynchronously generate a comprehensive report on the roadmap for achieving a benchmark value in the future.
 
-    - Title: "Final Report: Roadmap by IntelliCHEK"
-    - Markdown Table with the columns: KMA, Start Date, End Date, Dependencies, Actions and CHEK Tools
-      (If a field is empty or none AND the start_date and end date are the same write:
-      Chek benchmark level reached)
-    - Section: Write a Conclusion
-    
-    Format the report using Markdown. Dont use ```markdown in the beginning!
-    This is the building process for the markdown table: {report}
+    The function interacts with a ChatOpenAI model to create a detailed report based on the provided roadmap data:
+    the roadmap is structured first (the summary stage, see `generate_report_summary`), then formatted as the final report.
+
+    Args:
+        string (str): String describing the roadmap details.
+        language (str): Desired language for the generated report.
+        model (ChatOpenAI): Instance of the ChatOpenAI model for response generation.
+        summary (str, optional): A stored structured list of the same input; only the final report is generated.
+
+    Returns:
+        Tuple[str, float]: A tuple containing the generated report and the total cost incurred for the API call.
     """
-    
-    prompt_report = ChatPromptTemplate.from_template(template_report)
-    prompt_summary = ChatPromptTemplate.from_messages([
-            ("system", template_summary),
-            ("human", "{string}"),
-        ])
+    return await _agenerate_report("roadmap", _roadmap_report_chain, string, language, model, summary)
 
-    chain_summary = (
-        {
-            "string": itemgetter("string"),
-            "language": itemgetter("language"),
-        }
-        | prompt_summary
-        | model
-        | StrOutputParser()
-    )
+async def astream_roadmap_report(
+    string: str,
+    language: str, 
+    model: ChatOpenAI,
+    summary: Optional[str] = None
+    ) -> AsyncIterator[str]:
+    """
+    Asynchronously generate the roadmap report of `agenerate_roadmap_report`, streaming the final report.
 
-    chain_report = (
-        {"report": chain_summary}
-        | prompt_report
-        | model
-        | StrOutputParser()
-    )
+    The structured list of the roadmap is generated first, unless it is given; the final report is
+    then yielded in chunks as the model writes it.
 
-    with get_openai_callback() as cb:
-        response = chain_report.invoke({"string": string, "language": language})
-        total_cost = float(cb.total_cost)
+    Args:
+        string (str): String describing the roadmap details.
+        language (str): Desired language for the generated report.
+        model (ChatOpenAI): Instance of the ChatOpenAI model for response generation.
+        summary (str, optional): A stored structured list of the same input; only the final report is generated.
 
-    return response, total_cost
+    Yields:
+        str: The chunks of the generated report.
+    """
+    async for chunk in _astream_report("roadmap", _roadmap_report_chain, string, language, model, summary):
+        yield chunk
@@ -1,81 +1,63 @@
 """
-This module defines a specialized AI assistant Chatbot named Intellichek, designed to generate roadmaps
+This module defines a specialized AI assistant Chatbot named Intellichek, designed to present roadmaps
 for building permit processes based on key maturity areas (KMAs) and predefined benchmarks.
-Utilizing the langchain library, Intellichek offers expertise in this domain, providing smooth and 
+Utilizing the langchain library, Intellichek offers expertise in this domain, providing smooth and
 informed assistance.
-The module includes a function to facilitate AI chat interactions with users, specifying responses in 
-the user's chosen language, and generates detailed roadmaps based on provided inputs.
+The roadmap schedule itself is computed by `roadmap_scheduler`; the language model is only used to
+translate it into the user's chosen language.
 
-The primary function, `get_roadmap_from_ai`, performs asynchronous evaluations of user inputs, creating 
-a roadmap in JSON format that includes KMAs, dependencies, actions, and tools, with careful 
-consideration of start dates and dependencies.
+The primary function, `translate_roadmap`, translates the texts of a computed roadmap in JSON format
+that includes KMAs, dependencies, actions, and tools, while keeping the dates and the structure.
 
 Author: Elias Niederwieser
 Date: 23.07.2024
 """
+import json
 from operator import itemgetter
+from typing import Any, Dict, List, Tuple
 from langchain.chat_models import ChatOpenAI
-from langchain.callbacks import get_openai_callback
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers.json import SimpleJsonOutputParser
+from ai_tools.intellichek.chains import ainvoke_with_cost
 
-async def get_roadmap_from_ai(
-    inputs: str, 
+async def translate_roadmap(
+    roadmap: List[Dict[str, Any]],
     language: str,
-    model: ChatOpenAI) -> str:
+    model: ChatOpenAI) -> Tuple[List[Dict[str, Any]], float]:
     """
-    Perform a chat with a ChatOpenAI model based on provided inputs and update the conversation log.
+    Translate the texts of a computed roadmap with a ChatOpenAI model.
+
+    The dates are taken from the computed roadmap, so the translation cannot change the schedule.
 
     Args:
-        inputs (str): The input question or statement for the chat.
+        roadmap (list): The roadmap entries computed by `roadmap_scheduler.schedule_roadmap`.
+        language (str): The language to translate into.
         model (ChatOpenAI): The ChatOpenAI model for generating responses.
 
     Returns:
-        tuple: A tuple containing the generated response and the total cost of the API call.
+        tuple: A tuple containing the translated roadmap and the total cost of the API call.
+
+    Raises:
+        ValueError: If the translation does not have the structure of the roadmap.
     """
 
     template = """
-    You will receive a JSON file representing a roadmap for reaching a given maturity level 
-    in the process of building permits. 
-    The JSON file includes various KMAs (Key Maturity Areas) with their respective 
-    level differences, which denote the number of levels difference between the current 
-    (as-is) and target (to-be) states. this is the JSON file: 
+    You will receive a JSON list representing a roadmap for reaching a given maturity level
+    in the process of building permits. Every element describes a KMA (Key Maturity Area)
+    with its dependencies, actions and CHEK tools. This is the JSON list:
     {text}
 
-    Please create a new roadmap by transforming the given JSON file with the following changes:
-
-    Replace the level_difference label with start_date and end_date.
-    Calculate the start_date and end_date based on the level_difference:
-    
-    1 level difference = 3 months, 2 level difference = 6 months etc. 
-    
-    Ensure that the start_date for a KMA can only begin after the end_date of any other KMA 
-    in which the Dependencies are Actions. 
-
-    Dependencies are a list that also can be a list of Actions in different KMA's. Keep that in mind.
-
-    The roadmap should be a json in this format 
-    If the level difference is 0 or negative the start_date and end_date should be the same and 
-    the labels dependencies, actions ad chek_tools should be emppty.
-    FORMAT:
-        "kma": "string",
-        "start_date": "string",
-        "end_date": "string",
-        "dependencies": ["string", "string"],
-        "actions": ["string", "string"],
-        "chek_tools": ["string", "string"]
+    Translate all texts of the values of "kma", "dependencies", "actions" and "chek_tools" into
+    the following language: {language}
 
-    The first KMA should start with the  2025-01-01
-    Translate in the following language: {language}
+    Keep the keys, the order of the elements, the number of items in every list and the values of
+    "start_date" and "end_date" exactly as they are. Return only the JSON list.
     """
-    prompt = ChatPromptTemplate.from_template(template)
-
     prompt = ChatPromptTemplate.from_messages([
             ("system", template),
             ("human", "{text}"),
         ])
 
-
     chain = (
         {
             "text": itemgetter("text"),
@@ -85,10 +67,22 @@ async def get_roadmap_from_ai(
         | model
         | SimpleJsonOutputParser()
     )
-   
-    with get_openai_callback() as cb:
-        response = await chain.ainvoke({"text": inputs, "language": language})
-        print(response, type(response))
-        total_cost = float(cb.total_cost)
 
-    return response, total_cost
+    response, total_cost = await ainvoke_with_cost(chain, {"text": json.dumps(roadmap, ensure_ascii=False), "language": language})
+
+    if not isinstance(response, list) or len(response) != len(roadmap):
+        raise ValueError("The translated roadmap does not match the computed roadmap.")
+
+    translated = []
+    for entry, translation in zip(roadmap, response):
+        translated_entry = dict(entry)
+        for key in ("kma", "dependencies", "actions", "chek_tools"):
+            value = translation.get(key) if isinstance(translation, dict) else None
+            if isinstance(entry[key], list) and (not isinstance(value, list) or len(value) != len(entry[key])):
+                raise ValueError("The translated roadmap does not match the computed roadmap.")
+            if value is None:
+                raise ValueError("The translated roadmap does not match the computed roadmap.")
+            translated_entry[key] = value
+        translated.append(translated_entry)
+
+    return translated, total_cost
@@ -0,0 +1,123 @@
+"""
+This module computes the CHEK roadmap schedule from the benchmark entries of a project.
+
+Every KMA (Key Maturity Area) takes a fixed number of months per level it is behind the
+CHEK level. A KMA depends on another KMA when one of its dependencies is an action of the
+other KMA, so it can only start after that KMA has finished. The schedule is the earliest
+start and finish of every KMA in this dependency graph (a topological sort with a
+critical-path forward pass), so it is computed locally, without a language model, and is
+always the same for the same input.
+
+- `schedule_roadmap`: Computes the start and end date of every KMA.
+- `add_months`: Adds a number of months to a date.
+- `RoadmapCycleError`: Exception raised when the dependencies contain a cycle.
+"""
+
+import calendar
+from collections import deque
+from datetime import date
+from typing import Dict, Iterable, List, Mapping, Any
+
+class RoadmapCycleError(Exception):
+    """Exception raised when the dependencies between the KMAs contain a cycle."""
+
+    def __init__(self, kmas: List[str]):
+        self.kmas = kmas
+        super().__init__(f"Cyclic dependencies between the KMAs: {', '.join(kmas)}")
+
+def add_months(start: date, months: int) -> date:
+    """
+    Add a number of months to a date, clamping the day to the length of the target month.
+
+    Args:
+        start (date): The start date.
+        months (int): The number of months to add.
+
+    Returns:
+        date: The resulting date.
+    """
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+def schedule_roadmap(
+    entries: Iterable[Mapping[str, Any]],
+    start_date: date,
+    months_per_level: int
+    ) -> List[Dict[str, Any]]:
+    """
+    Compute the earliest start and end date of every KMA of a roadmap.
+
+    A KMA with a level difference of zero or less needs no work: it starts and ends on the
+    start date and has no dependencies, actions or CHEK tools.
+
+    Args:
+        entries (iterable): Benchmark entries with the keys `kma`, `level_difference`,
+            `dependencies`, `actions` and `chek_tools`.
+        start_date (date): Start date of the roadmap.
+        months_per_level (int): Duration of one level of difference in months.
+
+    Returns:
+        list: The roadmap entries with the keys `kma`, `start_date`, `end_date` (ISO dates),
+        `dependencies`, `actions` and `chek_tools`, ordered by start date.
+
+    Raises:
+        RoadmapCycleError: If the dependencies between the KMAs contain a cycle.
+    """
+    entries = list(entries)
+
+    providers: Dict[str, List[int]] = {}
+    for index, entry in enumerate(entries):
+        if entry["level_difference"] > 0:
+            for action in entry["actions"]:
+                providers.setdefault(action, []).append(index)
+
+    # Edges from every KMA to the KMAs waiting for one of its actions. Dependencies on
+    # own actions or on actions no KMA of the roadmap works on do not delay a KMA.
+    successors: Dict[int, set] = {index: set() for index in range(len(entries))}
+    predecessors: Dict[int, set] = {index: set() for index in range(len(entries))}
+    for index, entry in enumerate(entries):
+        if entry["level_difference"] <= 0:
+            continue
+        for dependency in entry["dependencies"]:
+            for provider in providers.get(dependency, []):
+                if provider != index:
+                    successors[provider].add(index)
+                    predecessors[index].add(provider)
+
+    remaining = {index: len(predecessors[index]) for index in predecessors}
+    queue = deque(index for index in range(len(entries)) if remaining[index] == 0)
+    order = []
+    while queue:
+        index = queue.popleft()
+        order.append(index)
+        for successor in sorted(successors[index]):
+            remaining[successor] -= 1
+            if remaining[successor] == 0:
+                queue.append(successor)
+
+    if len(order) < len(entries):
+        raise RoadmapCycleError([entries[index]["kma"] for index in range(len(entries)) if remaining[index] > 0])
+
+    starts: Dict[int, date] = {}
+    ends: Dict[int, date] = {}
+    for index in order:
+        starts[index] = max([start_date] + [ends[predecessor] for predecessor in predecessors[index]])
+        ends[index] = add_months(starts[index], months_per_level * max(entries[index]["level_difference"], 0))
+
+    roadmap = []
+    for index in sorted(order, key=lambda index: (starts[index], index)):
+        entry = entries[index]
+        active = entry["level_difference"] > 0
+        roadmap.append({
+            "kma": entry["kma"],
+            "start_date": starts[index].isoformat(),
+            "end_date": ends[index].isoformat(),
+            "dependencies": list(entry["dependencies"]) if active else [],
+            "actions": list(entry["actions"]) if active else [],
+            "chek_tools": list(entry["chek_tools"]) if active else [],
+        })
+
+    return roadmap
@@ -0,0 +1,242 @@
+"""
+This module provides the token budgeting of the Intellichek prompts built from a process map.
+
+The process maps of large municipalities do not fit into one prompt, or make a single call
+slow and expensive. The compact text of `bpmn_parser` (one line per task, event or gateway,
+in sequence-flow order) is counted with the tokenizer of the model. If the prompt of a call
+with it would exceed `config.LLM_INPUT_TOKEN_BUDGET` tokens, the process map is split into
+parts of consecutive lines, cut where the pool or lane changes whenever possible. The budget
+covers the whole prompt: the template and every copy of the process map in it. The parts are
+sent to the model concurrently (map) and the responses are joined in the order of the parts,
+which is the sequence-flow order (reduce).
+The numbers of the elements refer to the whole process map in every part.
+
+- `count_tokens`: Counts the tokens of a text with the tokenizer of a model.
+- `split_process_map`: Splits the compact text of a process map into parts within the budget.
+- `part_budget`: Returns the tokens left for the process map in the prompt of a chain.
+- `chunk_inputs`: Returns the chain inputs of the calls for a process map, one per part.
+- `estimate_tokens`: Estimates the prompt tokens and cost of calls before they are made.
+- `map_chunks`: Runs a chain for every part and joins the responses.
+- `amap_chunks`: Runs a chain for every part concurrently and joins the responses.
+"""
+
+import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import tiktoken
+from langchain_community.callbacks.openai_info import get_openai_token_cost_for_model
+from langchain_core.runnables import Runnable
+
+import config
+from ai_tools.intellichek.bpmn_parser import line_lane
+from ai_tools.intellichek.chains import ainvoke_with_cost, invoke_with_cost
+
+# Separator of the joined responses of the parts
+PART_SEPARATOR = "\n\n"
+
+# Header of a part of a process map in the prompt
+PART_HEADER = "(Part {index} of {count} of the process map; the numbers refer to the whole process map.)"
+
+# Tokens left for a part at least, if the prompt template itself nearly fills the budget
+MIN_PART_TOKENS = 256
+
+# Process map used to measure how many copies of the process map a prompt contains
+_PROBE = "\n".join(f"{index}. Task: Probe | Next: {index + 1}" for index in range(1, 51))
+
+@lru_cache(maxsize=None)
+def _encoding(model_name: str):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def model_name_of(model) -> str:
+    """Return the model name of a chat model, or the configured model."""
+    return getattr(model, "model_name", None) or config.GPT_MODEL
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """
+    Count the tokens of a text with the tokenizer of a model.
+
+    Args:
+        text (str): The text.
+        model_name (str, optional): The model name. Defaults to `config.GPT_MODEL`.
+
+    Returns:
+        int: The number of tokens.
+    """
+    return len(_encoding(model_name or config.GPT_MODEL).encode(text, disallowed_special=()))
+
+def split_process_map(text: str, max_tokens: int, model_name: Optional[str] = None) -> List[str]:
+    """
+    Split the compact text of a process map into parts of at most `max_tokens` tokens.
+
+    A part is cut at the last change of the pool or lane within it, so that the elements of a
+    pool and lane stay together, unless that would leave the part less than half full. A single
+    line longer than the budget forms a part of its own.
+
+    Args:
+        text (str): The compact text of `BPMNModel.to_text`.
+        max_tokens (int): The token budget of a part.
+        model_name (str, optional): The model whose tokenizer is used.
+
+    Returns:
+        list: The parts in sequence-flow order; the text itself if it fits into the budget.
+    """
+    lines = text.split("\n")
+    counts = [count_tokens(line, model_name) + 1 for line in lines]
+    if sum(counts) <= max_tokens:
+        return [text]
+
+    parts: List[List[str]] = []
+    current: List[str] = []
+    current_counts: List[int] = []
+    current_lane = None
+    # Index in the current part of the first line after the last change of the pool or lane
+    lane_change = 0
+
+    for line, tokens in zip(lines, counts):
+        while current and sum(current_counts) + tokens > max_tokens:
+            cut = len(current)
+            if lane_change and sum(current_counts[:lane_change]) >= max_tokens // 2:
+                cut = lane_change
+            parts.append(current[:cut])
+            current, current_counts = current[cut:], current_counts[cut:]
+            lane_change = 0
+
+        lane = line_lane(line)
+        if current and lane != current_lane:
+            lane_change = len(current)
+        current.append(line)
+        current_counts.append(tokens)
+        current_lane = lane
+
+    if current:
+        parts.append(current)
+    return ["\n".join(part) for part in parts]
+
+def _prompt_tokens(chain: Runnable, call: Dict[str, Any], model_name: str) -> int:
+    return sum(
+        count_tokens(prompt.format(**{name: call.get(name, "") for name in prompt.input_variables}), model_name)
+        for prompt in chain.get_prompts()
+    )
+
+def part_budget(chain: Runnable, model_name: str, **inputs: Any) -> int:
+    """
+    Return the tokens left for the process map in a call of a chain within the budget.
+
+    The prompt without the process map, i.e. the template, the other inputs and the header
+    of a part, is subtracted from `config.LLM_INPUT_TOKEN_BUDGET`; the rest is divided by the
+    number of copies of the process map in the prompt (e.g. in the system and the human message).
+
+    Args:
+        chain (Runnable): The chain, with the process map as `string` input.
+        model_name (str): The model whose tokenizer is used.
+        **inputs: The other inputs of the chain.
+
+    Returns:
+        int: The token budget of a part of the process map, at least `MIN_PART_TOKENS`.
+    """
+    header = PART_HEADER.format(index=999, count=999) + "\n"
+    without_map = _prompt_tokens(chain, {**inputs, "string": ""}, model_name)
+    with_probe = _prompt_tokens(chain, {**inputs, "string": _PROBE}, model_name)
+    copies = max(round((with_probe - without_map) / count_tokens(_PROBE, model_name)), 1)
+    available = (config.LLM_INPUT_TOKEN_BUDGET - without_map) // copies - count_tokens(header, model_name)
+    return max(available, MIN_PART_TOKENS)
+
+def chunk_inputs(chain: Runnable, string: str, model, **inputs: Any) -> List[Dict[str, Any]]:
+    """
+    Return the inputs of the calls of a chain for a process map, one call per part.
+
+    Args:
+        chain (Runnable): The chain, with the process map as `string` input.
+        string (str): The compact text of the process map.
+        model (ChatOpenAI): The chat model, whose tokenizer is used.
+        **inputs: The other inputs of the chain, the same for every part.
+
+    Returns:
+        list: The inputs of the calls; a single call with the whole process map if its prompt
+        fits into `config.LLM_INPUT_TOKEN_BUDGET`.
+    """
+    model_name = model_name_of(model)
+    parts = split_process_map(string, part_budget(chain, model_name, **inputs), model_name)
+    if len(parts) == 1:
+        return [{"string": string, **inputs}]
+
+    return [
+        {"string": f"{PART_HEADER.format(index=index, count=len(parts))}\n{part}", **inputs}
+        for index, part in enumerate(parts, start=1)
+    ]
+
+def _prompt_cost(model_name: str, tokens: int) -> Optional[float]:
+    try:
+        return get_openai_token_cost_for_model(model_name, tokens)
+    except ValueError:
+        return None
+
+def estimate_tokens(chain: Runnable, calls: List[Dict[str, Any]], model_name: str) -> Dict[str, Any]:
+    """
+    Estimate the prompt tokens of the calls of a chain before they are made.
+
+    Args:
+        chain (Runnable): The chain.
+        calls (list): The inputs of the calls, e.g. from `chunk_inputs`.
+        model_name (str): The model whose tokenizer and prices are used.
+
+    Returns:
+        dict: The model, the number of calls, the prompt tokens of all calls and of the
+        largest call, the budget and the cost of the prompt tokens in USD (None for an
+        unknown model). The completion tokens are not known in advance.
+    """
+    prompt_tokens = [_prompt_tokens(chain, call, model_name) for call in calls]
+    total = sum(prompt_tokens)
+    return {
+        "model": model_name,
+        "calls": len(calls),
+        "prompt_tokens": total,
+        "max_prompt_tokens": max(prompt_tokens, default=0),
+        "budget": config.LLM_INPUT_TOKEN_BUDGET,
+        "prompt_cost": _prompt_cost(model_name, total),
+    }
+
+def map_chunks(chain: Runnable, calls: List[Dict[str, Any]]) -> Tuple[str, float]:
+    """
+    Invoke a chain for every part and join the responses in the order of the parts.
+
+    Args:
+        chain (Runnable): The chain, returning a string.
+        calls (list): The inputs of the calls, e.g. from `chunk_inputs`.
+
+    Returns:
+        tuple: A tuple containing the joined response and the total cost of the API calls.
+    """
+    if len(calls) == 1:
+        return invoke_with_cost(chain, calls[0])
+
+    results = [invoke_with_cost(chain, call) for call in calls]
+    return PART_SEPARATOR.join(response for response, _ in results), sum(cost for _, cost in results)
+
+async def amap_chunks(chain: Runnable, calls: List[Dict[str, Any]]) -> Tuple[str, float]:
+    """
+    Asynchronously invoke a chain for every part, at most `config.LLM_CHUNK_CONCURRENCY` at a
+    time, and join the responses in the order of the parts.
+
+    Args:
+        chain (Runnable): The chain, returning a string.
+        calls (list): The inputs of the calls, e.g. from `chunk_inputs`.
+
+    Returns:
+        tuple: A tuple containing the joined response and the total cost of the API calls.
+    """
+    if len(calls) == 1:
+        return await ainvoke_with_cost(chain, calls[0])
+
+    semaphore = asyncio.Semaphore(config.LLM_CHUNK_CONCURRENCY)
+
+    async def invoke(call: Dict[str, Any]) -> Tuple[str, float]:
+        async with semaphore:
+            return await ainvoke_with_cost(chain, call)
+
+    results = await asyncio.gather(*(invoke(call) for call in calls))
+    return PART_SEPARATOR.join(response for response, _ in results), sum(cost for _, cost in results)
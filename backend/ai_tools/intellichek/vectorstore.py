@@ -0,0 +1,162 @@
+"""
+This module provides the persistent on-disk store for the FAISS indexes behind the
+Intellichek retrievers.
+
+Every index is keyed by the SHA-256 of its source file in `chek_database` and by the
+name of the embedding model. The file is embedded once, saved below
+`config.VECTORSTORE_DIR` and afterwards only loaded from disk, no matter how many
+workers are started. A rebuild only happens when the source file or the embedding
+model changes; outdated indexes of the same source are removed afterwards.
+
+Concurrent workers coordinate through a file lock, so only one of them pays for the
+embedding calls while the others wait and load the finished index.
+
+The indexes can be prebuilt (e.g. before starting uvicorn) with:
+
+    python -m ai_tools.intellichek.vectorstore
+
+- `INDEX_SOURCES`: Source file and embedding model of every known index.
+- `load_or_build_index`: Loads an index from disk or builds and persists it.
+- `get_retriever`: Returns the cached retriever of a known index.
+- `build_all_indexes`: Makes sure that all known indexes exist on disk.
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, Tuple
+
+from langchain.document_loaders import TextLoader
+from langchain.embeddings import OpenAIEmbeddings
+from langchain.vectorstores import FAISS
+import config
+
+INDEX_SOURCES: Dict[str, Tuple[str, str]] = {
+    "maturity": ("./ai_tools/chek_database/maturity.txt", "text-embedding-3-large"),
+    "maturity_organisation": ("./ai_tools/chek_database/maturity_organisation.txt", "text-embedding-3-large"),
+    "glossary": ("./ai_tools/chek_database/glossary.txt", config.EMBEDDING_MODEL),
+}
+
+_retrievers: Dict[str, object] = {}
+_retrievers_lock = threading.Lock()
+
+def file_digest(path: str) -> str:
+    """
+    Compute the SHA-256 hex digest of a file.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def index_directory(path: str, embedding_model: str) -> str:
+    """
+    Return the directory of the index for a source file and an embedding model.
+
+    Args:
+        path (str): Path to the source text file.
+        embedding_model (str): Name of the embedding model.
+
+    Returns:
+        str: The directory in which the index is (or will be) stored.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = hashlib.sha256(f"{file_digest(path)}:{embedding_model}".encode()).hexdigest()[:16]
+    return os.path.join(config.VECTORSTORE_DIR, f"{stem}-{key}")
+
+def _embeddings(embedding_model: str) -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(
+        openai_api_key=config.OPENAI_API_KEY,
+        model=embedding_model
+        )
+
+def _remove_outdated_indexes(path: str, current_directory: str):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for entry in os.listdir(config.VECTORSTORE_DIR):
+        candidate = os.path.join(config.VECTORSTORE_DIR, entry)
+        if (
+            candidate != current_directory
+            and entry.startswith(f"{stem}-")
+            and os.path.isdir(candidate)
+        ):
+            shutil.rmtree(candidate, ignore_errors=True)
+
+def load_or_build_index(path: str, embedding_model: str) -> FAISS:
+    """
+    Load the FAISS index of a source file from disk, or build and persist it if it does not exist.
+
+    The build is guarded by an exclusive file lock, so that several workers starting at
+    the same time embed the file only once.
+
+    Args:
+        path (str): Path to the source text file.
+        embedding_model (str): Name of the embedding model.
+
+    Returns:
+        FAISS: The loaded vector store.
+    """
+    embeddings = _embeddings(embedding_model)
+    directory = index_directory(path, embedding_model)
+
+    if os.path.isfile(os.path.join(directory, "index.faiss")):
+        return FAISS.load_local(directory, embeddings, allow_dangerous_deserialization=True)
+
+    os.makedirs(config.VECTORSTORE_DIR, exist_ok=True)
+    lock_path = os.path.join(config.VECTORSTORE_DIR, f"{os.path.basename(path)}.lock")
+
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.isfile(os.path.join(directory, "index.faiss")):
+                data = TextLoader(path).load()
+                vectorstore = FAISS.from_documents(data, embedding=embeddings)
+
+                tmp_directory = f"{directory}.tmp-{os.getpid()}"
+                vectorstore.save_local(tmp_directory)
+                os.replace(tmp_directory, directory)
+                _remove_outdated_indexes(path, directory)
+                return vectorstore
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return FAISS.load_local(directory, embeddings, allow_dangerous_deserialization=True)
+
+def get_retriever(name: str):
+    """
+    Return the retriever of a known index, loading or building the index on first use.
+
+    Args:
+        name (str): Key of the index in `INDEX_SOURCES`.
+
+    Returns:
+        VectorStoreRetriever: The retriever of the index.
+    """
+    retriever = _retrievers.get(name)
+    if retriever is not None:
+        return retriever
+
+    with _retrievers_lock:
+        if name not in _retrievers:
+            path, embedding_model = INDEX_SOURCES[name]
+            # The tag identifies the index version, e.g. for the LLM response cache keys
+            tag = os.path.basename(index_directory(path, embedding_model))
+            _retrievers[name] = load_or_build_index(path, embedding_model).as_retriever(tags=[tag])
+        return _retrievers[name]
+
+def build_all_indexes():
+    """Make sure that the indexes of all `INDEX_SOURCES` exist on disk."""
+    for name, (path, embedding_model) in INDEX_SOURCES.items():
+        load_or_build_index(path, embedding_model)
+        print(f"Index '{name}' ready in {index_directory(path, embedding_model)}")
+
+if __name__ == "__main__":
+    build_all_indexes()
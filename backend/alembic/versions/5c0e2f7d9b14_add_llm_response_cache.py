@@ -0,0 +1,35 @@
+"""Add llm response cache
+
+Revision ID: 5c0e2f7d9b14
+Revises: 30f19fba881b
+Create Date: 2026-10-17 10:12:41.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c0e2f7d9b14'
+down_revision: Union[str, None] = '30f19fba881b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'llm_response_cache',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('response', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_used_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_llm_response_cache_last_used_at'), 'llm_response_cache', ['last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_llm_response_cache_last_used_at'), table_name='llm_response_cache')
+    op.drop_table('llm_response_cache')
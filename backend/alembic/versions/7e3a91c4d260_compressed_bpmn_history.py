@@ -0,0 +1,50 @@
+"""Compressed bpmn history
+
+Revision ID: 7e3a91c4d260
+Revises: 5c0e2f7d9b14
+Create Date: 2026-10-17 11:04:17.293615
+
+"""
+from typing import Sequence, Union
+
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e3a91c4d260'
+down_revision: Union[str, None] = '5c0e2f7d9b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('bpmn_data', sa.Column('compressed_content', sa.LargeBinary(), nullable=True))
+    op.add_column('bpmn_data', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_bpmn_data_project_id_id', 'bpmn_data', ['project_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    # Move compressed versions back into the plain content column before dropping it
+    connection = op.get_bind()
+    bpmn_data = sa.table(
+        'bpmn_data',
+        sa.column('id', sa.Integer),
+        sa.column('content', sa.Text),
+        sa.column('compressed_content', sa.LargeBinary),
+    )
+    rows = connection.execute(
+        sa.select(bpmn_data.c.id, bpmn_data.c.compressed_content).where(bpmn_data.c.compressed_content.isnot(None))
+    ).fetchall()
+    for row in rows:
+        connection.execute(
+            bpmn_data.update()
+            .where(bpmn_data.c.id == row.id)
+            .values(content=zlib.decompress(row.compressed_content).decode('utf-8'))
+        )
+
+    op.drop_index('ix_bpmn_data_project_id_id', table_name='bpmn_data')
+    op.drop_column('bpmn_data', 'content_hash')
+    op.drop_column('bpmn_data', 'compressed_content')
@@ -0,0 +1,30 @@
+"""Cost ledger reused calls
+
+Revision ID: 9d4e2b7c5a18
+Revises: 8b5f0d3e6a21
+Create Date: 2026-10-17 22:40:18.215634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e2b7c5a18'
+down_revision: Union[str, None] = '8b5f0d3e6a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_info', sa.Column('source', sa.String(length=16), server_default='model', nullable=False))
+    op.add_column('cost_totals', sa.Column('reused_calls', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('cost_daily', sa.Column('reused_calls', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('cost_daily', 'reused_calls')
+    op.drop_column('cost_totals', 'reused_calls')
+    op.drop_column('chat_info', 'source')
@@ -0,0 +1,26 @@
+"""Add project bpmn content hash
+
+Revision ID: b41d6f08e2a7
+Revises: 7e3a91c4d260
+Create Date: 2026-10-17 11:48:05.617342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41d6f08e2a7'
+down_revision: Union[str, None] = '7e3a91c4d260'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('projects', sa.Column('bpmn_content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('projects', 'bpmn_content_hash')
@@ -0,0 +1,87 @@
+"""Single maturity assessment table
+
+Revision ID: c9f2a5d13e88
+Revises: b41d6f08e2a7
+Create Date: 2026-10-17 13:21:52.904716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f2a5d13e88'
+down_revision: Union[str, None] = 'b41d6f08e2a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Old per-dimension table of every dimension
+DIMENSION_TABLES = {
+    'technology': 'maturity_model_technology',
+    'process': 'maturity_model_process',
+    'information': 'maturity_model_information',
+    'organisation': 'maturity_model_organisation',
+}
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('maturity_assessment'):
+        op.create_table(
+            'maturity_assessment',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('dimension', sa.String(length=32), nullable=False),
+            sa.Column('label', sa.String(), nullable=False),
+            sa.Column('level', sa.Integer(), nullable=False),
+            sa.Column('justification', sa.String(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('project_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('project_id', 'user_id', 'dimension', 'label', name='uq_maturity_assessment_project_user_dimension_label')
+        )
+        op.create_index(op.f('ix_maturity_assessment_id'), 'maturity_assessment', ['id'], unique=False)
+
+    for dimension, table in DIMENSION_TABLES.items():
+        if not inspector.has_table(table):
+            continue
+        # The old tables allowed several rows per label; the most recent one is kept
+        op.execute(sa.text(f"""
+            INSERT INTO maturity_assessment (dimension, label, level, justification, user_id, project_id)
+            SELECT DISTINCT ON (project_id, user_id, label) :dimension, label, level, justification, user_id, project_id
+            FROM {table}
+            ORDER BY project_id, user_id, label, id DESC
+            ON CONFLICT ON CONSTRAINT uq_maturity_assessment_project_user_dimension_label DO NOTHING
+        """).bindparams(dimension=dimension))
+        op.drop_table(table)
+
+
+def downgrade() -> None:
+    for dimension, table in DIMENSION_TABLES.items():
+        op.create_table(
+            table,
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('label', sa.String(), nullable=False),
+            sa.Column('level', sa.Integer(), nullable=False),
+            sa.Column('justification', sa.String(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('project_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f(f'ix_{table}_id'), table, ['id'], unique=False)
+        op.execute(sa.text(f"""
+            INSERT INTO {table} (label, level, justification, user_id, project_id)
+            SELECT label, level, justification, user_id, project_id
+            FROM maturity_assessment
+            WHERE dimension = :dimension
+            ORDER BY id
+        """).bindparams(dimension=dimension))
+
+    op.drop_index(op.f('ix_maturity_assessment_id'), table_name='maturity_assessment')
+    op.drop_table('maturity_assessment')
@@ -0,0 +1,49 @@
+"""Add hot query indexes
+
+Revision ID: d3b8e61f4a27
+Revises: c9f2a5d13e88
+Create Date: 2026-10-17 14:02:37.118904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3b8e61f4a27'
+down_revision: Union[str, None] = 'c9f2a5d13e88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns, included columns), matched to the filters and orderings of the handlers
+INDEXES = [
+    ('ix_projects_user_id_id', 'projects', ['user_id', 'id'], None),
+    ('ix_chat_info_user_id', 'chat_info', ['user_id'], ['total_cost']),
+    ('ix_bpm_extraction_project_id_created_at', 'bpm_extraction', ['project_id', 'created_at'], None),
+    ('ix_report_as_is_project_id_user_id_id', 'report_as_is', ['project_id', 'user_id', 'id'], None),
+    ('ix_report_roadmap_project_id_user_id_id', 'report_roadmap', ['project_id', 'user_id', 'id'], None),
+    ('ix_report_maturity_project_id_user_id_id', 'report_maturity', ['project_id', 'user_id', 'id'], None),
+    ('ix_questionnaire_entries_project_id_user_id_category', 'questionnaire_entries', ['project_id', 'user_id', 'maturity_category'], None),
+    ('ix_roadmaps_project_id_user_id', 'roadmaps', ['project_id', 'user_id'], None),
+    ('ix_benchmark_model_project_id', 'benchmark_model', ['project_id'], None),
+]
+
+
+def upgrade() -> None:
+    # Built concurrently so that the tables stay writable on a running deployment
+    with op.get_context().autocommit_block():
+        for name, table, columns, include in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_include=include or [],
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
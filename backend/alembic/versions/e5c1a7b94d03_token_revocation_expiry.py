@@ -0,0 +1,33 @@
+"""Token revocation expiry
+
+Revision ID: e5c1a7b94d03
+Revises: d3b8e61f4a27
+Create Date: 2026-10-17 15:10:44.529187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c1a7b94d03'
+down_revision: Union[str, None] = 'd3b8e61f4a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('token_blacklist', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    op.add_column('token_blacklist', sa.Column('revoked_at', sa.DateTime(), server_default=sa.text("(now() AT TIME ZONE 'utc')"), nullable=False))
+    op.alter_column('token_blacklist', 'revoked_at', server_default=None)
+    op.create_index(op.f('ix_token_blacklist_expires_at'), 'token_blacklist', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_token_blacklist_revoked_at'), 'token_blacklist', ['revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_token_blacklist_revoked_at'), table_name='token_blacklist')
+    op.drop_index(op.f('ix_token_blacklist_expires_at'), table_name='token_blacklist')
+    op.drop_column('token_blacklist', 'revoked_at')
+    op.drop_column('token_blacklist', 'expires_at')
@@ -0,0 +1,75 @@
+"""Cost ledger rollups
+
+Revision ID: f7d24c9e1b58
+Revises: e5c1a7b94d03
+Create Date: 2026-10-17 16:05:12.840311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7d24c9e1b58'
+down_revision: Union[str, None] = 'e5c1a7b94d03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows have no timestamp; they are dated to the migration
+    op.add_column('chat_info', sa.Column('created_at', sa.DateTime(), server_default=sa.text("(now() AT TIME ZONE 'utc')"), nullable=False))
+    op.alter_column('chat_info', 'created_at', server_default=None)
+    op.add_column('chat_info', sa.Column('endpoint', sa.String(), nullable=True))
+    op.add_column('chat_info', sa.Column('project_id', sa.Integer(), nullable=True))
+    op.add_column('chat_info', sa.Column('model', sa.String(), nullable=True))
+    op.add_column('chat_info', sa.Column('prompt_tokens', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('chat_info', sa.Column('completion_tokens', sa.Integer(), server_default='0', nullable=False))
+    op.alter_column('chat_info', 'prompt_tokens', server_default=None)
+    op.alter_column('chat_info', 'completion_tokens', server_default=None)
+    op.create_foreign_key('chat_info_project_id_fkey', 'chat_info', 'projects', ['project_id'], ['id'], ondelete='SET NULL')
+
+    op.drop_index('ix_chat_info_user_id', table_name='chat_info', if_exists=True)
+    op.create_index('ix_chat_info_user_id_created_at', 'chat_info', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_chat_info_created_at', 'chat_info', ['created_at'], unique=False)
+
+    for table, day_column in (('cost_totals', None), ('cost_daily', sa.Column('day', sa.Date(), nullable=False))):
+        columns = [
+            sa.Column('scope', sa.String(length=16), nullable=False),
+            sa.Column('scope_id', sa.Integer(), nullable=False),
+        ]
+        if day_column is not None:
+            columns.append(day_column)
+        op.create_table(
+            table,
+            *columns,
+            sa.Column('total_cost', sa.Float(), nullable=False),
+            sa.Column('calls', sa.Integer(), nullable=False),
+            sa.Column('prompt_tokens', sa.BigInteger(), nullable=False),
+            sa.Column('completion_tokens', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint(*[column.name for column in columns])
+        )
+
+    # Backfill the rollups from the existing ledger
+    metrics = "COALESCE(SUM(total_cost), 0), COUNT(*), SUM(prompt_tokens), SUM(completion_tokens)"
+    op.execute(f"INSERT INTO cost_totals SELECT 'all', 0, {metrics} FROM chat_info HAVING COUNT(*) > 0")
+    op.execute(f"INSERT INTO cost_totals SELECT 'user', user_id, {metrics} FROM chat_info WHERE user_id IS NOT NULL GROUP BY user_id")
+    op.execute(f"INSERT INTO cost_daily SELECT 'all', 0, created_at::date, {metrics} FROM chat_info GROUP BY created_at::date")
+    op.execute(f"INSERT INTO cost_daily SELECT 'user', user_id, created_at::date, {metrics} FROM chat_info WHERE user_id IS NOT NULL GROUP BY user_id, created_at::date")
+
+
+def downgrade() -> None:
+    op.drop_table('cost_daily')
+    op.drop_table('cost_totals')
+    op.drop_index('ix_chat_info_created_at', table_name='chat_info')
+    op.drop_index('ix_chat_info_user_id_created_at', table_name='chat_info')
+    op.create_index('ix_chat_info_user_id', 'chat_info', ['user_id'], unique=False, postgresql_include=['total_cost'])
+    op.drop_constraint('chat_info_project_id_fkey', 'chat_info', type_='foreignkey')
+    op.drop_column('chat_info', 'completion_tokens')
+    op.drop_column('chat_info', 'prompt_tokens')
+    op.drop_column('chat_info', 'model')
+    op.drop_column('chat_info', 'project_id')
+    op.drop_column('chat_info', 'endpoint')
+    op.drop_column('chat_info', 'created_at')
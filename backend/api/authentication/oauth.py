@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from datetime import timedelta, datetime
 
 from fastapi import Depends, HTTPException, status
@@ -7,9 +8,12 @@ from sqlalchemy.orm import Session
 import config
 from api.schemas import schemas
 import uuid
-from database import get_db
+from database import get_db, release_connection
 
 from api.models import models
+from api.authentication.user_cache import get_user
+from api.authentication.revocation import is_token_revoked
+from ai_tools.intellichek.chains import current_usage_tracker
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/v1/login')
 
@@ -37,26 +41,26 @@ def create_access_token(data: dict):
     to_encode = data.copy()
     jti = str(uuid.uuid4())
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"expire": expire.strftime("%Y-%m-%d %H:%M:%S")})
+    to_encode.update({"jti": jti, "exp": expire})
 
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, ALGORITHM)
 
     return encoded_jwt
 
 
-def verify_token_access(token: str, credentials_exception):
+def verify_token_access(token: str, credentials_exception, db: Session):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
-        jti = payload.get("jti")
+        # Tokens without jti could not be revoked, tokens without exp would never expire
+        payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM, options={"require_exp": True, "require_jti": True})
 
-        if jti and db.query(models.TokenBlacklist).filter_by(jti=jti).first():
+        if is_token_revoked(db, payload["jti"]):
             raise credentials_exception
 
-        id: str = str(payload.get("user_id"))  # Convert to string
-        if id is None:
+        user_id = payload.get("user_id")
+        if user_id is None:
             raise credentials_exception
 
-        token_data = schemas.DataToken(id=id)
+        token_data = schemas.DataToken(id=str(user_id))
     except JWTError as e:
         print(e)
         raise credentials_exception
@@ -64,33 +68,57 @@ def verify_token_access(token: str, credentials_exception):
     return token_data
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                          detail="Could not Validate Credentials",
-                                          headers={"WWW-Authenticate": "Bearer"})
+@dataclass
+class AuthContext:
+    """The authenticated user of a request."""
+    user: models.User
 
-    token = verify_token_access(token, credentials_exception)
+    @property
+    def role(self) -> str:
+        return self.user.role
 
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+    @property
+    def is_admin(self) -> bool:
+        return self.user.role == "admin"
 
-    return user
 
-def get_current_user_role(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_auth_context(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> AuthContext:
+    """
+    Decode the token and load the user once per request.
+
+    FastAPI caches a dependency within a request, so `get_current_user`, `get_current_user_role`
+    and `check_admin_role` all share this result, however many of them a route uses. The user
+    belongs to the synchronous session of the request; async route handlers refer to it by id.
+    """
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                          detail="Could not validate credentials",
+                                          detail="Could not Validate Credentials",
                                           headers={"WWW-Authenticate": "Bearer"})
 
-    token_data = verify_token_access(token, credentials_exception)
+    token_data = verify_token_access(token, credentials_exception, db)
 
-    user = db.query(models.User).filter(models.User.id == token_data.id).first()
+    user = get_user(db, int(token_data.id))
 
     if user is None:
         raise credentials_exception
 
-    return user.role
+    # Async route handlers use their own session, the connection is not needed any more
+    release_connection(db)
 
-def check_admin_role(current_user_role: str = Depends(get_current_user_role)):
-    if current_user_role != "admin":
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User does not have admin role")
+    # The model calls of the request are charged to the user, also if the route fails before recording them
+    tracker = current_usage_tracker()
+    if tracker is not None:
+        tracker.attribute(user.id)
 
+    return AuthContext(user=user)
+
+
+def get_current_user(auth: AuthContext = Depends(get_auth_context)):
+    return auth.user
+
+def get_current_user_role(auth: AuthContext = Depends(get_auth_context)):
+    return auth.role
+
+def check_admin_role(auth: AuthContext = Depends(get_auth_context)):
+    if not auth.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User does not have admin role")
 
@@ -0,0 +1,139 @@
+"""
+Revocation of access tokens.
+
+A token is revoked on logout by storing its `jti` with the expiry of the token in the
+`token_blacklist` table. To avoid a query on every authenticated request, every process
+keeps the revoked jtis of the tokens that have not expired yet in memory:
+
+- Revocations of the own process are added immediately.
+- Revocations of the other workers are fetched incrementally every
+  `TOKEN_REVOCATION_REFRESH_SECONDS`, using the revocation time as watermark.
+- Entries of expired tokens are dropped from memory and purged from the table by a
+  background task, because the token itself is rejected once it has expired.
+
+A revoked token is therefore rejected immediately by the worker that handled the logout
+and by all other workers after at most the refresh interval.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import config
+from api.models import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Revocations committed by a slow transaction can carry a revocation time slightly before
+# the watermark; the refresh reads this far back to pick them up
+WATERMARK_OVERLAP = timedelta(seconds=60)
+
+class RevokedTokens:
+    """The revoked jtis of the tokens that have not expired yet, kept in memory."""
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._expiries: Dict[str, Optional[datetime]] = {}
+        self._watermark: Optional[datetime] = None
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, expires_at: Optional[datetime]) -> None:
+        with self._lock:
+            self._expiries[jti] = expires_at
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        """Return whether a jti is revoked, refreshing from the database if the interval has passed."""
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+            self.refresh(db)
+        with self._lock:
+            return jti in self._expiries
+
+    def refresh(self, db: Session) -> None:
+        """Load the revocations since the watermark and drop the entries of expired tokens."""
+        query = db.query(
+            models.TokenBlacklist.jti,
+            models.TokenBlacklist.expires_at,
+            models.TokenBlacklist.revoked_at
+        )
+        if self._watermark is not None:
+            query = query.filter(models.TokenBlacklist.revoked_at > self._watermark - WATERMARK_OVERLAP)
+        rows = query.all()
+
+        now = datetime.utcnow()
+        with self._lock:
+            for jti, expires_at, revoked_at in rows:
+                self._expiries[jti] = expires_at
+                if revoked_at is not None and (self._watermark is None or revoked_at > self._watermark):
+                    self._watermark = revoked_at
+            for jti in [jti for jti, expires_at in self._expiries.items() if expires_at is not None and expires_at < now]:
+                del self._expiries[jti]
+            self._refreshed_at = time.monotonic()
+
+revoked_tokens = RevokedTokens(config.TOKEN_REVOCATION_REFRESH_SECONDS)
+
+def is_token_revoked(db: Session, jti: str) -> bool:
+    """
+    Check whether the token with the given jti has been revoked.
+
+    Parameters:
+    - db: Database session, only used when the in-memory revocations are refreshed.
+    - jti: The JWT ID of the token.
+
+    Returns:
+    - True if the token has been revoked.
+    """
+    return revoked_tokens.is_revoked(db, jti)
+
+def revoke_token(db: Session, jti: str, expires_at: Optional[datetime]) -> None:
+    """
+    Revoke a token until it expires.
+
+    Parameters:
+    - db: Database session.
+    - jti: The JWT ID of the token.
+    - expires_at: The expiry of the token (UTC), after which the revocation is purged.
+    """
+    try:
+        db.add(models.TokenBlacklist(jti=jti, expires_at=expires_at))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    revoked_tokens.add(jti, expires_at)
+
+def purge_expired_revocations() -> int:
+    """
+    Delete the revocations of expired tokens from the database.
+
+    Returns:
+    - The number of deleted revocations.
+    """
+    db = SessionLocal()
+    try:
+        deleted = (
+            db.query(models.TokenBlacklist)
+            .filter(models.TokenBlacklist.expires_at < datetime.utcnow())
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+async def purge_expired_revocations_periodically() -> None:
+    """Background task that purges the revocations of expired tokens every `TOKEN_REVOCATION_PURGE_SECONDS`."""
+    while True:
+        try:
+            deleted = await asyncio.to_thread(purge_expired_revocations)
+            if deleted:
+                logger.info("Purged %s expired token revocations", deleted)
+        except Exception:
+            logger.exception("Purging the expired token revocations failed")
+        await asyncio.sleep(config.TOKEN_REVOCATION_PURGE_SECONDS)
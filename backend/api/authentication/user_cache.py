@@ -0,0 +1,94 @@
+"""
+Per-process cache of the user records loaded by the authentication dependency.
+
+Every authenticated request needs the user of its token. The cache keeps the column values
+of recently seen users for a short time (`USER_CACHE_TTL_SECONDS`), so that the user is not
+selected again on every request. Cached values are turned into a new `User` instance of the
+request's session without a query, so instances are never shared between sessions.
+
+Entries are invalidated when a user is updated or deleted through the API. Other workers
+keep their entry until it expires, so changes of a user take effect everywhere after at
+most the TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+import config
+from api.models import models
+
+class UserCache:
+    """A thread-safe TTL cache of user column values keyed by user id."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            values, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def set(self, user_id: int, values: Dict[str, Any]) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (values, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+user_cache = UserCache(config.USER_CACHE_TTL_SECONDS, config.USER_CACHE_MAX_ENTRIES)
+
+def _column_values(user: models.User) -> Dict[str, Any]:
+    return {attr.key: getattr(user, attr.key) for attr in inspect(models.User).column_attrs}
+
+def get_user(db: Session, user_id: int) -> Optional[models.User]:
+    """
+    Return the user with the given id as an instance of the given session.
+
+    Parameters:
+    - db: Database session.
+    - user_id: ID of the user.
+
+    Returns:
+    - User object or None if the user does not exist.
+    """
+    values = user_cache.get(user_id)
+    if values is None:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user is not None:
+            user_cache.set(user_id, _column_values(user))
+        return user
+
+    user = models.User(**values)
+    # Turn the new instance into a clean copy of the database row and attach it to the
+    # session without selecting it again
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+def invalidate_user(user_id: int) -> None:
+    """Remove a user from the cache of this process after the user was updated or deleted."""
+    user_cache.invalidate(user_id)
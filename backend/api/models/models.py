@@ -1,5 +1,6 @@
 # models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Float, TIMESTAMP, Boolean, text, ARRAY
+import zlib
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Date, DateTime, Text, Float, TIMESTAMP, Boolean, text, ARRAY, LargeBinary, Index, UniqueConstraint, JSON
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -41,6 +42,9 @@ class User(Base):
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        Index("ix_projects_user_id_id", "user_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
@@ -51,6 +55,8 @@ class Project(Base):
     questionnair_submitted = Column(Boolean, default=False)
     roadmap_created = Column(Boolean, default=False)
     report_created = Column(Boolean, default=False)
+    # SHA-256 of the last saved BPMN version, served as ETag by the autosave endpoints
+    bpmn_content_hash = Column(String(64))
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="projects")
@@ -69,26 +75,125 @@ class Project(Base):
 
 class BPMNData(Base):
     __tablename__ = "bpmn_data"
+    __table_args__ = (
+        Index("ix_bpmn_data_project_id_id", "project_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    content = Column(Text)
+    # Uncompressed XML of versions saved before the compressed storage was introduced
+    raw_content = Column("content", Text)
+    compressed_content = Column(LargeBinary)
+    content_hash = Column(String(64))
     project_id = Column(Integer, ForeignKey('projects.id'))  
     created_at = Column(TIMESTAMP(timezone=True), server_default=text('now()'))
 
     project = relationship("Project", back_populates="bpmn_data")
 
+    @property
+    def content(self) -> str:
+        """The BPMN XML of this version."""
+        if self.compressed_content is not None:
+            return zlib.decompress(self.compressed_content).decode("utf-8")
+        return self.raw_content
+
 class ChatInfo(Base):
+    """The cost ledger: one row per model call. Totals are read from CostTotal and CostDaily."""
     __tablename__ = "chat_info"
+    __table_args__ = (
+        # Paginated, time-ranged ledger of a user and of all users
+        Index("ix_chat_info_user_id_created_at", "user_id", "created_at"),
+        Index("ix_chat_info_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     total_cost = Column(Float)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    endpoint = Column(String)
+    # The ledger outlives the project, deleting a project keeps its costs
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="SET NULL"))
+    model = Column(String)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    # "model", or "cache" and "shared" for responses reused at zero cost
+    source = Column(String(16), nullable=False, default="model", server_default="model")
     user = relationship("User", back_populates="chat_info")
 
+# Scopes of the cost rollups: all users (scope_id 0), one user or one project
+COST_SCOPES = ("all", "user", "project")
+
+class CostTotal(Base):
+    """All-time cost rollup of a scope, maintained with every ledger write."""
+    __tablename__ = "cost_totals"
+
+    scope = Column(String(16), primary_key=True)
+    scope_id = Column(Integer, primary_key=True)
+    total_cost = Column(Float, nullable=False, default=0.0)
+    calls = Column(Integer, nullable=False, default=0)
+    # Calls answered from the cache or by an identical call in flight, included in `calls`
+    reused_calls = Column(Integer, nullable=False, default=0, server_default="0")
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+
+class CostDaily(Base):
+    """Daily cost rollup of a scope, maintained with every ledger write."""
+    __tablename__ = "cost_daily"
+
+    scope = Column(String(16), primary_key=True)
+    scope_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    total_cost = Column(Float, nullable=False, default=0.0)
+    calls = Column(Integer, nullable=False, default=0)
+    reused_calls = Column(Integer, nullable=False, default=0, server_default="0")
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+
+class LLMResponseCache(Base):
+    __tablename__ = "llm_response_cache"
+
+    key = Column(String(64), primary_key=True)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class Job(Base):
+    """A background job of `api.utils.jobs`: a report or evaluation generated outside of the request."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Next due job of the queue
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        # Running and queued jobs of a user, for the per-user caps
+        Index("ix_jobs_user_id_status", "user_id", "status"),
+        # At most one queued or running job per kind, user, project and language
+        Index(
+            "ux_jobs_dedup_key_in_flight", "dedup_key", unique=True,
+            postgresql_where=text("status IN ('queued', 'running')")
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    language = Column(String, nullable=False)
+    dedup_key = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
 class TokenBlacklist(Base):
     __tablename__ = 'token_blacklist'
 
     jti = Column(String, primary_key=True)
+    # Expiry of the revoked token, after which the row is purged
+    expires_at = Column(DateTime, index=True)
+    # Watermark of the incremental refresh of the in-memory revocations
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
 
 class BPMNTemplate(Base):
     __tablename__ = "bpm_templates"
@@ -100,6 +205,9 @@ class BPMNTemplate(Base):
 
 class BPMNExtraction(Base):
     __tablename__ = "bpm_extraction"
+    __table_args__ = (
+        Index("ix_bpm_extraction_project_id_created_at", "project_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text)
@@ -109,60 +217,60 @@ class BPMNExtraction(Base):
     project = relationship("Project", back_populates="bpmn_extraction")
     user = relationship("User", back_populates="bpmn_extraction")
 
-class MaturityModelTechnology(Base):
-    __tablename__ = 'maturity_model_technology'
+class MaturityAssessment(Base):
+    """
+    The maturity levels of all dimensions (technology, process, information, organisation)
+    in one table. The per-dimension models below are single-table-inheritance views on it,
+    so their queries are automatically restricted to their dimension.
+    """
+    __tablename__ = 'maturity_assessment'
+    __table_args__ = (
+        # Also the composite index of every per-project lookup, and the ON CONFLICT target of upserts
+        UniqueConstraint("project_id", "user_id", "dimension", "label", name="uq_maturity_assessment_project_user_dimension_label"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    dimension = Column(String(32), nullable=False)
     label = Column(String, nullable=False)
     level = Column(Integer, nullable=False)
     justification = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey('users.id')) 
     project_id = Column(Integer, ForeignKey('projects.id')) 
 
+    __mapper_args__ = {"polymorphic_on": dimension}
+
+# Order in which the dimensions are listed when all of them are returned together
+MATURITY_DIMENSION_ORDER = ["organisation", "technology", "information", "process"]
+
+class MaturityModelTechnology(MaturityAssessment):
+    __mapper_args__ = {"polymorphic_identity": "technology"}
+
     user = relationship("User", back_populates="maturity_model_technology")  
     project = relationship("Project", back_populates="maturity_model_technology")  
 
-class MaturityModelProcess(Base):
-    __tablename__ = 'maturity_model_process'
-
-    id = Column(Integer, primary_key=True, index=True)
-    label = Column(String, nullable=False)
-    level = Column(Integer, nullable=False)
-    justification = Column(String, nullable=False)
-    user_id = Column(Integer, ForeignKey('users.id')) 
-    project_id = Column(Integer, ForeignKey('projects.id')) 
+class MaturityModelProcess(MaturityAssessment):
+    __mapper_args__ = {"polymorphic_identity": "process"}
 
     user = relationship("User", back_populates="maturity_model_process")  
     project = relationship("Project", back_populates="maturity_model_process") 
 
-class MaturityModelInformation(Base):
-    __tablename__ = 'maturity_model_information'
-
-    id = Column(Integer, primary_key=True, index=True)
-    label = Column(String, nullable=False)
-    level = Column(Integer, nullable=False)
-    justification = Column(String, nullable=False)
-    user_id = Column(Integer, ForeignKey('users.id')) 
-    project_id = Column(Integer, ForeignKey('projects.id')) 
+class MaturityModelInformation(MaturityAssessment):
+    __mapper_args__ = {"polymorphic_identity": "information"}
 
     user = relationship("User", back_populates="maturity_model_information")  
     project = relationship("Project", back_populates="maturity_model_information") 
 
-class MaturityModelOrganisation(Base):
-    __tablename__ = 'maturity_model_organisation'
-
-    id = Column(Integer, primary_key=True, index=True)
-    label = Column(String, nullable=False)
-    level = Column(Integer, nullable=False)
-    justification = Column(String, nullable=False)
-    user_id = Column(Integer, ForeignKey('users.id')) 
-    project_id = Column(Integer, ForeignKey('projects.id')) 
+class MaturityModelOrganisation(MaturityAssessment):
+    __mapper_args__ = {"polymorphic_identity": "organisation"}
 
     user = relationship("User", back_populates='maturity_model_organisation')  
     project = relationship("Project", back_populates='maturity_model_organisation') 
 
 class ReportAsIs(Base):
     __tablename__ = 'report_as_is'
+    __table_args__ = (
+        Index("ix_report_as_is_project_id_user_id_id", "project_id", "user_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text)
@@ -174,6 +282,9 @@ class ReportAsIs(Base):
     
 class ReportRoadmap(Base):
     __tablename__ = 'report_roadmap'
+    __table_args__ = (
+        Index("ix_report_roadmap_project_id_user_id_id", "project_id", "user_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text)
@@ -183,8 +294,30 @@ class ReportRoadmap(Base):
     user = relationship("User", back_populates='report_roadmap')  
     project = relationship("Project", back_populates='report_roadmap') 
     
+class ReportSummary(Base):
+    """
+    Summary stage of a report (the description of the process, the maturity evaluation or the
+    roadmap), reused by the reports generated from the same input, e.g. in another language.
+    """
+    __tablename__ = 'report_summary'
+    __table_args__ = (
+        # One summary per project, report kind and summary call (see `report_summary_key`)
+        UniqueConstraint("project_id", "kind", "input_hash", name="uq_report_summary_project_id_kind_input_hash"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id', ondelete="CASCADE"), nullable=False)
+    kind = Column(String(16), nullable=False)
+    input_hash = Column(String(64), nullable=False)
+    content = Column(Text, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
 class ReportMaturity(Base):
     __tablename__ = 'report_maturity'
+    __table_args__ = (
+        Index("ix_report_maturity_project_id_user_id_id", "project_id", "user_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text)
@@ -196,6 +329,9 @@ class ReportMaturity(Base):
 
 class QuestionnaireEntry(Base):
     __tablename__ = "questionnaire_entries"
+    __table_args__ = (
+        Index("ix_questionnaire_entries_project_id_user_id_category", "project_id", "user_id", "maturity_category"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
@@ -211,6 +347,9 @@ class QuestionnaireEntry(Base):
 
 class Roadmap(Base):
     __tablename__ = 'roadmaps'
+    __table_args__ = (
+        Index("ix_roadmaps_project_id_user_id", "project_id", "user_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     kma = Column(String, index=True)
     start_date = Column(String, index=True)
@@ -227,6 +366,9 @@ class Roadmap(Base):
 
 class BenchmarkModel(Base):
     __tablename__ = 'benchmark_model'
+    __table_args__ = (
+        Index("ix_benchmark_model_project_id", "project_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     kma = Column(String, index=True)
@@ -9,14 +9,18 @@ Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
 
+from datetime import datetime
 from fastapi import HTTPException, Depends, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
 from fastapi import APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
-from database import get_db
+from database import arelease_connection, get_async_db, get_db
 from api.authentication.oauth import create_access_token, oauth2_scheme
-from api.utils.utils import verify_password 
+from api.authentication.revocation import revoke_token
+from api.utils.utils import averify_and_update_password, password_hasher
+from api.authentication.oauth import check_admin_role
 from jose import JWTError, jwt
 import config
 from api.models import models
@@ -40,7 +44,7 @@ router = APIRouter(tags=['Authentication'])
 
         Args:
         - userdetails (OAuth2PasswordRequestForm): User credentials.
-        - db (Session): Database session.
+        - db (AsyncSession): Async database session.
 
         Returns:
         - dict: Dictionary containing the access token and token type.
@@ -50,11 +54,11 @@ router = APIRouter(tags=['Authentication'])
         """
     )
 )
-def login(
+async def login(
     userdetails: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     ):
-    user = db.query(models.User).filter(models.User.email == userdetails.username).first()
+    user = (await db.scalars(select(models.User).where(models.User.email == userdetails.username).limit(1))).first()
 
     if not user:
         raise HTTPException(
@@ -62,11 +66,20 @@ def login(
             detail="The User does not exist"
         )
 
-    if not verify_password(userdetails.password, user.password):
+    # The connection is not held while the password is verified
+    await arelease_connection(db)
+    valid, new_hash = await averify_and_update_password(userdetails.password, user.password)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="The Passwords do not match"
         )
+
+    # The stored hash uses another bcrypt cost than configured
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
         
     if not user.email_active:
         raise HTTPException(status_code=400, detail="Please confirm your email before logging in.")
@@ -75,6 +88,26 @@ def login(
     
     return {"access_token": access_token, "token_type": "bearer"}
 
+@router.get(
+    '/password_hashing_stats',
+    dependencies=[Depends(check_admin_role)],
+    summary="Get Password Hashing Statistics (Admin Only)",
+    description=(
+        """Get Password Hashing Statistics: Retrieve the queue depth and wait times of the password hashing pool.
+
+        Passwords are hashed and verified in a dedicated, bounded thread pool of this process. The statistics
+        show how many hashes are waiting and running, how long they waited for a worker and how many were
+        rejected because the queue was full.
+
+        Returns:
+        - dict: The statistics of the password hashing pool.
+        """
+    ),
+    response_model=dict
+)
+async def get_password_hashing_stats():
+    return password_hasher.stats()
+
 @router.post(
     '/logout',
     summary="User Logout",
@@ -111,11 +144,8 @@ def logout(
         jti = payload.get("jti")
 
         if jti:
-            try:
-                db.add(models.TokenBlacklist(jti=jti))
-                db.commit()
-            except IntegrityError:
-                pass
+            exp = payload.get("exp")
+            revoke_token(db, jti, datetime.utcfromtimestamp(exp) if exp else None)
 
         return {"message": "Logout successful"}
 
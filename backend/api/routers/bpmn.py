@@ -9,15 +9,21 @@ Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
 
-from typing import List
-from fastapi import HTTPException, Depends
+import asyncio
+from typing import List, Optional
+from fastapi import HTTPException, Depends, Header, Response
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.models import models
 from api.schemas import schemas
 from fastapi import APIRouter
-from database import get_db
+from database import get_async_db, get_db
 from api.authentication.oauth import get_current_user
+from ai_tools.intellichek.bpmn_parser import BPMNParseError
+from api.utils.helpers import (
+    abpmn_content, aget_last_bpmn_data, aget_project_bpmn_hash, aparse_bpmn_data, asave_bpmn_version, bpmn_content_hash
+)
 
 router = APIRouter(tags=['BPMN'])
 
@@ -204,6 +210,19 @@ def delete_template(
     db.commit()
     return {"message": "BPMN template deleted successfully."}
 
+def _etag(content_hash: str) -> str:
+    return f'"{content_hash}"'
+
+def _etag_matches(header: Optional[str], content_hash: Optional[str]) -> bool:
+    """Check an If-Match/If-None-Match header value against the stored content hash."""
+    if not header or content_hash is None:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/").strip('"') == content_hash:
+            return True
+    return False
+
 @router.post(
     "/autosave/",
     summary="Autosave BPMN Data",
@@ -211,46 +230,78 @@ def delete_template(
         """Autosave BPMN Data: Save BPMN data associated with a project.
 
         This endpoint allows the authenticated user to autosave BPMN data for a specific project.
+        The data is stored compressed, and nothing is written if it equals the last saved version.
+        Older versions are thinned out according to the BPMN history retention policy.
+
+        The SHA-256 of the last saved version is returned as ETag. Instead of the full XML, an idle 
+        editor can send a heartbeat containing only `content_hash` (or an `If-None-Match` header); if it 
+        matches the stored hash, the request is a no-op that does not touch the BPMN history. An 
+        `If-Match` header makes the save conditional on the stored version being the expected one.
 
         Args:
-        - bpmn_data (schemas.BPMNDataSchema): The BPMN data to be saved.
+        - bpmn_data (schemas.BPMNDataSchema): The BPMN data to be saved, or only its content hash.
         - project_id (str): The ID of the project to associate the BPMN data with.
-        - db (Session): Database session dependency.
+        - if_match (str): Optional ETag the stored version must match.
+        - if_none_match (str): Optional ETag of the content the client already saved.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
-        - dict: A message indicating the success of the operation.
+        - dict: A message indicating the success of the operation and the content hash.
 
         Raises:
-        - HTTPException: If the project is not found, the user is not authorized, or an error occurs during the save operation.
+        - HTTPException: If the project is not found, the user is not authorized, the If-Match 
+          precondition fails (412), a heartbeat does not match the stored version (409), or an error 
+          occurs during the save operation.
         """
     )
 )
 async def autosave_bpmn(
     bpmn_data: schemas.BPMNDataSchema,
-    project_id: str,
-    db: Session = Depends(get_db),
+    project_id: int,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
 
         if current_user.role != "admin" and project.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Forbidden: You do not have permission to save data for this project.")
 
-        db_entry = models.BPMNData(content=bpmn_data.bpmnData, project_id=project.id)
-        db.add(db_entry)
-        db.commit()
+        stored_hash = await aget_project_bpmn_hash(db, project)
+
+        if if_match and not _etag_matches(if_match, stored_hash):
+            raise HTTPException(status_code=412, detail="BPMN data was changed in the meantime.")
+
+        if bpmn_data.bpmnData is None:
+            if bpmn_data.content_hash is None and not if_none_match:
+                raise HTTPException(status_code=422, detail="Either bpmnData or content_hash is required.")
+            if stored_hash is None or not (
+                bpmn_data.content_hash == stored_hash or _etag_matches(if_none_match, stored_hash)
+            ):
+                raise HTTPException(status_code=409, detail="BPMN data changed, send the full content.")
+
+            await db.commit()
+            response.headers["ETag"] = _etag(stored_hash)
+            return {"message": "BPMN data unchanged.", "content_hash": stored_hash}
+
+        db_entry = await asave_bpmn_version(db, project, bpmn_data.bpmnData)
+        await db.commit()
+        response.headers["ETag"] = _etag(project.bpmn_content_hash)
+
+        if db_entry is None:
+            return {"message": "BPMN data unchanged.", "content_hash": project.bpmn_content_hash}
 
-        return {"message": "BPMN data saved successfully."}
+        return {"message": "BPMN data saved successfully.", "content_hash": project.bpmn_content_hash}
 
     except SQLAlchemyError as e: 
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=repr(e))
-    finally:
-        db.close()
 
 @router.get(
     "/lastsave/{project_id}/",
@@ -259,14 +310,17 @@ async def autosave_bpmn(
         """Get Last Saved BPMN Data: Retrieve the last saved version of BPMN data for a project.
 
         This endpoint allows the authenticated user to retrieve the most recent BPMN data associated with a specific project.
+        The content hash of the version is returned as ETag; if the client sends it back in 
+        `If-None-Match`, the endpoint answers 304 Not Modified without loading the BPMN data.
 
         Args:
         - project_id (str): The ID of the project to retrieve the BPMN data for.
-        - db (Session): Database session dependency.
+        - if_none_match (str): Optional ETag of the version the client already has.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
-        - dict: The last saved BPMN data.
+        - dict: The last saved BPMN data and its content hash.
 
         Raises:
         - HTTPException: If the project is not found, the user is not authorized, or an error occurs during the retrieval operation.
@@ -274,26 +328,83 @@ async def autosave_bpmn(
     )
 )
 async def get_last_saved_bpmn(
-    project_id: str,
-    db: Session = Depends(get_db),
+    project_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
 
         if current_user.role != "admin" and project.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Forbidden: You do not have permission to access data for this project.")
 
-        last_saved_data = db.query(models.BPMNData).filter(models.BPMNData.project_id == project.id).order_by(models.BPMNData.created_at.desc()).first()
+        if project.bpmn_content_hash is not None and _etag_matches(if_none_match, project.bpmn_content_hash):
+            return Response(status_code=304, headers={"ETag": _etag(project.bpmn_content_hash)})
+
+        last_saved_data = await aget_last_bpmn_data(db, project.id)
         
         if not last_saved_data:
             return {"message": "No BPMN data found for the project."}
 
-        return {"bpmnData": last_saved_data.content}
+        content = await abpmn_content(last_saved_data)
+        if project.bpmn_content_hash is None:
+            project.bpmn_content_hash = last_saved_data.content_hash or await asyncio.to_thread(bpmn_content_hash, content)
+            await db.commit()
+
+        response.headers["ETag"] = _etag(project.bpmn_content_hash)
+        return {"bpmnData": content, "content_hash": project.bpmn_content_hash}
 
     except SQLAlchemyError as e: 
         raise HTTPException(status_code=500, detail=repr(e))
-    finally:
-        db.close()
+
+@router.get(
+    "/structure/{project_id}/",
+    summary="Get Structure of the Last Saved BPMN Data",
+    description=(
+        """Get BPMN Structure: Retrieve the tasks, events and gateways of the last saved BPMN data for a project.
+
+        This endpoint parses the most recent BPMN data of a project into its tasks, events and gateways 
+        with their names, user descriptions, maturity levels and lanes, ordered along the sequence flows, 
+        and the sequence flows between them.
+
+        Args:
+        - project_id (str): The ID of the project to retrieve the BPMN structure for.
+        - db (AsyncSession): Async database session dependency.
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - dict: The elements and sequence flows of the process map.
+
+        Raises:
+        - HTTPException: If the project or BPMN data is not found, the user is not authorized, the BPMN data 
+          cannot be parsed, or an error occurs during the retrieval operation.
+        """
+    )
+)
+async def get_bpmn_structure(
+    project_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    try:
+        project = await db.get(models.Project, project_id)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found.")
+
+        if current_user.role != "admin" and project.user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Forbidden: You do not have permission to access data for this project.")
+
+        last_saved_data = await aget_last_bpmn_data(db, project.id)
+        if not last_saved_data:
+            raise HTTPException(status_code=404, detail="No BPMN data found for the project.")
+
+        return (await aparse_bpmn_data(last_saved_data)).to_dict()
+
+    except BPMNParseError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except SQLAlchemyError as e: 
+        raise HTTPException(status_code=500, detail=repr(e))
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from api.models import models
-from database import get_db
+from database import arelease_connection, get_async_db, get_db
 from api.utils.email_utils import send_email
 from api.utils import token_utils as token_utils
-from api.utils.utils import hash_pass
+from api.utils.utils import ahash_pass
+from api.authentication.user_cache import invalidate_user
 from fastapi.templating import Jinja2Templates
 from api.utils.token_utils import verify_confirmation_token
 from pathlib import Path
@@ -40,19 +43,21 @@ def password_reset_request(email: str, db: Session = Depends(get_db)):
 
 
 @router.post("/password-reset")
-def reset_password(token: str, new_password: str, db: Session = Depends(get_db)):
+async def reset_password(token: str, new_password: str, db: AsyncSession = Depends(get_async_db)):
     email = token_utils.verify_reset_token(token)
 
     if not email:
         raise HTTPException(status_code=400, detail="Invalid or expired token.")
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = (await db.scalars(select(models.User).where(models.User.email == email).limit(1))).first()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
 
-    user.password = hash_pass(new_password)
-    db.commit()
+    await arelease_connection(db)
+    user.password = await ahash_pass(new_password)
+    await db.commit()
+    invalidate_user(user.id)
 
     return {"message": "Password reset successful."}
 
@@ -74,5 +79,6 @@ def confirm_email(token: str, db: Session = Depends(get_db)):
 
     user.email_active = True
     db.commit()
+    invalidate_user(user.id)
 
     return {"message": "Email confirmed successfully."}
@@ -8,33 +8,34 @@ Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
 
+import asyncio
 from typing import Optional
 
 from fastapi import HTTPException, Depends, APIRouter, Query # type: ignore
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from ai_tools.intellichek.evaluation_technology import evaluate_technology
 from ai_tools.intellichek.evaluation_information import evaluate_information
 from ai_tools.intellichek.evaluation_process import evaluate_process
-from ai_tools.intellichek.extraction import extraction_process
-from ai_tools.intellichek.helpers import sanitize_bpmn
-from api.utils.helpers import get_last_bpmn_data_for_user, get_last_bpmn_extraction_for_user
+from ai_tools.intellichek.extraction import estimate_extraction_process, extraction_process
+from ai_tools.intellichek.report import estimate_report_summary
+from ai_tools.intellichek.token_budget import count_tokens, model_name_of
+from api.utils.helpers import (
+    aget_last_bpmn_data_for_user, aget_last_bpmn_extraction_for_user, amerge_maturity_entries, aparse_bpmn_data
+)
 from langchain.chat_models import ChatOpenAI
-import config
+from ai_tools.intellichek.providers import aget_chat_model
+from api.utils.costs import record_llm_cost
 from api.models import models
-from database import get_db
+import config
+from database import arelease_connection, get_async_db, get_db
 from api.authentication.oauth import get_current_user
 
 router = APIRouter(tags=['Extraction and Evaluation AI'])
 
-openai_api_key = config.OPENAI_API_KEY 
-
-if not openai_api_key:
-    raise ValueError("OpenAI API key not found in environment variables.")
-
-model = ChatOpenAI(temperature=float(config.TEMPERATURE), model=config.GPT_MODEL)
-
 class ChatMessage(BaseModel):
     """Model representing the input string for A.I. conversation."""
     human_message: str
@@ -53,6 +54,15 @@ class UserChatLanguage(BaseModel):
     """Model representing user-specific settings for A.I. conversation."""
     language: Optional[str] = "English"
 
+# Maturity dimensions evaluated by the AI in /evaluate_all: the AI evaluation function, the table
+# the results are stored in and the questionnaire category whose answers override the AI levels.
+# The organisation dimension is taken from the questionnaire only, as in /evaluate_organisation.
+MATURITY_DIMENSIONS = {
+    "technology": (evaluate_technology, models.MaturityModelTechnology, None),
+    "information": (evaluate_information, models.MaturityModelInformation, "Information"),
+    "process": (evaluate_process, models.MaturityModelProcess, None),
+}
+
 class ProcessDescriptionRequest(BaseModel):
     file_content: str
     glossary_content: str
@@ -71,7 +81,7 @@ class ProcessDescriptionRequest(BaseModel):
         - chat_message (ChatMessage): The chat message content for extraction.
         - chat_settings (UserChatSettings): User-specific chat settings.
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -88,42 +98,45 @@ async def extract_bpmn_data(
     chat_settings: UserChatSettings, 
     project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        last_saved_data = get_last_bpmn_data_for_user(db, current_user.id, project_id)
+        last_saved_data = await aget_last_bpmn_data_for_user(db, current_user.id, project_id)
   
         if not last_saved_data:
             raise HTTPException(status_code=404, detail="No BPMN data found for the project.")
         
-        sanitized_data = sanitize_bpmn(last_saved_data.content)
-        response, total_cost = await extraction_process(sanitized_data, chat_settings.language, model)
+        process_map = (await aparse_bpmn_data(last_saved_data)).to_text()
+        await arelease_connection(db)
+        response, total_cost = await extraction_process(process_map, chat_settings.language, model)
 
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
        
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
 
-        bpmn_extracted = db.query(models.BPMNExtraction).filter(models.BPMNExtraction.project_id == project.id).first()
+        bpmn_extracted = (await db.scalars(
+            select(models.BPMNExtraction).where(models.BPMNExtraction.project_id == project.id).limit(1)
+        )).first()
         
         if not bpmn_extracted:
-            bpmn_extracted = models.BPMNExtraction(content=response, project_id=project.id, user=current_user)
+            bpmn_extracted = models.BPMNExtraction(content=response, project_id=project.id, user_id=current_user.id)
             db.add(bpmn_extracted)
         else:
             bpmn_extracted.content = response
 
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
 
-        db.commit()
+        await db.commit()
         return {"message": response, "diagram_id": chat_settings.diagram_id}
 
     except HTTPException as http_error:
-        db.rollback()
+        await db.rollback()
         raise http_error
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 @router.get(
@@ -175,6 +188,69 @@ def get_last_bpmn_extraction_content(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+def _token_estimate(process_map: str, language: str, model: ChatOpenAI) -> dict:
+    model_name = model_name_of(model)
+    extraction = estimate_extraction_process(process_map, language, model)
+    return {
+        "model": model_name,
+        "budget": config.LLM_INPUT_TOKEN_BUDGET,
+        "process_map_tokens": count_tokens(process_map, model_name),
+        "parts": extraction["calls"],
+        "extraction": extraction,
+        "as_is_report_summary": estimate_report_summary("as_is", process_map, model),
+    }
+
+@router.get(
+    "/token_estimate",
+    summary="Estimate the tokens of the AI requests for the BPMN file",
+    description=(
+        """Estimate Tokens: Estimate the prompt tokens and cost of the AI requests for the last saved BPMN file.
+
+        The process map of the last saved BPMN data of the project is counted with the tokenizer of the
+        configured model. Process maps whose prompt exceeds the token budget (`LLM_INPUT_TOKEN_BUDGET`) are
+        split into parts that are sent to the model concurrently; the estimate lists the number of calls, the prompt
+        tokens of all calls and of the largest call, and the cost of the prompt tokens in USD for the
+        extraction and the summary stage of the As-Is report. No model is called.
+
+        Args:
+        - project_id (int): The ID of the project.
+        - language (str): The language of the responses.
+        - db (AsyncSession): Async database session dependency.
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - dict: A dictionary containing the token counts and estimates.
+
+        Raises:
+        - HTTPException: If no BPMN data is found, or an error occurs during the estimation.
+        """
+    ),
+    response_model=dict
+)
+async def estimate_bpmn_tokens(
+    project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
+    language: str = Query("English", description="Language of the responses."),
+    current_user: models.User = Depends(get_current_user),
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        last_saved_data = await aget_last_bpmn_data_for_user(db, current_user.id, project_id)
+
+        if not last_saved_data:
+            raise HTTPException(status_code=404, detail="No BPMN data found for the project.")
+
+        process_map = (await aparse_bpmn_data(last_saved_data)).to_text()
+        await arelease_connection(db)
+        # Tokenizing a large process map is CPU bound
+        return await asyncio.to_thread(_token_estimate, process_map, language, model)
+
+    except HTTPException as http_error:
+        raise http_error
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
 @router.post(
     "/evaluate_technology", 
     summary="Maturity Model Technology",
@@ -188,7 +264,7 @@ def get_last_bpmn_extraction_content(
         - chat_message (ChatMessage): Chat message content for evaluation.
         - chat_settings (UserChatSettings): User chat settings.
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -205,59 +281,32 @@ async def add_string_maturity(
     chat_settings: UserChatSettings, 
     project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        last_saved_extraction = get_last_bpmn_extraction_for_user(db, current_user.id, project_id)
+        last_saved_extraction = await aget_last_bpmn_extraction_for_user(db, current_user.id, project_id)
   
         if not last_saved_extraction:
             raise HTTPException(status_code=404, detail="No BPMN extraction found for the project.")
         
         result = last_saved_extraction.content
+        await arelease_connection(db)
         response, total_cost = await evaluate_technology(result, chat_settings.language, model)
         
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
 
-        db.query(models.MaturityModelTechnology).filter(
-            models.MaturityModelTechnology.user_id == current_user.id,
-            models.MaturityModelTechnology.project_id == project_id
-        ).delete()
-
-        response_data = []
-        for chat_message in response:
-            label = chat_message.get("Label")
-            level = chat_message.get("Level")
-            justification = chat_message.get("Justification")
-            response_data.append({
-                "label": label,
-                "level": level,
-                "justification": justification
-            })
-
-        model_instances = [
-            models.MaturityModelTechnology(
-                label=data["label"],
-                level=int(data["level"]),
-                justification=data["justification"],
-                user_id=current_user.id,
-                project_id=project_id
-            )
-            for data in response_data
-        ]
-
-        for instance in model_instances:
-            db.add(instance)
+        await amerge_maturity_entries(db, models.MaturityModelTechnology, current_user.id, project_id, ai_response=response)
 
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
+        await db.commit()
 
         return {"message": response, "diagram_id": chat_settings.diagram_id}
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 @router.post(
@@ -273,7 +322,7 @@ async def add_string_maturity(
         - chat_message (ChatMessage): Chat message content for evaluation.
         - chat_settings (UserChatSettings): User chat settings.
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -290,109 +339,43 @@ async def add_string_maturity(
     chat_settings: UserChatSettings, 
     project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
         
-        last_saved_extraction = get_last_bpmn_extraction_for_user(db, current_user.id, project_id)
+        last_saved_extraction = await aget_last_bpmn_extraction_for_user(db, current_user.id, project_id)
   
         if not last_saved_extraction:
             raise HTTPException(status_code=404, detail="No BPMN extraction found for the project.")
         
         result = last_saved_extraction.content
+        await arelease_connection(db)
         response, total_cost = await evaluate_information(result, chat_settings.language, model)
         print(response)
       
 
-        db.query(models.MaturityModelInformation).filter(
-            models.MaturityModelInformation.user_id == current_user.id,
-            models.MaturityModelInformation.project_id == project_id
-        ).delete()
-
-        response_data = []
-        for message in response:
-            label = message.get("Label")
-            level = message.get("Level")
-            justification = message.get("Justification")
-            response_data.append({
-                "label": label,
-                "level": level,
-                "justification": justification
-            })
-
-        for data in response_data:
-            existing_entry = db.query(models.MaturityModelInformation).filter(
-                models.MaturityModelInformation.user_id == current_user.id,
-                models.MaturityModelInformation.project_id == project_id,
-                models.MaturityModelInformation.label == data["label"]
-            ).first()
-
-            if existing_entry:
-                existing_entry.level = data["level"]
-                existing_entry.justification = data["justification"]
-                db.add(existing_entry)
-            else:
-                new_entry = models.MaturityModelInformation(
-                    label=data["label"],
-                    level=data["level"],
-                    justification=data["justification"],
-                    user_id=current_user.id,
-                    project_id=project_id
-                )
-                db.add(new_entry)
-
-        entries = db.query(models.QuestionnaireEntry).filter(
+        entries = (await db.scalars(select(models.QuestionnaireEntry).where(
             models.QuestionnaireEntry.user_id == current_user.id,
             models.QuestionnaireEntry.project_id == project_id,
             models.QuestionnaireEntry.maturity_category == "Information"
-        ).all()
-
-        for entry in entries:
-            existing_entry = db.query(models.MaturityModelInformation).filter(
-                models.MaturityModelInformation.user_id == current_user.id,
-                models.MaturityModelInformation.project_id == project_id,
-                models.MaturityModelInformation.label == entry.category
-            ).first()
-
-            if existing_entry:
-                existing_entry.level = entry.answer_number
-                existing_entry.justification = entry.description
-                db.add(existing_entry)
-            else:
-                new_entry = models.MaturityModelInformation(
-                    label=entry.category,
-                    level=entry.answer_number,
-                    justification=entry.description,
-                    user_id=current_user.id,
-                    project_id=project_id
-                )
-                db.add(new_entry)
-
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
-
-        combined_results = db.query(models.MaturityModelInformation).filter(
-            models.MaturityModelInformation.user_id == current_user.id,
-            models.MaturityModelInformation.project_id == project_id
-        ).all()
-
-        response_data = [
-            {
-                "label": entry.label,
-                "level": entry.level,
-                "justification": entry.justification
-            }
-            for entry in combined_results
-        ]
+        ))).all()
+
+        response_data = await amerge_maturity_entries(
+            db, models.MaturityModelInformation, current_user.id, project_id,
+            ai_response=response, questionnaire_entries=entries
+        )
+
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
+        await db.commit()
 
         return {"message": "Information maturity data evaluated and saved successfully", "data": response_data}
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 @router.post(
@@ -408,7 +391,7 @@ async def add_string_maturity(
         - chat_message (ChatMessage): Chat message content for evaluation.
         - chat_settings (UserChatSettings): User chat settings.
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -425,59 +408,32 @@ async def add_string_maturity(
     chat_settings: UserChatSettings, 
     project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        last_saved_extraction = get_last_bpmn_extraction_for_user(db, current_user.id, project_id)
+        last_saved_extraction = await aget_last_bpmn_extraction_for_user(db, current_user.id, project_id)
   
         if not last_saved_extraction:
             raise HTTPException(status_code=404, detail="No BPMN extraction found for the project.")
         
         result = last_saved_extraction.content
+        await arelease_connection(db)
         response, total_cost = await evaluate_process(result, chat_settings.language, model)
         
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
 
-        db.query(models.MaturityModelProcess).filter(
-            models.MaturityModelProcess.user_id == current_user.id,
-            models.MaturityModelProcess.project_id == project_id
-        ).delete()
-
-        response_data = []
-        for chat_message in response:
-            label = chat_message.get("Label")
-            level = chat_message.get("Level")
-            justification = chat_message.get("Justification")
-            response_data.append({
-                "label": label,
-                "level": level,
-                "justification": justification
-            })
-
-        model_instances = [
-            models.MaturityModelProcess(
-                label=data["label"],
-                level=int(data["level"]),
-                justification=data["justification"],
-                user_id=current_user.id,
-                project_id=project_id
-            )
-            for data in response_data
-        ]
-
-        for instance in model_instances:
-            db.add(instance)
+        await amerge_maturity_entries(db, models.MaturityModelProcess, current_user.id, project_id, ai_response=response)
 
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
+        await db.commit()
 
         return {"message": response, "diagram_id": chat_settings.diagram_id}
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 @router.post(
@@ -491,7 +447,7 @@ async def add_string_maturity(
 
         Args:
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -506,54 +462,139 @@ async def add_string_maturity(
 async def evaluate_organisation(
     project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
 
-        entries = db.query(models.QuestionnaireEntry).filter(
+        entries = (await db.scalars(select(models.QuestionnaireEntry).where(
             models.QuestionnaireEntry.user_id == current_user.id,
             models.QuestionnaireEntry.project_id == project_id,
             models.QuestionnaireEntry.maturity_category == "Organization"
-        ).all()
+        ))).all()
 
         if not entries:
             raise HTTPException(status_code=404, detail="No questionnaire entries found for the project and user in the Organization category.")
 
-        db.query(models.MaturityModelOrganisation).filter(
-            models.MaturityModelOrganisation.user_id == current_user.id,
-            models.MaturityModelOrganisation.project_id == project_id
-        ).delete()
-
-        model_instances = [
-            models.MaturityModelOrganisation(
-                label=entry.category,
-                level=entry.answer_number,
-                justification=entry.description,
-                user_id=current_user.id,
-                project_id=project_id
+        response_data = await amerge_maturity_entries(
+            db, models.MaturityModelOrganisation, current_user.id, project_id, questionnaire_entries=entries
+        )
+
+        await db.commit()
+
+        return {"message": "Organisation maturity data evaluated and saved successfully", "data": response_data}
+    
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+@router.post(
+    "/evaluate_all",
+    summary="Maturity Model All Dimensions",
+    description=(
+        """Evaluate All Maturity Models: Evaluate and save the technology, information, process and 
+        organisation maturity model data in one request.
+
+        This endpoint loads the last saved BPMN extraction of a project once and runs the technology, 
+        information and process evaluations concurrently, so the request takes as long as the slowest 
+        evaluation instead of the sum of all three. The organisation levels are taken from the questionnaire 
+        entries of the Organization category without a model call, as in `/evaluate_organisation`. The results 
+        are saved in a single transaction. Questionnaire answers of the Information category override the 
+        evaluated levels, as in the single endpoint.
+
+        If the evaluation of a dimension fails, or there are no questionnaire entries of the Organization 
+        category, the other dimensions are still saved and returned; the failed dimension keeps its previous 
+        data and is listed in "errors".
+
+        Args:
+        - chat_settings (UserChatSettings): User chat settings.
+        - project_id (int): The ID of the project.
+        - db (AsyncSession): Async database session dependency.
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - dict: A dictionary containing the evaluated data per dimension and the errors per failed dimension.
+
+        Raises:
+        - HTTPException: If no BPMN extraction is found, the project is not found, all evaluations fail 
+          or an error occurs while saving.
+        """
+    ),
+    response_model=dict
+)
+async def evaluate_all_maturity_models(
+    chat_settings: UserChatSettings,
+    project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
+    current_user: models.User = Depends(get_current_user),
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        project = await db.get(models.Project, project_id)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found.")
+
+        last_saved_extraction = await aget_last_bpmn_extraction_for_user(db, current_user.id, project_id)
+
+        if not last_saved_extraction:
+            raise HTTPException(status_code=404, detail="No BPMN extraction found for the project.")
+
+        result = last_saved_extraction.content
+        await arelease_connection(db)
+        evaluations = await asyncio.gather(
+            *(evaluate(result, chat_settings.language, model) for evaluate, _, _ in MATURITY_DIMENSIONS.values()),
+            return_exceptions=True
+        )
+
+        questionnaire_entries = (await db.scalars(select(models.QuestionnaireEntry).where(
+            models.QuestionnaireEntry.user_id == current_user.id,
+            models.QuestionnaireEntry.project_id == project_id,
+            models.QuestionnaireEntry.maturity_category.in_(["Information", "Organization"])
+        ))).all()
+
+        response_data = {}
+        errors = {}
+        total_cost = 0.0
+
+        for (dimension, (_, maturity_model, category)), evaluation in zip(MATURITY_DIMENSIONS.items(), evaluations):
+            if isinstance(evaluation, Exception):
+                errors[dimension] = str(evaluation)
+                continue
+
+            response, cost = evaluation
+            total_cost += cost
+
+            try:
+                response_data[dimension] = await amerge_maturity_entries(
+                    db, maturity_model, current_user.id, project_id,
+                    ai_response=response,
+                    questionnaire_entries=[entry for entry in questionnaire_entries if entry.maturity_category == category]
+                )
+            except (AttributeError, TypeError, ValueError) as e:
+                errors[dimension] = f"Invalid AI response: {str(e)}"
+
+        organisation_entries = [entry for entry in questionnaire_entries if entry.maturity_category == "Organization"]
+        if organisation_entries:
+            response_data["organisation"] = await amerge_maturity_entries(
+                db, models.MaturityModelOrganisation, current_user.id, project_id, questionnaire_entries=organisation_entries
             )
-            for entry in entries
-        ]
+        else:
+            errors["organisation"] = "No questionnaire entries found for the project and user in the Organization category."
 
-        for instance in model_instances:
-            db.add(instance)
+        if not response_data:
+            raise HTTPException(status_code=502, detail=f"All maturity evaluations failed: {errors}")
 
-        db.commit()
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
+        await db.commit()
 
-        response_data = [
-            {
-                "label": instance.label,
-                "level": instance.level,
-                "justification": instance.justification
-            }
-            for instance in model_instances
-        ]
+        return {"message": "Maturity data evaluated and saved successfully", "data": response_data, "errors": errors}
+
+    except HTTPException as http_error:
+        await db.rollback()
+        raise http_error
 
-        return {"message": "Organisation maturity data evaluated and saved successfully", "data": response_data}
-    
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
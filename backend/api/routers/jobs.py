@@ -0,0 +1,223 @@
+"""
+Background Job Routes Module.
+
+This module provides the endpoints to run the report and evaluation generation as background jobs
+of `api.utils.jobs`: submitting a job, polling its status and result, and following it as
+Server-Sent Events. A job keeps running when the client disconnects or the request times out.
+
+Author: Elias Niederwieser (Fraunhofer Italia)
+Date: 2024
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.authentication.oauth import check_admin_role, get_current_user
+from api.models import models
+from api.routers import extraction_evaluation, report
+from api.schemas import schemas
+from api.utils.jobs import FAILED, SUCCEEDED, JobQueueFull, job_queue
+from api.utils.streaming import sse_event, sse_response
+from database import AsyncSessionLocal, arelease_connection, get_async_db
+
+router = APIRouter(tags=['Jobs'])
+
+# Interval in which the events endpoint checks the status of a job
+EVENTS_POLL_SECONDS = 1.0
+
+@job_queue.register("as_is_report")
+async def run_as_is_report(db: AsyncSession, user: models.User, job: models.Job, model) -> Dict[str, Any]:
+    return await report.create_as_is_report(
+        report.UserChatSettings(language=job.language), job.project_id,
+        stream=False, current_user=user, model=model, db=db
+    )
+
+@job_queue.register("maturity_report")
+async def run_maturity_model_report(db: AsyncSession, user: models.User, job: models.Job, model) -> Dict[str, Any]:
+    return await report.create_maturity_model_report(
+        report.UserChatSettings(language=job.language), job.project_id,
+        stream=False, current_user=user, model=model, db=db
+    )
+
+@job_queue.register("roadmap_report")
+async def run_roadmap_report(db: AsyncSession, user: models.User, job: models.Job, model) -> Dict[str, Any]:
+    return await report.create_roadmap_report(
+        report.UserChatSettings(language=job.language), job.project_id,
+        stream=False, current_user=user, model=model, db=db
+    )
+
+@job_queue.register("evaluate_all")
+async def run_evaluate_all(db: AsyncSession, user: models.User, job: models.Job, model) -> Dict[str, Any]:
+    return await extraction_evaluation.evaluate_all_maturity_models(
+        extraction_evaluation.UserChatSettings(language=job.language), job.project_id,
+        current_user=user, model=model, db=db
+    )
+
+async def _get_own_job(db: AsyncSession, job_id: int, current_user: models.User) -> models.Job:
+    job = await db.get(models.Job, job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@router.post(
+    "",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Submit a Background Job",
+    description=(
+        """Submit Job: Queue the generation of a report or evaluation for a project.
+
+        The job runs in the background, independent of this request; its status and result are
+        available at `/jobs/{job_id}` and `/jobs/{job_id}/events`. If an identical job (same kind,
+        project and language) of the user is already queued or running, that job is returned.
+
+        Kinds:
+        - as_is_report: As-Is report of the BPMN file (`POST /reports/as_is_process/{project_id}`).
+        - maturity_report: Maturity model report (`POST /reports/maturity/{project_id}`).
+        - roadmap_report: Roadmap report (`POST /reports/roadmap/{project_id}`).
+        - evaluate_all: Evaluation of all maturity dimensions (`POST /intellichek/evaluate_all`).
+
+        Args:
+        - job (schemas.JobCreate): The kind of the job, the project ID and the language.
+        - db (AsyncSession): Async database session dependency.
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - dict: The job ID, its status and whether an identical job was already queued or running.
+
+        Raises:
+        - HTTPException: If the kind is unknown, the project is not found or the user has too many queued jobs.
+        """
+    ),
+    response_model=dict
+)
+async def submit_job(
+    job: schemas.JobCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if job.kind not in job_queue.kinds:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind. Available kinds: {', '.join(job_queue.kinds)}")
+
+    project = await db.get(models.Project, job.project_id)
+    if project is None or (project.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Project not found.")
+
+    try:
+        queued_job, deduplicated = await job_queue.submit(
+            db, job.kind, current_user.id, job.project_id, job.language or "English"
+        )
+    except JobQueueFull:
+        raise HTTPException(
+            status_code=429, detail="Too many queued jobs, please try again later.", headers={"Retry-After": "10"}
+        )
+
+    return {"job_id": queued_job.id, "status": queued_job.status, "deduplicated": deduplicated}
+
+@router.get(
+    "/stats",
+    summary="Get background job statistics (Admin Only)",
+    dependencies=[Depends(check_admin_role)],
+    description=(
+        """Get Job Statistics: Retrieve the number of jobs per status and the counters of the job workers.
+
+        The jobs per status are counted over all worker processes, the counters of the workers since the
+        start of this worker process.
+
+        Returns:
+        - dict: A dictionary containing the jobs per status and the worker counters.
+
+        Raises:
+        - HTTPException: If the user is not an admin.
+        """
+    ),
+    response_model=dict
+)
+async def get_job_stats(db: AsyncSession = Depends(get_async_db)):
+    rows = await db.execute(select(models.Job.status, func.count()).group_by(models.Job.status))
+    return {"jobs": {job_status: count for job_status, count in rows}, "workers": job_queue.stats()}
+
+@router.get(
+    "/{job_id}",
+    summary="Get a Background Job",
+    description=(
+        """Get Job: Retrieve the status of a job and, once it has succeeded, its result.
+
+        The status is one of `queued`, `running`, `succeeded` and `failed`. The result is the response
+        of the corresponding endpoint; `error` holds the error of the last failed attempt.
+
+        Args:
+        - job_id (int): The ID of the job.
+        - db (AsyncSession): Async database session dependency.
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - schemas.Job: The job.
+
+        Raises:
+        - HTTPException: If the job is not found.
+        """
+    ),
+    response_model=schemas.Job
+)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return await _get_own_job(db, job_id, current_user)
+
+async def _job_events(job_id: int, job: Dict[str, Any]) -> AsyncIterator[str]:
+    last = None
+    while True:
+        if (job["status"], job["attempts"]) != last:
+            last = (job["status"], job["attempts"])
+            if job["status"] == SUCCEEDED:
+                yield sse_event("done", job)
+                return
+            if job["status"] == FAILED:
+                yield sse_event("error", {**job, "detail": job["error"]})
+                return
+            yield sse_event("status", job)
+
+        await asyncio.sleep(EVENTS_POLL_SECONDS)
+        async with AsyncSessionLocal() as db:
+            current = await db.get(models.Job, job_id)
+            if current is None:
+                yield sse_event("error", {"detail": "Job not found."})
+                return
+            job = schemas.Job.model_validate(current).model_dump(mode="json")
+
+@router.get(
+    "/{job_id}/events",
+    summary="Follow a Background Job",
+    description=(
+        """Follow Job: Stream the status of a job as Server-Sent Events until it has finished.
+
+        A `status` event is sent with every change of the status, then `done` with the job and its
+        result, or `error` with the job and the error as `detail`.
+
+        Args:
+        - job_id (int): The ID of the job.
+        - db (AsyncSession): Async database session dependency.
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - StreamingResponse: A `text/event-stream` of the job events.
+
+        Raises:
+        - HTTPException: If the job is not found.
+        """
+    )
+)
+async def follow_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    job = await _get_own_job(db, job_id, current_user)
+    await arelease_connection(db)
+    return sse_response(_job_events(job_id, schemas.Job.model_validate(job).model_dump(mode="json")))
@@ -9,11 +9,13 @@ Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
 from fastapi import HTTPException, Depends, APIRouter, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.models import models
-from database import get_db
+from database import get_async_db
 from api.authentication.oauth import get_current_user, get_current_user_role
 from api.schemas.schemas import MaturityModelEntry
+from api.utils.helpers import aget_maturity_entries
 
 router = APIRouter(tags=['Maturity Model'])
 
@@ -28,7 +30,7 @@ router = APIRouter(tags=['Maturity Model'])
 
         Args:
         - project_id (int): The ID of the project to fetch the maturity entries for.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
         - current_user_role (str): Authenticated user's role dependency.
 
@@ -45,24 +47,24 @@ async def get_maturity_entries_organisation(
     project_id: int = Query(..., description="ID of the project to fetch the maturity entries for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
         
         if current_user_role == "admin":
             owner_user_id = project.user_id
-            entries = db.query(models.MaturityModelOrganisation).filter(
+            entries = (await db.scalars(select(models.MaturityModelOrganisation).where(
                 models.MaturityModelOrganisation.user_id == owner_user_id,
                 models.MaturityModelOrganisation.project_id == project_id
-            ).all()
+            ))).all()
         else:
-            entries = db.query(models.MaturityModelOrganisation).filter(
+            entries = (await db.scalars(select(models.MaturityModelOrganisation).where(
                 models.MaturityModelOrganisation.user_id == current_user.id,
                 models.MaturityModelOrganisation.project_id == project_id
-            ).all()
+            ))).all()
 
         if not entries:
             raise HTTPException(status_code=404, detail="No maturity entries found for the project.")
@@ -92,7 +94,7 @@ async def get_maturity_entries_organisation(
 
         Args:
         - project_id (int): The ID of the project to fetch the maturity entries for.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
         - current_user_role (str): Authenticated user's role dependency.
 
@@ -109,24 +111,24 @@ async def get_maturity_entries_technology(
     project_id: int = Query(..., description="ID of the project to fetch the maturity entries for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
         
         if current_user_role == "admin":
             owner_user_id = project.user_id
-            entries = db.query(models.MaturityModelTechnology).filter(
+            entries = (await db.scalars(select(models.MaturityModelTechnology).where(
                 models.MaturityModelTechnology.user_id == owner_user_id,
                 models.MaturityModelTechnology.project_id == project_id
-            ).all()
+            ))).all()
         else:
-            entries = db.query(models.MaturityModelTechnology).filter(
+            entries = (await db.scalars(select(models.MaturityModelTechnology).where(
                 models.MaturityModelTechnology.user_id == current_user.id,
                 models.MaturityModelTechnology.project_id == project_id
-            ).all()
+            ))).all()
             
         if not entries:
             raise HTTPException(status_code=404, detail="No maturity entries found for the project.")
@@ -156,7 +158,7 @@ async def get_maturity_entries_technology(
 
         Args:
         - project_id (int): The ID of the project to fetch the maturity entries for.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
         - current_user_role (str): Authenticated user's role dependency.
 
@@ -173,24 +175,24 @@ async def get_maturity_entries_information(
     project_id: int = Query(..., description="ID of the project to fetch the maturity entries for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
         
         if current_user_role == "admin":
             owner_user_id = project.user_id
-            entries = db.query(models.MaturityModelInformation).filter(
+            entries = (await db.scalars(select(models.MaturityModelInformation).where(
                 models.MaturityModelInformation.user_id == owner_user_id,
                 models.MaturityModelInformation.project_id == project_id
-            ).all()
+            ))).all()
         else:
-            entries = db.query(models.MaturityModelInformation).filter(
+            entries = (await db.scalars(select(models.MaturityModelInformation).where(
                 models.MaturityModelInformation.user_id == current_user.id,
                 models.MaturityModelInformation.project_id == project_id
-            ).all()
+            ))).all()
         if not entries:
             raise HTTPException(status_code=404, detail="No maturity entries found for the project.")
 
@@ -219,7 +221,7 @@ async def get_maturity_entries_information(
 
         Args:
         - project_id (int): The ID of the project to fetch the maturity entries for.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
         - current_user_role (str): Authenticated user's role dependency.
 
@@ -236,24 +238,24 @@ async def get_maturity_entries_process(
     project_id: int = Query(..., description="ID of the project to fetch the maturity entries for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
         
         if current_user_role == "admin":
             owner_user_id = project.user_id
-            entries = db.query(models.MaturityModelProcess).filter(
+            entries = (await db.scalars(select(models.MaturityModelProcess).where(
                 models.MaturityModelProcess.user_id == owner_user_id,
                 models.MaturityModelProcess.project_id == project_id
-            ).all()
+            ))).all()
         else:
-            entries = db.query(models.MaturityModelProcess).filter(
+            entries = (await db.scalars(select(models.MaturityModelProcess).where(
                 models.MaturityModelProcess.user_id == current_user.id,
                 models.MaturityModelProcess.project_id == project_id
-            ).all()
+            ))).all()
 
         if not entries:
             raise HTTPException(status_code=404, detail="No maturity entries found for the project.")
@@ -283,7 +285,7 @@ async def get_maturity_entries_process(
 
         Args:
         - project_id (int): The ID of the project to fetch the maturity entries for.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
         - current_user_role (str): Authenticated user's role dependency.
 
@@ -300,11 +302,11 @@ async def get_maturity_entries_all_categories(
     project_id: int = Query(..., description="ID of the project to fetch the maturity entries for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         print(f"Fetching project with ID: {project_id}")
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             print("Project not found.")
             raise HTTPException(status_code=404, detail="Project not found.")
@@ -318,23 +320,13 @@ async def get_maturity_entries_all_categories(
         
         print(f"Owner user ID: {owner_user_id}")
 
-        entries = []
-        categories = [models.MaturityModelOrganisation, models.MaturityModelTechnology, models.MaturityModelInformation, models.MaturityModelProcess]
-
-        for category in categories:
-            print(f"Fetching entries for category: {category.__name__}")
-            category_entries = db.query(category).filter(
-                category.user_id == owner_user_id,
-                category.project_id == project_id
-            ).all()
-            
-            print(f"Entries found: {category_entries}")
-
-            for entry in category_entries:
-                entries.append({
-                    "label": entry.label,
-                    "level": entry.level
-                })
+        entries = [
+            {
+                "label": entry.label,
+                "level": entry.level
+            }
+            for entry in await aget_maturity_entries(db, owner_user_id, project_id)
+        ]
 
         if not entries:
             print("No maturity entries found for the project.")
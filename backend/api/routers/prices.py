@@ -2,36 +2,62 @@
 Prices Management Routes Module.
 
 This module provides the endpoints related to price calculations for the application,
-including retrieving the sum of spend money for OpenAI tokens based on user roles.
+including the ledger of the OpenAI calls, the spend money for OpenAI tokens from the cost
+rollups based on user roles and the statistics of the LLM response cache.
 
 Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
 
-from fastapi import APIRouter, Depends
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from api.models import models
 from database import get_db
-from api.authentication.oauth import get_current_user, get_current_user_role
+from api.authentication.oauth import get_current_user, get_current_user_role, check_admin_role
+from api.utils.costs import cost_writer, get_cost_total, get_daily_costs
+from ai_tools.intellichek.cache import cache_stats
+from ai_tools.intellichek.chains import single_flight_stats
 
 router = APIRouter(tags=['Prices'])
 
+def _cost_scope(db: Session, current_user: models.User, current_user_role: str, project_id: Optional[int]):
+    """Return the rollup scope of a cost query: a project, all users for admins, or the user."""
+    if project_id is not None:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found.")
+        if current_user_role != "admin" and project.user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="You do not have permission to access this project.")
+        return "project", project_id
+    if current_user_role == "admin":
+        return "all", 0
+    return "user", current_user.id
+
 @router.get(
     "/get_price",
-    summary="Get sum of spend money for OPENAI token",
+    summary="Get the cost ledger of the OPENAI calls",
     description=(
-        """Get Sum of Spend Money: Retrieve the total spend money for OpenAI tokens based on user role.
+        """Get Cost Ledger: Retrieve the recorded OpenAI calls, newest first, one page at a time.
 
-        This endpoint calculates the total spend money for OpenAI tokens. If the user has an admin role, 
-        it retrieves the sum for all users; otherwise, it retrieves the sum for the authenticated user only.
+        Every OpenAI call is recorded with its time, endpoint, project, model, prompt and completion tokens 
+        and cost. If the user has an admin role, the calls of all users are returned; otherwise only the 
+        calls of the authenticated user.
 
         Args:
+        - start (datetime, optional): Earliest time of the returned calls.
+        - end (datetime, optional): Latest time of the returned calls (exclusive).
+        - project_id (int, optional): Only return the calls of this project.
+        - limit (int): Maximum number of returned calls.
+        - offset (int): Number of calls to skip.
         - current_user (models.User): Authenticated user dependency.
         - current_user_role (str): Authenticated user's role dependency.
         - db (Session): Database session dependency.
 
         Returns:
-        - dict: A dictionary containing the total spend money.
+        - dict: A dictionary containing the page of recorded calls.
 
         Raises:
         - HTTPException: If an error occurs during the process.
@@ -39,15 +65,27 @@ router = APIRouter(tags=['Prices'])
     )
 )
 def get_price(
+    start: Optional[datetime] = Query(None, description="Earliest time of the returned calls."),
+    end: Optional[datetime] = Query(None, description="Latest time of the returned calls (exclusive)."),
+    project_id: Optional[int] = Query(None, description="Only return the calls of this project."),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of returned calls."),
+    offset: int = Query(0, ge=0, description="Number of calls to skip."),
     current_user: models.User = Depends(get_current_user), 
     current_user_role: str = Depends(get_current_user_role),
     db: Session = Depends(get_db)
 ):
-    if current_user_role == "admin":
-        total_price = db.query(models.ChatInfo).all()
-    else:
-        total_price = db.query(models.ChatInfo).filter(models.ChatInfo.user_id == current_user.id).all()
-    return {"total_price": total_price}
+    query = db.query(models.ChatInfo)
+    if current_user_role != "admin":
+        query = query.filter(models.ChatInfo.user_id == current_user.id)
+    if project_id is not None:
+        query = query.filter(models.ChatInfo.project_id == project_id)
+    if start is not None:
+        query = query.filter(models.ChatInfo.created_at >= start)
+    if end is not None:
+        query = query.filter(models.ChatInfo.created_at < end)
+
+    entries = query.order_by(models.ChatInfo.created_at.desc(), models.ChatInfo.id.desc()).offset(offset).limit(limit).all()
+    return {"total_price": entries, "limit": limit, "offset": offset}
 
 @router.get(
     "/get_total_price",
@@ -55,32 +93,134 @@ def get_price(
     description=(
         """Get Total Spend Money: Retrieve the total spend money for OpenAI tokens based on user role.
 
-        This endpoint calculates the total spend money for OpenAI tokens. If the user has an admin role, 
-        it retrieves the total spend money for all users; otherwise, it retrieves the total spend money 
-        for the authenticated user only.
+        This endpoint returns the total spend money for OpenAI tokens from the cost rollups, without 
+        summing the recorded calls. If the user has an admin role, it returns the total for all users; 
+        otherwise, it returns the total for the authenticated user only. With a project, it returns the 
+        total of the project; with a time range, the total of the days in the range.
 
         Args:
+        - start (date, optional): First day of the range.
+        - end (date, optional): Last day of the range (inclusive).
+        - project_id (int, optional): Return the total of this project.
         - current_user (models.User): Authenticated user dependency.
         - current_user_role (str): Authenticated user's role dependency.
         - db (Session): Database session dependency.
 
         Returns:
-        - dict: A dictionary containing the total spend money.
+        - dict: A dictionary containing the total spend money, the number of calls, of which reused_calls 
+          were answered from the response cache or by an identical call at zero cost, and the tokens.
 
         Raises:
-        - HTTPException: If an error occurs during the process.
+        - HTTPException: If the project is not found or not accessible.
         """
     )
 )
 def get_total_price(
+    start: Optional[date] = Query(None, description="First day of the range."),
+    end: Optional[date] = Query(None, description="Last day of the range (inclusive)."),
+    project_id: Optional[int] = Query(None, description="Return the total of this project."),
     current_user: models.User = Depends(get_current_user), 
     current_user_role: str = Depends(get_current_user_role),
     db: Session = Depends(get_db)
 ):
-    if current_user_role == "admin":
-        total_price = db.query(models.ChatInfo).all()
-    else:
-        total_price = db.query(models.ChatInfo).filter(models.ChatInfo.user_id == current_user.id).all()
- 
-    sum_total_price = sum(price.total_cost for price in total_price)
-    return {"total_price": sum_total_price}
+    scope, scope_id = _cost_scope(db, current_user, current_user_role, project_id)
+    total = get_cost_total(db, scope, scope_id, start, end)
+    return {"total_price": total["total_cost"], **total}
+
+@router.get(
+    "/get_daily_price",
+    summary="Get the daily spend money for OPENAI token",
+    description=(
+        """Get Daily Spend Money: Retrieve the spend money for OpenAI tokens per day.
+
+        This endpoint returns the daily cost rollups, with the same scope as `/get_total_price`: all users 
+        for admins, the authenticated user otherwise, or the given project.
+
+        Args:
+        - start (date, optional): First day of the range.
+        - end (date, optional): Last day of the range (inclusive).
+        - project_id (int, optional): Return the costs of this project.
+        - current_user (models.User): Authenticated user dependency.
+        - current_user_role (str): Authenticated user's role dependency.
+        - db (Session): Database session dependency.
+
+        Returns:
+        - dict: A dictionary containing the cost, calls, reused (zero-cost) calls and tokens per day.
+
+        Raises:
+        - HTTPException: If the project is not found or not accessible.
+        """
+    )
+)
+def get_daily_price(
+    start: Optional[date] = Query(None, description="First day of the range."),
+    end: Optional[date] = Query(None, description="Last day of the range (inclusive)."),
+    project_id: Optional[int] = Query(None, description="Return the costs of this project."),
+    current_user: models.User = Depends(get_current_user),
+    current_user_role: str = Depends(get_current_user_role),
+    db: Session = Depends(get_db)
+):
+    scope, scope_id = _cost_scope(db, current_user, current_user_role, project_id)
+    days = get_daily_costs(db, scope, scope_id, start, end)
+    return {
+        "days": [
+            {
+                "day": day.day,
+                "total_cost": day.total_cost,
+                "calls": day.calls,
+                "reused_calls": day.reused_calls,
+                "prompt_tokens": day.prompt_tokens,
+                "completion_tokens": day.completion_tokens
+            }
+            for day in days
+        ]
+    }
+
+@router.get(
+    "/get_llm_cache_stats",
+    summary="Get LLM response cache statistics",
+    dependencies=[Depends(check_admin_role)],
+    description=(
+        """Get LLM Cache Statistics: Retrieve the hit and miss counters of the LLM response cache.
+
+        Cached responses of deterministic AI calls are returned without a new OpenAI request and cost 
+        nothing. "single_flight" counts the OpenAI calls made and the identical concurrent calls that 
+        awaited one of them instead. The counters are kept per worker process since its start.
+
+        Args:
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - dict: A dictionary containing the backend, hits, misses, hit rate, number of entries and the 
+          single-flight counters.
+
+        Raises:
+        - HTTPException: If the user is not an admin.
+        """
+    )
+)
+def get_llm_cache_stats(
+    current_user: models.User = Depends(get_current_user)
+):
+    return {**cache_stats(), "single_flight": single_flight_stats()}
+
+@router.get(
+    "/get_cost_writer_stats",
+    summary="Get cost ledger writer statistics",
+    dependencies=[Depends(check_admin_role)],
+    description=(
+        """Get Cost Writer Statistics: Retrieve the queue depth and the counters of the cost ledger writer.
+
+        The OpenAI calls are queued by the routes and written to the cost ledger in batches in the 
+        background. The statistics are kept per worker process since its start.
+
+        Returns:
+        - dict: A dictionary containing the queue depth, the written rows and batches and the failed batches.
+
+        Raises:
+        - HTTPException: If the user is not an admin.
+        """
+    )
+)
+def get_cost_writer_stats():
+    return cost_writer.stats()
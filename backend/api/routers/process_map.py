@@ -11,35 +11,31 @@ Date: 2024
 import os
 from typing import Optional, Dict
 
-from fastapi import HTTPException, Depends, APIRouter
+from fastapi import HTTPException, Depends, APIRouter, Query, status
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ai_tools.intellichek.introduction_message import chat_introduction
-from ai_tools.intellichek.evaluation_glossary import get_glossary_task, transform_user_process_description
+from ai_tools.intellichek.introduction_message import achat_introduction
+from ai_tools.intellichek.evaluation_glossary import aget_glossary_task, atransform_user_process_description
 from ai_tools.intellichek.evaluate_level_of_maturity import (
-    evaluate_level_of_maturity_with_chat_final,
-    evaluate_level_of_maturity_with_chat,
-    chat_with_maturity_intro,
-    evaluate_level_of_maturity_pre
+    aevaluate_level_of_maturity_with_chat_final,
+    aevaluate_level_of_maturity_with_chat,
+    achat_with_maturity_intro,
+    aevaluate_level_of_maturity_pre
 )
-from ai_tools.intellichek.basis import basic_ai_chat
+from ai_tools.intellichek.basis import abasic_ai_chat, astream_basic_ai_chat
 from langchain.chat_models import ChatOpenAI
-import config
+from ai_tools.intellichek.providers import aget_chat_model
+from api.utils.costs import record_llm_cost
+from api.utils.helpers import aread_text_file, awrite_text_file
+from api.utils.streaming import sse_response, stream_ai_response
 from api.models import models
 from api.schemas import schemas
-from database import get_db
+from database import arelease_connection, get_async_db
 from api.authentication.oauth import get_current_user
 
 router = APIRouter(tags=['Process Map AI'])
 
-openai_api_key = config.OPENAI_API_KEY 
-
-if not openai_api_key:
-    raise ValueError("OpenAI API key not found in environment variables.")
-
-model = ChatOpenAI(temperature=float(config.TEMPERATURE), model=config.GPT_MODEL)
-
 class ChatMessage(BaseModel):
     """Model representing the input string for A.I. conversation."""
     human_message: str
@@ -74,7 +70,6 @@ class ProcessDescriptionRequest(BaseModel):
 
         Args:
         - chat_message (ChatMessage): The input string for the AI conversation.
-        - db (Session): Database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -86,16 +81,14 @@ class ProcessDescriptionRequest(BaseModel):
     ),
     response_model=dict
 )
-def add_chat_intro(
+async def add_chat_intro(
     chat_message: ChatMessage,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model)
 ):
     try:
-        response, total_cost = chat_introduction(chat_message.human_message, model)
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        response, total_cost = await achat_introduction(chat_message.human_message, model)
+        record_llm_cost(current_user.id, total_cost)
         return {"message": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -112,7 +105,7 @@ def add_chat_intro(
         Args:
         - project_id (int): The ID of the project.
         - chat_language (UserChatLanguage): The language settings for the chat.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -124,14 +117,15 @@ def add_chat_intro(
     ),
     response_model=Dict[str, str]
 )
-def transformation_of_original_description(
+async def transformation_of_original_description(
     project_id: int,
     chat_language: UserChatLanguage,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
 
@@ -139,17 +133,16 @@ def transformation_of_original_description(
         if not input_file_path or not os.path.isfile(input_file_path):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Input file not found")
 
-        with open(input_file_path, 'r') as input_file:
-            file_content = input_file.read()
+        file_content = await aread_text_file(input_file_path)
 
         glossary_path = "./ai_tools/chek_database/maturity.txt"
         if not os.path.isfile(glossary_path):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Glossary file not found")
 
-        with open(glossary_path, 'r') as glossary_file:
-            glossary_content = glossary_file.read()
+        glossary_content = await aread_text_file(glossary_path)
 
-        response, total_cost = transform_user_process_description(
+        await arelease_connection(db)
+        response, total_cost = await atransform_user_process_description(
             file_content,
             glossary_content,
             chat_language.language,
@@ -157,16 +150,13 @@ def transformation_of_original_description(
         )
 
         output_file_path = f'{os.path.dirname(input_file_path)}/transformed_user_process_description.txt'
-        with open(output_file_path, 'w') as output_file:
-            output_file.write(response)
+        await awrite_text_file(output_file_path, response)
 
         project.ai_processed_permit_process = output_file_path
         db.add(project)
-        db.commit()
+        await db.commit()
 
-        chat_info = models.ChatInfo(total_cost=total_cost, user_id=current_user.id)
-        db.add(chat_info)
-        db.commit()
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
 
         return {"message": "Success"}
     except Exception as e:
@@ -189,7 +179,6 @@ def transformation_of_original_description(
         Args:
         - chat_message (ChatMessage): The input task information.
         - chat_settings (UserChatSettings): The chat settings including language and diagram ID.
-        - db (Session): Database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -201,17 +190,15 @@ def transformation_of_original_description(
     ),
     response_model=dict
 )
-def get_task_name(
+async def get_task_name(
     chat_message: ChatMessage,
     chat_settings: UserChatSettings,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model)
 ):
     try:
-        response, total_cost = get_glossary_task(chat_message.human_message, chat_settings.language, model)
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        response, total_cost = await aget_glossary_task(chat_message.human_message, chat_settings.language, model)
+        record_llm_cost(current_user.id, total_cost)
         return {"message": response, "diagram_id": chat_settings.diagram_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -230,7 +217,7 @@ def get_task_name(
         - project_id (int): The ID of the project.
         - maturity_action (str): The user's chosen action.
         - chat_settings (UserChatSettings): The chat settings including language and diagram ID.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -242,15 +229,16 @@ def get_task_name(
     ),
     response_model=dict
 )
-def get_maturity_from_user_description(
+async def get_maturity_from_user_description(
     project_id: int,
     maturity_action: str,
     chat_settings: UserChatSettings,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
 
@@ -258,19 +246,17 @@ def get_maturity_from_user_description(
         if not transformed_file_path or not os.path.isfile(transformed_file_path):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transformed file not found")
 
-        with open(transformed_file_path, 'r') as transformed_file:
-            evaluated_description = transformed_file.read()
+        evaluated_description = await aread_text_file(transformed_file_path)
 
-        response, total_cost = evaluate_level_of_maturity_pre(
+        await arelease_connection(db)
+        response, total_cost = await aevaluate_level_of_maturity_pre(
             maturity_action,
             evaluated_description,
             chat_settings.language,
             model
         )
 
-        chat_info = models.ChatInfo(total_cost=total_cost, user_id=current_user.id)
-        db.add(chat_info)
-        db.commit()
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
 
         return {"message": response, "diagram_id": chat_settings.diagram_id}
     except Exception as e:
@@ -289,7 +275,6 @@ def get_maturity_from_user_description(
         Args:
         - maturity (Maturity): The user's chosen action and description.
         - chat_settings (UserChatSettings): The chat settings including language and diagram ID.
-        - db (Session): Database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -301,17 +286,15 @@ def get_maturity_from_user_description(
     ),
     response_model=dict
 )
-def get_maturity_from_user_chat(
+async def get_maturity_from_user_chat(
     maturity: Maturity,
     chat_settings: UserChatSettings,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model)
 ):
     try:
-        response, total_cost = evaluate_level_of_maturity_with_chat(maturity.action, maturity.description, chat_settings.language, model)
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        response, total_cost = await aevaluate_level_of_maturity_with_chat(maturity.action, maturity.description, chat_settings.language, model)
+        record_llm_cost(current_user.id, total_cost)
         return {"message": response, "diagram_id": chat_settings.diagram_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -329,7 +312,6 @@ def get_maturity_from_user_chat(
         Args:
         - maturity (Maturity): The user's chosen action and description.
         - chat_settings (UserChatSettings): The chat settings including language and diagram ID.
-        - db (Session): Database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -341,17 +323,15 @@ def get_maturity_from_user_chat(
     ),
     response_model=dict
 )
-def get_final_maturity_from_user_chat(
+async def get_final_maturity_from_user_chat(
     maturity: Maturity,
     chat_settings: UserChatSettings,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model)
 ):
     try:
-        response, total_cost = evaluate_level_of_maturity_with_chat_final(maturity.action, maturity.description, chat_settings.language, model)
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        response, total_cost = await aevaluate_level_of_maturity_with_chat_final(maturity.action, maturity.description, chat_settings.language, model)
+        record_llm_cost(current_user.id, total_cost)
         return {"message": response, "diagram_id": chat_settings.diagram_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -369,7 +349,6 @@ def get_final_maturity_from_user_chat(
         Args:
         - chat_message (ChatMessage): The input string for the AI conversation.
         - chat_settings (UserChatSettings): The chat settings including language and diagram ID.
-        - db (Session): Database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -381,17 +360,15 @@ def get_final_maturity_from_user_chat(
     ),
     response_model=dict
 )
-def add_string_maturityq(
+async def add_string_maturityq(
     chat_message: ChatMessage,
     chat_settings: UserChatSettings,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model)
 ):
     try:
-        response, total_cost = chat_with_maturity_intro(chat_message.human_message, chat_settings.language, model)
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        response, total_cost = await achat_with_maturity_intro(chat_message.human_message, chat_settings.language, model)
+        record_llm_cost(current_user.id, total_cost)
         return {"message": response, "diagram_id": chat_settings.diagram_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -404,12 +381,13 @@ def add_string_maturityq(
 
         This endpoint allows the authenticated user to engage in a basic chat with the AI.
         The AI generates a response based on the provided input string and user-specific settings.
+        With `stream=true` the response is streamed as Server-Sent Events (`token`, then `done` or `error`).
 
         Args:
         - chat_message (ChatMessage): The input data for the chat, containing the 'value' attribute.
         - chat_settings (UserChatLanguage): User's chat language settings.
         - project_id (int): The ID of the project for which the chat is conducted.
-        - db (Session): Database session dependency.
+        - stream (bool): Stream the response as Server-Sent Events.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -421,19 +399,23 @@ def add_string_maturityq(
     ),
     response_model=dict
 )
-def basic_chat(
+async def basic_chat(
     chat_message: ChatMessage,
     chat_settings: UserChatLanguage,
     project_id: int,
+    stream: bool = Query(False, description="Stream the response as Server-Sent Events while it is generated."),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model)
 ):
     try:
-        response, total_cost = basic_ai_chat(chat_message.human_message, chat_settings.language, model)
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        if stream:
+            return sse_response(stream_ai_response(
+                astream_basic_ai_chat(chat_message.human_message, chat_settings.language, model),
+                on_end=lambda: record_llm_cost(current_user.id, 0.0, project_id=project_id)
+            ))
+
+        response, total_cost = await abasic_ai_chat(chat_message.human_message, chat_settings.language, model)
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
         return {"message": response}
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
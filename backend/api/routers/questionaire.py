@@ -10,9 +10,10 @@ Date: 2024
 """
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from database import get_db
+from database import get_async_db
 from api.models import models
 from api.schemas import schemas
 from api.authentication.oauth import get_current_user
@@ -33,7 +34,7 @@ router = APIRouter(tags=['Questionnaire'])
         Args:
         - project_id (int): ID of the project.
         - bulk_entry (schemas.BulkQuestionnaireEntryCreate): Bulk questionnaire entry data.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
         
         Returns:
@@ -44,10 +45,10 @@ router = APIRouter(tags=['Questionnaire'])
 async def submit_questionnaire_entries(
     project_id: int,
     bulk_entry: schemas.BulkQuestionnaireEntryCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    db.query(models.QuestionnaireEntry).filter(models.QuestionnaireEntry.project_id == project_id).delete()
+    await db.execute(delete(models.QuestionnaireEntry).where(models.QuestionnaireEntry.project_id == project_id))
     
     db_entries = []
     for entry in bulk_entry.entries:
@@ -77,9 +78,9 @@ async def submit_questionnaire_entries(
         db.add(db_entry)
         db_entries.append(db_entry)
 
-    db.commit()
+    await db.commit()
     for db_entry in db_entries:
-        db.refresh(db_entry)
+        await db.refresh(db_entry)
 
     return db_entries
 @router.get(
@@ -94,7 +95,7 @@ async def submit_questionnaire_entries(
         
         Args:
         - project_id (int): ID of the project.
-        - db (Session): Database session dependency.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
         
         Returns:
@@ -107,10 +108,12 @@ async def submit_questionnaire_entries(
 )
 async def get_questionnaire_entries(
     project_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    entries = db.query(models.QuestionnaireEntry).filter(models.QuestionnaireEntry.project_id == project_id).all()
+    entries = (await db.scalars(
+        select(models.QuestionnaireEntry).where(models.QuestionnaireEntry.project_id == project_id)
+    )).all()
 
     if not entries:
         raise HTTPException(status_code=404, detail="No questionnaire entries found for the project.")
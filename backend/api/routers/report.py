@@ -8,25 +8,32 @@ Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
 
-from typing import Optional
-from fastapi import HTTPException, Depends, APIRouter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Type
+from fastapi import HTTPException, Depends, APIRouter, Query
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ai_tools.intellichek.report import generate_maturity_model_report, generate_building_permit_report, generate_roadmap_report
-from api.utils.helpers import get_last_bpmn_data_for_user
-from ai_tools.intellichek.helpers import sanitize_bpmn, write_response_to_file
+from ai_tools.intellichek.report import (
+    agenerate_maturity_model_report, agenerate_building_permit_report, agenerate_roadmap_report,
+    astream_maturity_model_report, astream_building_permit_report, astream_roadmap_report,
+    agenerate_report_summary, report_summary_key
+)
+from api.utils.helpers import aget_last_bpmn_data_for_user, aget_maturity_entries, aparse_bpmn_data
+from ai_tools.intellichek.helpers import write_response_to_file
 from langchain.chat_models import ChatOpenAI
-import config
+from ai_tools.intellichek.providers import aget_chat_model
+from api.utils.costs import record_llm_cost
+from api.utils.streaming import sse_response, stream_ai_response
 from api.models import models
-from database import get_db
+from api.schemas import schemas
+from database import AsyncSessionLocal, arelease_connection, get_async_db, get_db
 from api.authentication.oauth import get_current_user, get_current_user_role, check_admin_role
 import os
 
 
-openai_api_key = config.OPENAI_API_KEY 
-if not openai_api_key:
-    raise ValueError("OpenAI API key not found in environment variables.")
-model = ChatOpenAI(temperature=float(config.TEMPERATURE), model=config.GPT_MODEL)
 
 router = APIRouter(tags=['Results and Report'])
 
@@ -45,6 +52,93 @@ def write_response_to_file(response: str, file_path: str):
     with open(file_path, 'w') as file:
         file.write(response)
 
+async def aget_report_summary(
+    db: AsyncSession,
+    kind: str,
+    user_id: int,
+    project_id: int,
+    string: str,
+    model: ChatOpenAI
+) -> str:
+    """
+    Return the summary stage of a report of a project, generating and storing it if the project
+    has no summary of the same input yet.
+
+    A stored summary is reused for every report of the same input, e.g. in another language,
+    which then costs only the final report call. The summary is committed on its own, so it is
+    kept even if the final report fails. The connection of the session is released before
+    returning, as the final report call follows.
+
+    Parameters:
+    - db: Async database session.
+    - kind: The kind of the report: "as_is", "maturity" or "roadmap".
+    - user_id: The ID of the user.
+    - project_id: The ID of the project.
+    - string: The input of the report.
+    - model: The chat model.
+    """
+    key = report_summary_key(kind, string, model)
+    if key is not None:
+        stored = await db.scalar(select(models.ReportSummary.content).where(
+            models.ReportSummary.project_id == project_id,
+            models.ReportSummary.kind == kind,
+            models.ReportSummary.input_hash == key
+        ))
+        if stored is not None:
+            await arelease_connection(db)
+            return stored
+
+    await arelease_connection(db)
+    summary, _ = await agenerate_report_summary(kind, string, model)
+
+    if key is not None:
+        await db.execute(
+            insert(models.ReportSummary)
+            .values(
+                project_id=project_id, kind=kind, input_hash=key, content=summary,
+                user_id=user_id, created_at=datetime.utcnow()
+            )
+            .on_conflict_do_nothing(index_elements=["project_id", "kind", "input_hash"])
+        )
+        await db.commit()
+    return summary
+
+STREAM_QUERY = Query(False, description="Stream the report as Server-Sent Events while it is generated.")
+
+def stream_report(
+    chunks,
+    report_model: Type[models.Base],
+    user_id: int,
+    project_id: int,
+    file_path: str
+):
+    """
+    Stream a report as Server-Sent Events and save it once it is complete.
+
+    The report is saved in its own session, since the request session is closed by the
+    time the stream ends. The cost of the model calls is recorded when the stream ends,
+    also if the client disconnects before.
+
+    Parameters:
+    - chunks: The chunks of the report.
+    - report_model: The report model to save the report as.
+    - user_id: The ID of the user.
+    - project_id: The ID of the project.
+    - file_path: The file the report is written to.
+    """
+    async def save(response: str) -> Dict[str, Any]:
+        write_response_to_file(response, file_path)
+        async with AsyncSessionLocal() as db:
+            db.add(report_model(content=response, user_id=user_id, project_id=project_id))
+            await db.commit()
+        return {"message": response}
+
+    return sse_response(stream_ai_response(
+        chunks,
+        on_complete=save,
+        on_end=lambda: record_llm_cost(user_id, 0.0, project_id=project_id)
+    ))
+
 
 @router.post(
     "/as_is_process/{project_id}",
@@ -54,11 +148,15 @@ def write_response_to_file(response: str, file_path: str):
 
         This endpoint generates a summary report from the last saved BPMN data associated with a specific project 
         for the current user. The report is saved and associated with the project.
+        The summary stage is stored per project and input (see `/reports/summaries/{project_id}`) and reused,
+        e.g. for the report in another language, which then costs one model call instead of two.
+        With `stream=true` the report is streamed as Server-Sent Events (`token`, then `done` or `error`).
 
         Args:
         - chat_settings (UserChatSettings): User-specific chat settings.
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - stream (bool): Stream the report as Server-Sent Events.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -70,39 +168,48 @@ def write_response_to_file(response: str, file_path: str):
     ),
     response_model=dict
 )
-def create_as_is_report(
+async def create_as_is_report(
     chat_settings: UserChatSettings, 
     project_id: int,
+    stream: bool = STREAM_QUERY,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        last_saved_data = get_last_bpmn_data_for_user(db, current_user.id, project_id)
+        last_saved_data = await aget_last_bpmn_data_for_user(db, current_user.id, project_id)
   
         if not last_saved_data:
             raise HTTPException(status_code=404, detail="No BPMN data found for the project.")
         
-        sanitized_data = sanitize_bpmn(last_saved_data.content)
-        response, total_cost = generate_building_permit_report(sanitized_data, chat_settings.language, model)
-        
-        write_response_to_file(response, './test/as_is_report.txt')
-        
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
        
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
 
-        report_as_is = models.ReportAsIs(content=response, user=current_user, project=project)
+        process_map = (await aparse_bpmn_data(last_saved_data)).to_text()
+        summary = await aget_report_summary(db, "as_is", current_user.id, project.id, process_map, model)
+
+        if stream:
+            return stream_report(
+                astream_building_permit_report(process_map, chat_settings.language, model, summary=summary),
+                models.ReportAsIs, current_user.id, project.id, './test/as_is_report.txt'
+            )
+
+        response, total_cost = await agenerate_building_permit_report(process_map, chat_settings.language, model, summary=summary)
+        
+        write_response_to_file(response, './test/as_is_report.txt')
+
+        report_as_is = models.ReportAsIs(content=response, user_id=current_user.id, project_id=project.id)
         db.add(report_as_is)
 
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
 
-        db.commit()
+        await db.commit()
         return {"message": response}
 
     except HTTPException as http_error:
-        db.rollback()
+        await db.rollback()
         raise http_error
 
 @router.get(
@@ -185,11 +292,15 @@ def get_as_is_report(
         This endpoint generates a summary report for the maturity model aspects (technology, information,
         process, and organization) associated with a specified project and user. The report is saved and 
         associated with the project.
+        The summary stage is stored per project and input (see `/reports/summaries/{project_id}`) and reused,
+        e.g. for the report in another language, which then costs one model call instead of two.
+        With `stream=true` the report is streamed as Server-Sent Events (`token`, then `done` or `error`).
 
         Args:
         - chat_settings (UserChatSettings): User-specific chat settings.
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - stream (bool): Stream the report as Server-Sent Events.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -201,70 +312,50 @@ def get_as_is_report(
     ),
     response_model=dict
 )
-def create_maturity_model_report(
+async def create_maturity_model_report(
     chat_settings: UserChatSettings, 
     project_id: int,
+    stream: bool = STREAM_QUERY,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
        
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
         
-        maturity_model_technologies = db.query(models.MaturityModelTechnology).filter(
-            models.MaturityModelTechnology.project_id == project_id,
-            models.MaturityModelTechnology.user_id == current_user.id
-        ).all()
-
-        maturity_model_information = db.query(models.MaturityModelInformation).filter(
-            models.MaturityModelInformation.project_id == project_id,
-            models.MaturityModelInformation.user_id == current_user.id
-        ).all()
-
-        maturity_model_process = db.query(models.MaturityModelProcess).filter(
-            models.MaturityModelProcess.project_id == project_id,
-            models.MaturityModelProcess.user_id == current_user.id
-        ).all()
-
-        maturity_model_organisation = db.query(models.MaturityModelOrganisation).filter(
-            models.MaturityModelOrganisation.project_id == project_id,
-            models.MaturityModelOrganisation.user_id == current_user.id
-        ).all()
-
-        all_models = maturity_model_technologies + maturity_model_information + maturity_model_process + maturity_model_organisation
+        all_models = await aget_maturity_entries(db, current_user.id, project_id)
 
         if all_models:
             summary_string = ""
             for modela in all_models:
-                if isinstance(modela, models.MaturityModelTechnology):
-                    keyword = "Technology"
-                elif isinstance(modela, models.MaturityModelInformation):
-                    keyword = "Information"
-                elif isinstance(modela, models.MaturityModelProcess):
-                    keyword = "Process"
-                elif isinstance(modela, models.MaturityModelOrganisation):
-                    keyword = "Organisation"
-                else:
-                    keyword = "Unknown"
+                keyword = modela.dimension.capitalize()
 
                 summary_string += (
                     f"{keyword}: {modela.label} has the maturity level {modela.level} "
                     f"according to the justification {modela.justification}. "
                 )
 
-            response, total_cost = generate_maturity_model_report(summary_string, chat_settings.language, model)
+            summary = await aget_report_summary(db, "maturity", current_user.id, project.id, summary_string, model)
+
+            if stream:
+                return stream_report(
+                    astream_maturity_model_report(summary_string, chat_settings.language, model, summary=summary),
+                    models.ReportMaturity, current_user.id, project.id, './test/maturity_report.txt'
+                )
+
+            response, total_cost = await agenerate_maturity_model_report(summary_string, chat_settings.language, model, summary=summary)
             write_response_to_file(response, './test/maturity_report.txt')
             print(model)
-            report_maturity = models.ReportMaturity(content=response, user=current_user, project=project)
+            report_maturity = models.ReportMaturity(content=response, user_id=current_user.id, project_id=project.id)
            
-            chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
+            record_llm_cost(current_user.id, total_cost, project_id=project_id)
             
             db.add(report_maturity)
-            db.add(chat_info)
 
-            db.commit()
+            await db.commit()
             return {"message": response}
         else:
             return {"message": "No data found for the specified project and user."}
@@ -349,11 +440,15 @@ def get_maturity_model_report(
         This endpoint generates a summary report based on the roadmap data (including KMA, start and end dates,
         dependencies, actions, and check tools) associated with a specified project and user. The report is saved
         and associated with the project.
+        The summary stage is stored per project and input (see `/reports/summaries/{project_id}`) and reused,
+        e.g. for the report in another language, which then costs one model call instead of two.
+        With `stream=true` the report is streamed as Server-Sent Events (`token`, then `done` or `error`).
 
         Args:
         - chat_settings (UserChatSettings): User-specific chat settings.
         - project_id (int): The ID of the project.
-        - db (Session): Database session dependency.
+        - stream (bool): Stream the report as Server-Sent Events.
+        - db (AsyncSession): Async database session dependency.
         - current_user (models.User): Authenticated user dependency.
 
         Returns:
@@ -365,21 +460,23 @@ def get_maturity_model_report(
     ),
     response_model=dict
 )
-def create_roadmap_report(
+async def create_roadmap_report(
     chat_settings: UserChatSettings, 
     project_id: int,
+    stream: bool = STREAM_QUERY,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    model: ChatOpenAI = Depends(aget_chat_model),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
         
-        roadmaps_db = db.query(models.Roadmap).filter(
+        roadmaps_db = (await db.scalars(select(models.Roadmap).where(
             models.Roadmap.project_id == project_id,
           #  models.Roadmap.user_id == current_user.id
-        ).all()
+        ))).all()
 
         if not roadmaps_db:
             return {"message": "No data found for the specified project and user."}
@@ -396,14 +493,21 @@ def create_roadmap_report(
             roadmap_data.append(roadmap_info)
 
         roadmap_db_string = "\n".join([str(r) for r in roadmap_data])
-        response, total_cost = generate_roadmap_report(roadmap_db_string, chat_settings.language, model)
+        summary = await aget_report_summary(db, "roadmap", current_user.id, project.id, roadmap_db_string, model)
+
+        if stream:
+            return stream_report(
+                astream_roadmap_report(roadmap_db_string, chat_settings.language, model, summary=summary),
+                models.ReportRoadmap, current_user.id, project.id, './test/roadmap_report.txt'
+            )
+
+        response, total_cost = await agenerate_roadmap_report(roadmap_db_string, chat_settings.language, model, summary=summary)
         write_response_to_file(response, './test/roadmap_report.txt')
-        report_roadmap = models.ReportRoadmap(content=response, user=current_user, project=project)
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
+        report_roadmap = models.ReportRoadmap(content=response, user_id=current_user.id, project_id=project.id)
+        record_llm_cost(current_user.id, total_cost, project_id=project_id)
 
         db.add(report_roadmap)
-        db.add(chat_info)
-        db.commit()
+        await db.commit()
 
         return {"message": response}
 
@@ -477,3 +581,45 @@ def get_roadmap_report(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+@router.get(
+    "/summaries/{project_id}",
+    summary="Get the Report Summaries for a given project ID",
+    description=(
+        """Get Report Summaries: Retrieve the stored summary stages of the reports of a specific project.
+
+        The summary stage of a report (the description of the As-Is process, the summary of the maturity
+        evaluation or the structured roadmap) is stored for every input it was generated from, newest first.
+        Admin users can retrieve the summaries of any project, while regular users can retrieve the summaries
+        of their own projects.
+
+        Args:
+        - project_id (int): The ID of the project.
+        - kind (str, optional): Only summaries of this report kind: "as_is", "maturity" or "roadmap".
+        - db (AsyncSession): Async database session dependency.
+        - current_user (models.User): Authenticated user dependency.
+
+        Returns:
+        - List[schemas.ReportSummary]: The stored summaries of the project.
+
+        Raises:
+        - HTTPException: If the project is not found.
+        """
+    ),
+    response_model=List[schemas.ReportSummary]
+)
+async def get_report_summaries(
+    project_id: int,
+    kind: Optional[str] = Query(None, description="Report kind: as_is, maturity or roadmap."),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    project = await db.get(models.Project, project_id)
+    if not project or (project.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Project not found.")
+
+    query = select(models.ReportSummary).where(models.ReportSummary.project_id == project_id)
+    if kind is not None:
+        query = query.where(models.ReportSummary.kind == kind)
+
+    return (await db.scalars(query.order_by(models.ReportSummary.id.desc()))).all()
@@ -8,31 +8,29 @@ roadmaps, and handling user-specific settings for AI conversations.
 Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
+from datetime import date
 from typing import Optional
 
 from fastapi import HTTPException, Depends, APIRouter, Query
 from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
-from ai_tools.intellichek.roadmap import get_roadmap_from_ai
-from langchain.chat_models import ChatOpenAI
+from ai_tools.intellichek.roadmap import translate_roadmap
+from ai_tools.intellichek.roadmap_scheduler import schedule_roadmap, RoadmapCycleError
+from ai_tools.intellichek.benchmark import get_benchmark_catalogue
+from ai_tools.intellichek.providers import aget_chat_model
 import config
-import json
-import os
+from api.utils.costs import record_llm_cost
 from api.models import models
 from api.schemas import schemas
-from database import get_db
+from database import arelease_connection, get_async_db, get_db
 from api.authentication.oauth import get_current_user, get_current_user_role
+from api.utils.helpers import aget_maturity_entries
 
 router = APIRouter(tags=['Benchmark and Roadmap AI'])
 
-openai_api_key = config.OPENAI_API_KEY 
-
-if not openai_api_key:
-    raise ValueError("OpenAI API key not found in environment variables.")
-
-model = ChatOpenAI(temperature=float(config.TEMPERATURE), model=config.GPT_MODEL)
-
 class ChatMessage(BaseModel):
     """Model representing the input string for A.I. conversation."""
     human_message: str
@@ -41,11 +39,11 @@ class UserChatLanguage(BaseModel):
     """Model representing user-specific settings for A.I. conversation."""
     language: Optional[str] = "English"
 
+class RoadmapSettings(UserChatLanguage):
+    """Model representing the settings of the roadmap schedule."""
+    start_date: Optional[date] = None
+    months_per_level: Optional[int] = None
 
-directory_path = './ai_tools/chek_database'
-file_name = 'benchmark.json'
-
-file_path = os.path.join(directory_path, file_name)
 
 @router.post(
     "/evaluate_benchmark_chek", 
@@ -72,10 +70,10 @@ async def evaluate_chek_benchmark(
     project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
                 
@@ -84,69 +82,35 @@ async def evaluate_chek_benchmark(
         else:
             owner_user_id = current_user.id
 
-        entries = []
-        
-        categories = [models.MaturityModelOrganisation, 
-                      models.MaturityModelTechnology,
-                      models.MaturityModelInformation, 
-                      models.MaturityModelProcess]
-
-        for category in categories:
-            category_entries = db.query(category).filter(
-                category.user_id == owner_user_id,
-                category.project_id == project_id
-            ).all()
-
-            for entry in category_entries:
-                entries.append({
-                    "label": entry.label,
-                    "level": entry.level
-                })
+        entries = [
+            {
+                "label": entry.label,
+                "level": entry.level
+            }
+            for entry in await aget_maturity_entries(db, owner_user_id, project_id)
+        ]
                 
         if not entries:
             raise HTTPException(status_code=404, detail="No maturity entries found for the project.")
 
-        # Load the JSON data from the file
-        
-        with open(file_path, 'r') as file:
-            json_data = json.load(file)
+        catalogue = get_benchmark_catalogue()
 
         new_entries = []
 
         for db_entry in entries:
-            json_entry = next((item for item in json_data["Key Maturity Areas"] if item["kma"] == db_entry["label"]), None)
-            if json_entry:
-                level_difference = json_entry["check level"] - db_entry["level"]
-                if level_difference < 0:
-                    level_difference = 0
-
-                dependencies = json_entry.get("dependencies", [])
-                actions = json_entry.get("actions", [])
-                chek_tools = json_entry.get("check tools", [])
-
-                # Ensure dependencies, actions, and chek_tools are lists
-                if isinstance(dependencies, str):
-                    dependencies = [dependencies]
-                if isinstance(actions, str):
-                    actions = [actions]
-                if isinstance(chek_tools, str):
-                    chek_tools = [chek_tools]
-
-                # Convert "No previous action needed" to empty list
-                if "No previous action needed" in dependencies:
-                    dependencies = []
-
+            benchmark = catalogue.get(db_entry["label"])
+            if benchmark:
                 new_entries.append({
-                    "kma": json_entry["kma"],
-                    "level_difference": level_difference,
-                    "dependencies": dependencies,
-                    "actions": actions,
-                    "chek_tools": chek_tools
+                    "kma": benchmark.kma,
+                    "level_difference": max(benchmark.check_level - db_entry["level"], 0),
+                    "dependencies": list(benchmark.dependencies),
+                    "actions": list(benchmark.actions),
+                    "chek_tools": list(benchmark.chek_tools)
                 })
                 
-        db.query(models.BenchmarkModel).filter(
+        await db.execute(delete(models.BenchmarkModel).where(
                     models.BenchmarkModel.project_id == project_id
-                ).delete()
+                ))
 
         # Insert new entries into the new database table
         model_instances = [
@@ -165,12 +129,16 @@ async def evaluate_chek_benchmark(
         for instance in model_instances:
             db.add(instance)
 
-        db.commit()
+        await db.commit()
 
         return {"message": "The operation was completed successfully."}
     
+    except HTTPException as http_error:
+        await db.rollback()
+        raise http_error
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
@@ -184,19 +152,19 @@ async def get_benchmark_chek(
     project_id: int = Query(..., description="ID of the project to fetch the benchmark check data for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
                 
         if current_user_role != "admin" and project.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="You do not have permission to access this project.")
 
-        benchmark_data = db.query(models.BenchmarkModel).filter(
+        benchmark_data = (await db.scalars(select(models.BenchmarkModel).where(
            models.BenchmarkModel.project_id == project_id
-        ).all()
+        ))).all()
 
         if not benchmark_data:
             raise HTTPException(status_code=404, detail="No benchmark check data found for the project.")
@@ -212,81 +180,80 @@ async def get_benchmark_chek(
     summary="Evaluate Roadmap",
     description=(
     """
-    Adds string maturity based on AI evaluation for a specific project.
+    Computes the roadmap of a specific project from its benchmark entries.
+
+    Every KMA takes `months_per_level` months per level of difference and starts after all KMAs 
+    whose actions it depends on have finished. The schedule is computed without AI and is 
+    reproducible; the AI is only used to translate the roadmap if a language other than English 
+    is requested.
 
     Parameters:
-    - chat_message: ChatMessage - Input message for AI conversation.
-    - chat_settings: UserChatSettings - User-specific settings for the AI conversation.
-    - project_id: int - ID of the project to fetch the last BPMN data for.
+    - chat_settings: RoadmapSettings - Language, start date (default ROADMAP_START_DATE) and 
+      months per level of difference (default ROADMAP_MONTHS_PER_LEVEL).
+    - project_id: int - ID of the project to compute the roadmap for.
     - current_user: models.User - Current authenticated user.
     - current_user_role: str - Role of the current authenticated user.
     - db: Session - Database session dependency.
 
     Returns:
-    - dict: Dictionary containing the message and response data.
+    - dict: Dictionary containing the message.
     """
     ),
     response_model=dict
 )
 async def evaluate_chek_benchmark(
-    chat_settings: UserChatLanguage, 
+    chat_settings: RoadmapSettings, 
     project_id: int = Query(..., description="ID of the project to fetch the last BPMN data for."),
     current_user: models.User = Depends(get_current_user),
     current_user_role: str = Depends(get_current_user_role),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        project = await db.get(models.Project, project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found.")
                 
     
-        entries = db.query(models.BenchmarkModel).filter(
+        entries = (await db.scalars(select(models.BenchmarkModel).where(
             models.BenchmarkModel.project_id == project_id
-        ).all()
+        ))).all()
         
         if not entries:
             raise HTTPException(status_code=404, detail="No benchmark entries found for the project.")
 
-        formatted_entries = "\n".join([
-            f"KMA: {entry.kma}\n"
-            f"Level Difference: {entry.level_difference}\n"
-            f"Dependencies: {', '.join(entry.dependencies)}\n"
-            f"Actions: {', '.join(entry.actions)}\n"
-            f"Chek Tools: {', '.join(entry.chek_tools)}\n"
-            for entry in entries
-        ])
-        
-        
-        response, total_cost = await get_roadmap_from_ai(formatted_entries, chat_settings.language, model)
+        months_per_level = chat_settings.months_per_level or config.ROADMAP_MONTHS_PER_LEVEL
+        if months_per_level < 1:
+            raise HTTPException(status_code=422, detail="months_per_level must be at least 1.")
+
+        try:
+            response_data = schedule_roadmap(
+                [
+                    {
+                        "kma": entry.kma,
+                        "level_difference": entry.level_difference,
+                        "dependencies": entry.dependencies or [],
+                        "actions": entry.actions or [],
+                        "chek_tools": entry.chek_tools or []
+                    }
+                    for entry in entries
+                ],
+                chat_settings.start_date or date.fromisoformat(config.ROADMAP_START_DATE),
+                months_per_level
+            )
+        except RoadmapCycleError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        total_cost = None
+        if chat_settings.language and chat_settings.language.lower() != "english":
+            model = await aget_chat_model()
+            await arelease_connection(db)
+            response_data, total_cost = await translate_roadmap(response_data, chat_settings.language, model)
 
-        db.query(models.Roadmap).filter(
+        await db.execute(delete(models.Roadmap).where(
             models.Roadmap.user_id == current_user.id,
             models.Roadmap.project_id == project_id
-        ).delete()
+        ))
 
-        response_data = []
-        
-        for chat_message in response:
-            try:
-                kma_name = chat_message.get("kma")
-                start_date = chat_message.get("start_date")
-                end_date = chat_message.get("end_date")
-                dependencies = chat_message.get("dependencies", [])
-                actions = chat_message.get("actions", [])
-                chek_tools = chat_message.get("chek_tools", [])
-                
-                response_data.append({
-                    "kma": kma_name,
-                    "start_date": start_date,
-                    "end_date": end_date,
-                    "dependencies": dependencies,
-                    "actions": actions,
-                    "chek_tools": chek_tools
-                })
-            except KeyError as e:
-                raise HTTPException(status_code=500, detail=f"Missing key in AI response: {str(e)}")
-            
         model_instances = [
             models.Roadmap(
                 kma=data["kma"],
@@ -304,14 +271,18 @@ async def evaluate_chek_benchmark(
         for instance in model_instances:
             db.add(instance)
 
-        chat_info = models.ChatInfo(total_cost=total_cost, user=current_user)
-        db.add(chat_info)
-        db.commit()
+        if total_cost is not None:
+            record_llm_cost(current_user.id, total_cost, project_id=project_id)
+        await db.commit()
 
         return {"message": "The operation was completed successfully."}
     
+    except HTTPException as http_error:
+        await db.rollback()
+        raise http_error
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
@@ -4,9 +4,9 @@ Author: Elias Niederwieser
 Year: 2024
 """
 from fastapi import HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter
-from database import get_db
+from database import get_async_db
 from api.authentication.oauth import get_current_user
 from api.models import models
 from api.schemas import schemas
@@ -26,10 +26,10 @@ router = APIRouter(prefix='/me', tags=['User Information'])
     )
 )
 async def get_user_info(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    user_info = db.query(models.User).filter_by(id=current_user.id).first()
+    user_info = await db.get(models.User, current_user.id)
     if not user_info:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
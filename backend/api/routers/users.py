@@ -5,12 +5,14 @@ Year: 2024
 """
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends, Request, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.models import models
 from api.schemas import schemas
-from database import get_db
-from api.utils.utils import hash_pass, is_strong_password
+from database import get_async_db
+from api.utils.utils import ahash_pass, is_strong_password
 from api.authentication.oauth import check_admin_role
+from api.authentication.user_cache import invalidate_user
 from api.utils.recaptcha import verify_recaptcha
 
 from api.utils.token_utils import generate_confirmation_token
@@ -36,8 +38,8 @@ templates = Jinja2Templates(directory=templates_dir)
         - This endpoint is rate-limited to 50 requests per minute.
     """
 )
-async def get_all_users(request: Request, db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
+async def get_all_users(request: Request, db: AsyncSession = Depends(get_async_db)):
+    users = (await db.scalars(select(models.User))).all()
     return users
 
 @router.get(
@@ -53,8 +55,8 @@ async def get_all_users(request: Request, db: Session = Depends(get_db)):
      - The response includes the user's full information if found, otherwise a 404 error is returned.
     """
 )
-async def get_one_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_one_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(models.User, user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -76,13 +78,13 @@ async def get_one_user(user_id: int, db: Session = Depends(get_db)):
         - If the email is already registered or the password is weak, appropriate error responses are returned."
     """
 )
-async def create_user(user: schemas.CreateUser, db: Session = Depends(get_db)):
+async def create_user(user: schemas.CreateUser, db: AsyncSession = Depends(get_async_db)):
     # Verify reCAPTCHA token
     # verification_result = await verify_recaptcha(user.recaptcha_token)
     # if not verification_result.success:
     #     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid reCAPTCHA token")
 
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
+    existing_user = (await db.scalars(select(models.User).where(models.User.email == user.email).limit(1))).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -93,7 +95,7 @@ async def create_user(user: schemas.CreateUser, db: Session = Depends(get_db)):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Weak password. Password must include at least one number and one special character."
         )
-    user.password = hash_pass(user.password)
+    user.password = await ahash_pass(user.password)
     new_user = models.User(**user.dict(exclude={"recaptcha_token"}))
     
     token = generate_confirmation_token(new_user.email)
@@ -115,10 +117,10 @@ async def create_user(user: schemas.CreateUser, db: Session = Depends(get_db)):
     
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create user: {str(e)}"
@@ -137,18 +139,19 @@ async def create_user(user: schemas.CreateUser, db: Session = Depends(get_db)):
         - If the user is not found, a 404 error is returned. If there is an issue deleting the user, a 500 error is returned.
     """
 )
-async def delete_user(user_id: int, db: Session = Depends(get_db)):
-    deleted_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    deleted_user = await db.get(models.User, user_id)
     if deleted_user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User not found with id: {user_id}"
         )
     try:
-        db.delete(deleted_user)
-        db.commit()
+        await db.delete(deleted_user)
+        await db.commit()
+        invalidate_user(user_id)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete user: {str(e)}"
@@ -167,21 +170,25 @@ async def delete_user(user_id: int, db: Session = Depends(get_db)):
         - If the user is not found, a 404 error is returned. If there is an issue updating the user, a 500 error is returned."
     """
 )
-async def update_user(update_user: schemas.UpdateUser, user_id: int, db: Session = Depends(get_db)):
-    updated_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def update_user(update_user: schemas.UpdateUser, user_id: int, db: AsyncSession = Depends(get_async_db)):
+    updated_user = await db.get(models.User, user_id)
     if updated_user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User not found with id: {user_id}"
         )
     try:
-        db.query(models.User).filter(models.User.id == user_id).update(
-            update_user.dict(), synchronize_session=False)
-        db.commit()
+        await db.execute(
+            update(models.User).where(models.User.id == user_id).values(**update_user.dict())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        invalidate_user(user_id)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update user: {str(e)}"
         )
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    await db.refresh(updated_user)
+    return updated_user
@@ -1,7 +1,7 @@
 # schemas.py
 
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Optional, List
 from datetime import datetime
 
 class ProjectBase(BaseModel):
@@ -88,8 +88,10 @@ class ChatInfoSchema(BaseModel):
     total_cost: float
 
 class BPMNDataSchema(BaseModel):
-    bpmnData: str
-    created_at: datetime
+    bpmnData: Optional[str] = None
+    # Heartbeat: only the SHA-256 of the unchanged content is sent instead of bpmnData
+    content_hash: Optional[str] = None
+    created_at: Optional[datetime] = None
 
 class BPMNTemplateSchema(BaseModel):
     title : str
@@ -204,3 +206,34 @@ class BenchmarkModel(BenchmarkModelBase):
 
     class Config:
         orm_mode = True
+
+class JobCreate(BaseModel):
+    kind: str
+    project_id: int
+    language: Optional[str] = "English"
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    project_id: int
+    language: str
+    status: str
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ReportSummary(BaseModel):
+    id: int
+    kind: str
+    input_hash: str
+    content: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
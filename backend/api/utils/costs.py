@@ -0,0 +1,458 @@
+"""
+Cost accounting of the OpenAI calls.
+
+Every model call is recorded as a row of the `chat_info` ledger with its time, endpoint,
+project, model and tokens. In the same transaction the rollups `cost_totals` (all-time)
+and `cost_daily` (per day) are incremented for all users, the user and the project with
+one `INSERT ... ON CONFLICT DO UPDATE` each, so totals are read from a single row instead
+of summing the ledger.
+
+The calls of a request are collected by the usage tracker of `ai_tools.intellichek.chains`,
+which `LLMUsageMiddleware` sets up for every request. The tracker knows the user of the
+request from the authentication; calls that a route made but did not record, e.g. because it
+failed after a paid call, are recorded by the middleware when the request ends. The job queue
+does the same for the calls of a job.
+
+The routes do not write the ledger themselves: `record_llm_cost` hands the calls to the
+`CostWriter` of the process, which writes them in the background in batches, one
+transaction per batch, when `COST_WRITER_BATCH_SIZE` calls are queued or after
+`COST_WRITER_FLUSH_SECONDS`. The queue is drained when the application shuts down.
+
+If a batch cannot be written because the database is unavailable, it is queued again and
+retried with the next flush. If it fails for another reason, its rows are written one by
+one and a row that still fails (e.g. its user was deleted in the meantime) is logged and
+dropped, so one bad row does not block the ledger. At most `COST_WRITER_MAX_QUEUE` rows
+are queued; further rows are logged and dropped.
+"""
+
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import exc, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+import config
+from ai_tools.intellichek.chains import MODEL, LLMCall, UsageTracker, current_usage_tracker, track_usage
+from api.models import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# A queued ledger row: user id, project id, endpoint, time and call
+CostEntry = Tuple[int, Optional[int], Optional[str], datetime, LLMCall]
+
+class LLMUsageMiddleware:
+    """
+    ASGI middleware that collects the model calls of every HTTP request and records the calls
+    the route did not record itself when the request ends.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track_usage(endpoint=scope.get("path")) as tracker:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # The router adds the path parameters of the route to the scope
+                record_remaining_calls(tracker, _path_project_id(scope))
+
+def _path_project_id(scope) -> Optional[int]:
+    try:
+        return int(scope.get("path_params", {})["project_id"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a write failed because the database is unavailable, not because of its rows."""
+    return (
+        isinstance(error, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError))
+        or getattr(error, "connection_invalidated", False)
+    )
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+def _describe(entry: CostEntry) -> str:
+    user_id, project_id, endpoint, created_at, call = entry
+    return (
+        f"user_id={user_id} project_id={project_id} endpoint={endpoint} created_at={created_at.isoformat()} "
+        f"model={call.model} prompt_tokens={call.prompt_tokens} completion_tokens={call.completion_tokens} "
+        f"total_cost={call.total_cost}"
+    )
+
+def _metrics(calls: List[LLMCall]) -> Dict[str, Any]:
+    return {
+        "total_cost": sum(call.total_cost for call in calls),
+        "calls": len(calls),
+        "reused_calls": sum(call.source != MODEL for call in calls),
+        "prompt_tokens": sum(call.prompt_tokens for call in calls),
+        "completion_tokens": sum(call.completion_tokens for call in calls),
+    }
+
+def _upsert_rollup(db: Session, model, rows: List[Dict[str, Any]]) -> None:
+    table = model.__table__
+    statement = insert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key.columns],
+        set_={
+            name: table.c[name] + statement.excluded[name]
+            for name in ("total_cost", "calls", "reused_calls", "prompt_tokens", "completion_tokens")
+        }
+    )
+    db.execute(statement)
+
+def record_calls(db: Session, entries: List[CostEntry]) -> None:
+    """
+    Write ledger rows with one multi-row insert and increment the rollups, without committing.
+
+    Parameters:
+    - db: Database session.
+    - entries: Tuples of user id, project id, endpoint, time and call.
+    """
+    if not entries:
+        return
+
+    db.execute(insert(models.ChatInfo.__table__).values([
+        {
+            "user_id": user_id,
+            "project_id": project_id,
+            "endpoint": endpoint,
+            "created_at": created_at,
+            "model": call.model,
+            "prompt_tokens": call.prompt_tokens,
+            "completion_tokens": call.completion_tokens,
+            "total_cost": call.total_cost,
+            "source": call.source
+        }
+        for user_id, project_id, endpoint, created_at, call in entries
+    ]))
+
+    # One row per rollup key, a statement cannot update the same row twice
+    totals = defaultdict(list)
+    daily = defaultdict(list)
+    for user_id, project_id, _, created_at, call in entries:
+        scopes = [("all", 0), ("user", user_id)]
+        if project_id is not None:
+            scopes.append(("project", project_id))
+        for scope, scope_id in scopes:
+            totals[(scope, scope_id)].append(call)
+            daily[(scope, scope_id, created_at.date())].append(call)
+
+    # Rows in key order, so that concurrent batches of several workers lock them in the same order
+    _upsert_rollup(db, models.CostTotal, [
+        {"scope": scope, "scope_id": scope_id, **_metrics(calls)}
+        for (scope, scope_id), calls in sorted(totals.items())
+    ])
+    _upsert_rollup(db, models.CostDaily, [
+        {"scope": scope, "scope_id": scope_id, "day": day, **_metrics(calls)}
+        for (scope, scope_id, day), calls in sorted(daily.items())
+    ])
+
+class CostWriter:
+    """
+    Writes the queued ledger rows of the process in batches in the background.
+
+    `enqueue` can be called from the event loop and from threadpool threads. Rows queued on
+    the event loop before the writer is started are kept until `start`; without a running
+    writer outside of an event loop (e.g. in scripts), the rows are written immediately.
+    """
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_queue: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queue = max_queue
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._written = 0
+        self._batches = 0
+        self._failures = 0
+        self._dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start the background flush task on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        if self.queue_depth():
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Stop the background task and write all queued rows."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self.queue_depth():
+            if not await asyncio.to_thread(self.flush):
+                break
+        lost = self.queue_depth()
+        if lost:
+            logger.error("%s cost ledger rows could not be written before shutdown", lost)
+
+    def enqueue(self, entries: List[CostEntry]) -> None:
+        if not self.running and not _on_event_loop():
+            # No event loop to block, e.g. a script
+            self._write(entries)
+            return
+        with self._lock:
+            accepted = entries[:max(self.max_queue - len(self._queue), 0)]
+            self._queue.extend(accepted)
+            full = len(self._queue) >= self.batch_size
+        for entry in entries[len(accepted):]:
+            self._dropped += 1
+            logger.error("Cost ledger queue is full, dropped row: %s", _describe(entry))
+        if full and self.running:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the queue depth gauge and the counters of the writer."""
+        return {
+            "running": self.running,
+            "queue_depth": self.queue_depth(),
+            "written": self._written,
+            "batches": self._batches,
+            "failures": self._failures,
+            "dropped": self._dropped,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+            "max_queue": self.max_queue,
+        }
+
+    def _write(self, entries: List[CostEntry]) -> None:
+        db = SessionLocal()
+        try:
+            record_calls(db, entries)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def flush(self) -> bool:
+        """
+        Write one batch of queued rows in one transaction.
+
+        If the batch fails because of its rows, they are written one by one and the rows that
+        fail are logged and dropped.
+
+        Returns:
+        - False if the database is unavailable; the rows not yet written are queued again.
+        """
+        with self._lock:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if not batch:
+            return True
+        try:
+            self._write(batch)
+        except Exception as e:
+            self._failures += 1
+            if _is_transient(e):
+                logger.warning("Writing %s cost ledger rows failed, retrying later: %s", len(batch), e)
+                self._requeue(batch)
+                return False
+            logger.warning("Writing %s cost ledger rows failed, writing them one by one: %s", len(batch), e)
+            return self._write_each(batch)
+        self._written += len(batch)
+        self._batches += 1
+        return True
+
+    def _write_each(self, batch: List[CostEntry]) -> bool:
+        for index, entry in enumerate(batch):
+            try:
+                self._write([entry])
+            except Exception as e:
+                if _is_transient(e):
+                    self._requeue(batch[index:])
+                    return False
+                self._dropped += 1
+                logger.error("Dropped cost ledger row that cannot be written: %s (%s)", _describe(entry), e)
+                continue
+            self._written += 1
+        self._batches += 1
+        return True
+
+    def _requeue(self, entries: List[CostEntry]) -> None:
+        with self._lock:
+            self._queue.extendleft(reversed(entries))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self.queue_depth():
+                if not await asyncio.to_thread(self.flush):
+                    break
+                if self.queue_depth() < self.batch_size:
+                    # Wait for the interval again unless a full batch is already waiting
+                    break
+
+cost_writer = CostWriter(config.COST_WRITER_BATCH_SIZE, config.COST_WRITER_FLUSH_SECONDS, config.COST_WRITER_MAX_QUEUE)
+
+def record_llm_cost(user_id: int, total_cost: float, project_id: Optional[int] = None) -> None:
+    """
+    Queue the model calls of the current request for the cost ledger.
+
+    The calls collected by the usage tracker are recorded one row each. Responses that did not
+    call the model, i.e. cache hits and identical calls that shared a call in flight, are
+    recorded as rows without tokens and cost. Outside of a request, without a tracker,
+    `total_cost` is recorded as a single row.
+    The rows are written by the cost writer, outside of the request's transaction.
+
+    Parameters:
+    - user_id: ID of the user the calls are charged to.
+    - total_cost: The total cost of the calls as returned by the AI function.
+    - project_id: ID of the project the calls were made for, if any.
+    """
+    tracker = current_usage_tracker()
+    if tracker is not None:
+        tracker.attribute(user_id, project_id)
+        calls = tracker.drain()
+    else:
+        calls = [LLMCall(model=None, prompt_tokens=0, completion_tokens=0, total_cost=total_cost or 0.0)]
+    if not calls:
+        return
+
+    endpoint = tracker.endpoint if tracker is not None else None
+    now = datetime.utcnow()
+    cost_writer.enqueue([(user_id, project_id, endpoint, now, call) for call in calls])
+
+def record_remaining_calls(tracker: UsageTracker, project_id: Optional[int] = None) -> None:
+    """
+    Queue the model calls left in a tracker for the cost ledger, i.e. the calls of a request or
+    job that failed before it recorded them.
+
+    Parameters:
+    - tracker: The usage tracker of the request or job.
+    - project_id: ID of the project, if the tracker does not know it.
+    """
+    calls = tracker.drain()
+    if not calls:
+        return
+    if tracker.user_id is None:
+        logger.error(
+            "%s model calls of %s cannot be charged to a user and are not recorded: %s",
+            len(calls), tracker.endpoint, ", ".join(f"{call.model} {call.total_cost}" for call in calls)
+        )
+        return
+
+    now = datetime.utcnow()
+    project_id = tracker.project_id if tracker.project_id is not None else project_id
+    cost_writer.enqueue([(tracker.user_id, project_id, tracker.endpoint, now, call) for call in calls])
+
+def get_cost_total(
+    db: Session,
+    scope: str,
+    scope_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None
+) -> Dict[str, Any]:
+    """
+    Return the cost of a scope from the rollups.
+
+    Without a time range the all-time total is a single row; with a time range the daily
+    rollups of the range are summed.
+
+    Parameters:
+    - db: Database session.
+    - scope: "all", "user" or "project".
+    - scope_id: ID of the user or project, 0 for "all".
+    - start: First day of the range (inclusive).
+    - end: Last day of the range (inclusive).
+
+    Returns:
+    - Dictionary with total_cost, calls, reused_calls (cache hits and shared calls, included in
+      calls), prompt_tokens and completion_tokens.
+    """
+    if start is None and end is None:
+        row = db.get(models.CostTotal, (scope, scope_id))
+        if row is None:
+            return {"total_cost": 0.0, "calls": 0, "reused_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        return {
+            "total_cost": row.total_cost,
+            "calls": row.calls,
+            "reused_calls": row.reused_calls,
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+        }
+
+    query = db.query(
+        func.coalesce(func.sum(models.CostDaily.total_cost), 0.0),
+        func.coalesce(func.sum(models.CostDaily.calls), 0),
+        func.coalesce(func.sum(models.CostDaily.reused_calls), 0),
+        func.coalesce(func.sum(models.CostDaily.prompt_tokens), 0),
+        func.coalesce(func.sum(models.CostDaily.completion_tokens), 0),
+    ).filter(models.CostDaily.scope == scope, models.CostDaily.scope_id == scope_id)
+    if start is not None:
+        query = query.filter(models.CostDaily.day >= start)
+    if end is not None:
+        query = query.filter(models.CostDaily.day <= end)
+    total_cost, calls, reused_calls, prompt_tokens, completion_tokens = query.one()
+    return {
+        "total_cost": float(total_cost),
+        "calls": int(calls),
+        "reused_calls": int(reused_calls),
+        "prompt_tokens": int(prompt_tokens),
+        "completion_tokens": int(completion_tokens),
+    }
+
+def get_daily_costs(
+    db: Session,
+    scope: str,
+    scope_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None
+) -> List[models.CostDaily]:
+    """
+    Return the daily cost rollups of a scope, ordered by day.
+
+    Parameters:
+    - db: Database session.
+    - scope: "all", "user" or "project".
+    - scope_id: ID of the user or project, 0 for "all".
+    - start: First day of the range (inclusive).
+    - end: Last day of the range (inclusive).
+
+    Returns:
+    - List of CostDaily objects.
+    """
+    query = db.query(models.CostDaily).filter(
+        models.CostDaily.scope == scope,
+        models.CostDaily.scope_id == scope_id
+    )
+    if start is not None:
+        query = query.filter(models.CostDaily.day >= start)
+    if end is not None:
+        query = query.filter(models.CostDaily.day <= end)
+    return query.order_by(models.CostDaily.day).all()
@@ -1,5 +1,27 @@
+import asyncio
+import hashlib
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from sqlalchemy import Delete, Select, case, delete, select
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from ai_tools.intellichek.bpmn_parser import BPMNModel, parse_bpmn
 from api.models import models
+import config
+
+def _last_bpmn_data_for_user_statement(user_id: int, project_id: int) -> Select:
+    return (
+        select(models.BPMNData)
+        .join(models.Project)
+        .where(models.Project.user_id == user_id)
+        .where(models.Project.id == project_id)
+        .order_by(models.BPMNData.id.desc())
+        .limit(1)
+    )
+
 
 def get_last_bpmn_data_for_user(db: Session, user_id: int, project_id: int) -> models.BPMNData:
     """
@@ -14,13 +36,22 @@ def get_last_bpmn_data_for_user(db: Session, user_id: int, project_id: int) -> m
     - BPMNData object.
     """
  
+    return db.scalars(_last_bpmn_data_for_user_statement(user_id, project_id)).first()
+
+
+async def aget_last_bpmn_data_for_user(db: AsyncSession, user_id: int, project_id: int) -> models.BPMNData:
+    """Async version of `get_last_bpmn_data_for_user`."""
+    return (await db.scalars(_last_bpmn_data_for_user_statement(user_id, project_id))).first()
+
+
+def _last_bpmn_extraction_for_user_statement(user_id: int, project_id: int) -> Select:
     return (
-        db.query(models.BPMNData)
+        select(models.BPMNExtraction)
         .join(models.Project)
-        .filter(models.Project.user_id == user_id)
-        .filter(models.Project.id == project_id)
-        .order_by(models.BPMNData.created_at.desc())
-        .first()
+        .where(models.Project.user_id == user_id)
+        .where(models.Project.id == project_id)
+        .order_by(models.BPMNExtraction.created_at.desc())
+        .limit(1)
     )
 
 
@@ -37,11 +68,429 @@ def get_last_bpmn_extraction_for_user(db: Session, user_id: int, project_id: int
     - BPMNExtraction object.
     """
 
+    return db.scalars(_last_bpmn_extraction_for_user_statement(user_id, project_id)).first()
+
+
+async def aget_last_bpmn_extraction_for_user(db: AsyncSession, user_id: int, project_id: int) -> models.BPMNExtraction:
+    """Async version of `get_last_bpmn_extraction_for_user`."""
+    return (await db.scalars(_last_bpmn_extraction_for_user_statement(user_id, project_id))).first()
+
+
+def _maturity_entries_statement(user_id: int, project_id: int) -> Select:
+    dimension_order = case(
+        {dimension: position for position, dimension in enumerate(models.MATURITY_DIMENSION_ORDER)},
+        value=models.MaturityAssessment.dimension
+    )
+
     return (
-        db.query(models.BPMNExtraction)
-        .join(models.Project)
-        .filter(models.Project.user_id == user_id)
-        .filter(models.Project.id == project_id)
-        .order_by(models.BPMNExtraction.created_at.desc())
-        .first()
+        select(models.MaturityAssessment)
+        .where(models.MaturityAssessment.project_id == project_id)
+        .where(models.MaturityAssessment.user_id == user_id)
+        .order_by(dimension_order, models.MaturityAssessment.id)
+    )
+
+
+def get_maturity_entries(db: Session, user_id: int, project_id: int) -> List[models.MaturityAssessment]:
+    """
+    Retrieve the maturity entries of all dimensions of a project with one indexed query.
+
+    Parameters:
+    - db: Database session.
+    - user_id: ID of the user.
+    - project_id: ID of the project.
+
+    Returns:
+    - List of MaturityAssessment objects (instances of the per-dimension models), ordered by
+      `models.MATURITY_DIMENSION_ORDER`.
+    """
+    return db.scalars(_maturity_entries_statement(user_id, project_id)).all()
+
+
+async def aget_maturity_entries(db: AsyncSession, user_id: int, project_id: int) -> List[models.MaturityAssessment]:
+    """Async version of `get_maturity_entries`."""
+    return (await db.scalars(_maturity_entries_statement(user_id, project_id))).all()
+
+
+def _merge_maturity_statements(
+    maturity_model: Type[models.MaturityAssessment],
+    user_id: int,
+    project_id: int,
+    ai_response: Optional[Iterable[Dict[str, Any]]],
+    questionnaire_entries: Optional[Iterable[models.QuestionnaireEntry]]
+) -> Tuple[List[str], Optional[Insert], Delete]:
+    """Resolve the precedence of the entries and build the upsert and delete statements."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for message in ai_response or []:
+        merged[message.get("Label")] = {
+            "label": message.get("Label"),
+            "level": int(message.get("Level")),
+            "justification": message.get("Justification")
+        }
+    for entry in questionnaire_entries or []:
+        merged[entry.category] = {
+            "label": entry.category,
+            "level": entry.answer_number,
+            "justification": entry.description
+        }
+
+    table = models.MaturityAssessment.__table__
+    dimension = maturity_model.__mapper__.polymorphic_identity
+
+    upsert = None
+    if merged:
+        upsert = insert(table).values([
+            {**data, "dimension": dimension, "user_id": user_id, "project_id": project_id}
+            for data in merged.values()
+        ])
+        upsert = upsert.on_conflict_do_update(
+            constraint="uq_maturity_assessment_project_user_dimension_label",
+            set_={
+                "level": upsert.excluded.level,
+                "justification": upsert.excluded.justification
+            }
+        ).returning(table.c.label, table.c.level, table.c.justification)
+
+    stale = (
+        table.delete()
+        .where(table.c.project_id == project_id)
+        .where(table.c.user_id == user_id)
+        .where(table.c.dimension == dimension)
+        .where(table.c.label.not_in(list(merged)))
     )
+
+    return list(merged), upsert, stale
+
+
+def merge_maturity_entries(
+    db: Session,
+    maturity_model: Type[models.MaturityAssessment],
+    user_id: int,
+    project_id: int,
+    ai_response: Optional[Iterable[Dict[str, Any]]] = None,
+    questionnaire_entries: Optional[Iterable[models.QuestionnaireEntry]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Replace the maturity entries of one dimension of a project with the merged AI evaluation
+    and questionnaire answers.
+
+    The precedence is resolved in memory: the last AI evaluation of a label wins and a
+    questionnaire answer overrides the AI evaluation of its category. The final state is then
+    written with one `INSERT ... ON CONFLICT DO UPDATE ... RETURNING` on the
+    (project_id, user_id, dimension, label) constraint and one `DELETE` of the labels that are
+    no longer evaluated, independent of the number of labels. The caller commits.
+
+    Parameters:
+    - db: Database session.
+    - maturity_model: The model of the dimension, e.g. MaturityModelInformation.
+    - user_id: ID of the user.
+    - project_id: ID of the project.
+    - ai_response: The AI evaluation, a list of dicts with "Label", "Level" and "Justification".
+    - questionnaire_entries: QuestionnaireEntry objects whose answers override the AI levels.
+
+    Returns:
+    - List of the saved entries as dicts with "label", "level" and "justification".
+
+    Raises:
+    - ValueError: If an AI level is not a number.
+    """
+    labels, upsert, stale = _merge_maturity_statements(
+        maturity_model, user_id, project_id, ai_response, questionnaire_entries
+    )
+
+    saved = {}
+    if upsert is not None:
+        saved = {row.label: dict(row._mapping) for row in db.execute(upsert)}
+
+    db.execute(stale)
+
+    return [saved[label] for label in labels]
+
+
+async def amerge_maturity_entries(
+    db: AsyncSession,
+    maturity_model: Type[models.MaturityAssessment],
+    user_id: int,
+    project_id: int,
+    ai_response: Optional[Iterable[Dict[str, Any]]] = None,
+    questionnaire_entries: Optional[Iterable[models.QuestionnaireEntry]] = None
+) -> List[Dict[str, Any]]:
+    """Async version of `merge_maturity_entries`."""
+    labels, upsert, stale = _merge_maturity_statements(
+        maturity_model, user_id, project_id, ai_response, questionnaire_entries
+    )
+
+    saved = {}
+    if upsert is not None:
+        saved = {row.label: dict(row._mapping) for row in await db.execute(upsert)}
+
+    await db.execute(stale)
+
+    return [saved[label] for label in labels]
+
+
+def _last_bpmn_data_statement(project_id: int) -> Select:
+    return (
+        select(models.BPMNData)
+        .where(models.BPMNData.project_id == project_id)
+        .order_by(models.BPMNData.id.desc())
+        .limit(1)
+    )
+
+
+def get_last_bpmn_data(db: Session, project_id: int) -> Optional[models.BPMNData]:
+    """
+    Retrieve the last saved BPMN data of a project.
+
+    The lookup is a single seek on the (project_id, id) index, independent of the length of
+    the history.
+
+    Parameters:
+    - db: Database session.
+    - project_id: ID of the project.
+
+    Returns:
+    - BPMNData object or None.
+    """
+
+    return db.scalars(_last_bpmn_data_statement(project_id)).first()
+
+
+async def aget_last_bpmn_data(db: AsyncSession, project_id: int) -> Optional[models.BPMNData]:
+    """Async version of `get_last_bpmn_data`."""
+    return (await db.scalars(_last_bpmn_data_statement(project_id))).first()
+
+
+def bpmn_content_hash(content: str) -> str:
+    """
+    Return the SHA-256 hex digest of a BPMN XML, as used for the autosave ETags.
+
+    Parameters:
+    - content: The BPMN XML.
+
+    Returns:
+    - The hex digest of the UTF-8 encoded content.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _compress_bpmn(content: str) -> bytes:
+    return zlib.compress(content.encode("utf-8"))
+
+
+def _decompress_bpmn(compressed_content: Optional[bytes], raw_content: Optional[str]) -> str:
+    if compressed_content is not None:
+        return zlib.decompress(compressed_content).decode("utf-8")
+    return raw_content
+
+
+async def abpmn_content(data: models.BPMNData) -> str:
+    """
+    Return the BPMN XML of a saved version, decompressed in a worker thread, so that a large
+    process map does not block the event loop.
+
+    Parameters:
+    - data: The BPMNData object.
+
+    Returns:
+    - The BPMN XML.
+    """
+    return await asyncio.to_thread(_decompress_bpmn, data.compressed_content, data.raw_content)
+
+
+async def aparse_bpmn_data(data: models.BPMNData) -> BPMNModel:
+    """
+    Decompress and parse a saved BPMN version in a worker thread.
+
+    Parameters:
+    - data: The BPMNData object.
+
+    Returns:
+    - The parsed process map.
+
+    Raises:
+    - BPMNParseError: If the BPMN XML cannot be parsed.
+    """
+    def parse() -> BPMNModel:
+        return parse_bpmn(_decompress_bpmn(compressed_content, raw_content))
+
+    compressed_content, raw_content = data.compressed_content, data.raw_content
+    return await asyncio.to_thread(parse)
+
+
+def _backfill_bpmn_hash(project: models.Project, last_saved_data: Optional[models.BPMNData]) -> Optional[str]:
+    if last_saved_data is None:
+        return None
+    project.bpmn_content_hash = last_saved_data.content_hash or bpmn_content_hash(last_saved_data.content)
+    return project.bpmn_content_hash
+
+
+async def _abackfill_bpmn_hash(project: models.Project, last_saved_data: Optional[models.BPMNData]) -> Optional[str]:
+    if last_saved_data is None:
+        return None
+    if last_saved_data.content_hash is None:
+        project.bpmn_content_hash = await asyncio.to_thread(bpmn_content_hash, await abpmn_content(last_saved_data))
+    else:
+        project.bpmn_content_hash = last_saved_data.content_hash
+    return project.bpmn_content_hash
+
+
+def get_project_bpmn_hash(db: Session, project: models.Project) -> Optional[str]:
+    """
+    Return the content hash of the last saved BPMN version of a project.
+
+    Projects saved before the hash was stored on the project are backfilled from their
+    last version on first access.
+
+    Parameters:
+    - db: Database session.
+    - project: The project.
+
+    Returns:
+    - The hex digest, or None if the project has no saved BPMN data.
+    """
+    if project.bpmn_content_hash is None:
+        return _backfill_bpmn_hash(project, get_last_bpmn_data(db, project.id))
+    return project.bpmn_content_hash
+
+
+async def aget_project_bpmn_hash(db: AsyncSession, project: models.Project) -> Optional[str]:
+    """Async version of `get_project_bpmn_hash`."""
+    if project.bpmn_content_hash is None:
+        return await _abackfill_bpmn_hash(project, await aget_last_bpmn_data(db, project.id))
+    return project.bpmn_content_hash
+
+
+def _new_bpmn_version(db, project: models.Project, compressed_content: bytes, content_hash: str) -> models.BPMNData:
+    db_entry = models.BPMNData(
+        compressed_content=compressed_content,
+        content_hash=content_hash,
+        project_id=project.id
+    )
+    db.add(db_entry)
+    project.bpmn_content_hash = content_hash
+    return db_entry
+
+
+def save_bpmn_version(db: Session, project: models.Project, content: str) -> Optional[models.BPMNData]:
+    """
+    Add a compressed version of the BPMN XML of a project to the session, unless it equals
+    the last saved version. Older versions are thinned out by `prune_bpmn_history`.
+
+    Parameters:
+    - db: Database session.
+    - project: The project.
+    - content: The BPMN XML.
+
+    Returns:
+    - The new BPMNData object, or None if the content is unchanged.
+    """
+    content_hash = bpmn_content_hash(content)
+    if get_project_bpmn_hash(db, project) == content_hash:
+        return None
+
+    db_entry = _new_bpmn_version(db, project, _compress_bpmn(content), content_hash)
+    prune_bpmn_history(db, project.id)
+    return db_entry
+
+
+async def asave_bpmn_version(db: AsyncSession, project: models.Project, content: str) -> Optional[models.BPMNData]:
+    """Async version of `save_bpmn_version`; the hash and the compression run in a worker thread."""
+    content_hash = await asyncio.to_thread(bpmn_content_hash, content)
+    if await aget_project_bpmn_hash(db, project) == content_hash:
+        return None
+
+    db_entry = _new_bpmn_version(db, project, await asyncio.to_thread(_compress_bpmn, content), content_hash)
+    await aprune_bpmn_history(db, project.id)
+    return db_entry
+
+
+def _older_bpmn_versions_statement(project_id: int) -> Select:
+    return (
+        select(models.BPMNData.id, models.BPMNData.created_at)
+        .where(models.BPMNData.project_id == project_id)
+        .order_by(models.BPMNData.id.desc())
+        .offset(config.BPMN_HISTORY_KEEP_RECENT)
+    )
+
+
+def _obsolete_bpmn_versions(older_versions: Iterable[Tuple[int, Optional[datetime]]]) -> List[int]:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=config.BPMN_HISTORY_RETENTION_DAYS)
+    kept_days = set()
+    obsolete_ids = []
+    for version_id, created_at in older_versions:
+        if created_at is not None and created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        if created_at is None or created_at < cutoff or created_at.date() in kept_days:
+            obsolete_ids.append(version_id)
+        else:
+            kept_days.add(created_at.date())
+    return obsolete_ids
+
+
+def _delete_bpmn_versions_statement(version_ids: List[int]) -> Delete:
+    return (
+        delete(models.BPMNData)
+        .where(models.BPMNData.id.in_(version_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def prune_bpmn_history(db: Session, project_id: int) -> int:
+    """
+    Apply the retention policy to the saved BPMN versions of a project.
+
+    The newest `config.BPMN_HISTORY_KEEP_RECENT` versions are kept. Of the older versions,
+    only the last one of each day is kept, and versions older than
+    `config.BPMN_HISTORY_RETENTION_DAYS` are removed.
+
+    Parameters:
+    - db: Database session.
+    - project_id: ID of the project.
+
+    Returns:
+    - The number of removed versions.
+    """
+    obsolete_ids = _obsolete_bpmn_versions(db.execute(_older_bpmn_versions_statement(project_id)).all())
+    if obsolete_ids:
+        db.execute(_delete_bpmn_versions_statement(obsolete_ids))
+    return len(obsolete_ids)
+
+
+async def aprune_bpmn_history(db: AsyncSession, project_id: int) -> int:
+    """Async version of `prune_bpmn_history`."""
+    obsolete_ids = _obsolete_bpmn_versions((await db.execute(_older_bpmn_versions_statement(project_id))).all())
+    if obsolete_ids:
+        await db.execute(_delete_bpmn_versions_statement(obsolete_ids))
+    return len(obsolete_ids)
+
+
+async def aread_text_file(path: str) -> str:
+    """
+    Read a text file in a worker thread, so that the event loop is not blocked.
+
+    Parameters:
+    - path: Path of the file.
+
+    Returns:
+    - The content of the file.
+    """
+    def read() -> str:
+        with open(path, 'r') as file:
+            return file.read()
+
+    return await asyncio.to_thread(read)
+
+
+async def awrite_text_file(path: str, content: str) -> None:
+    """
+    Write a text file in a worker thread, so that the event loop is not blocked.
+
+    Parameters:
+    - path: Path of the file.
+    - content: The content to write.
+    """
+    def write() -> None:
+        with open(path, 'w') as file:
+            file.write(content)
+
+    await asyncio.to_thread(write)
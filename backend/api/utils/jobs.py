@@ -0,0 +1,410 @@
+"""
+Background jobs for the long running report and evaluation generation.
+
+A job is a row of the `jobs` table. `JobQueue.submit` inserts it and returns immediately;
+the `JobQueue` of every worker process claims due jobs with `SELECT ... FOR UPDATE SKIP LOCKED`
+and runs them in `JOB_WORKERS` asyncio tasks. The queue lives in the application database,
+so no broker is needed, a job survives the request that submitted it and any worker process
+can run it. The result or the error is saved on the row, where clients poll it or follow it
+as Server-Sent Events.
+
+- Deduplication: submitting a job whose kind, user, project and language match a queued or
+  running job returns that job (unique partial index on `dedup_key`).
+- Per-user caps: a user has at most `JOB_MAX_RUNNING_PER_USER` running and
+  `JOB_MAX_QUEUED_PER_USER` queued jobs. The claims of the jobs of a user are serialised
+  with a transaction-level advisory lock, so that workers cannot exceed the cap together.
+- Retries: a job that failed because of a transient error (a connection error of the database
+  or the model API, a rate limit or a server error of the model API) is retried up to
+  `JOB_MAX_ATTEMPTS` times with exponential backoff (`JOB_RETRY_BACKOFF_SECONDS`); any other
+  error fails the job.
+- Timeouts: a job running longer than `JOB_TIMEOUT_SECONDS` is cancelled and fails, as it would
+  most likely time out again. Running jobs of a process that died are queued again after that
+  time; jobs interrupted by a shutdown are queued again immediately.
+
+The model calls of a job are recorded in the cost ledger like the calls of a request, with
+the endpoint `/jobs/<kind>`, including the calls of an attempt that failed or timed out. The job kinds are registered with `JobQueue.register`.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import openai
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, exc, func, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+import config
+from ai_tools.intellichek.chains import track_usage
+from ai_tools.intellichek.providers import aget_chat_model
+from api.models import models
+from api.utils.costs import record_remaining_calls
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Interval of the check for jobs of dead processes
+REAP_INTERVAL_SECONDS = 60
+
+# First key of the advisory locks of the job claims of a user (the second key is the user ID)
+CLAIM_LOCK_NAMESPACE = 4242
+
+# Errors that may not occur again when a job is retried; a job that ran into `JOB_TIMEOUT_SECONDS`
+# (asyncio.TimeoutError) is not retried
+TRANSIENT_ERRORS = (
+    exc.OperationalError,
+    exc.InterfaceError,
+    exc.TimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# A job kind: called with a session, the user, the job and the chat model, returns the result
+JobHandler = Callable[[AsyncSession, models.User, models.Job, Any], Awaitable[Any]]
+
+class JobQueueFull(Exception):
+    """The user has too many queued jobs."""
+
+def dedup_key(kind: str, user_id: int, project_id: int, language: str) -> str:
+    """Return the key of identical jobs."""
+    return hashlib.sha256(json.dumps([kind, user_id, project_id, language]).encode("utf-8")).hexdigest()
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a job failed because of a transient error, also if a handler wrapped it in an HTTPException."""
+    if isinstance(error, asyncio.TimeoutError):
+        # The job ran into the job timeout
+        return False
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, TRANSIENT_ERRORS) or getattr(error, "connection_invalidated", False):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    if isinstance(error, asyncio.TimeoutError):
+        return "The job timed out."
+    return str(error)
+
+class JobQueue:
+    """Runs the queued jobs of the `jobs` table in background tasks of the process."""
+
+    def __init__(
+        self,
+        workers: int,
+        poll_seconds: float,
+        max_attempts: int,
+        retry_backoff_seconds: float,
+        timeout_seconds: float,
+        max_running_per_user: int,
+        max_queued_per_user: int
+    ):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.max_running_per_user = max_running_per_user
+        self.max_queued_per_user = max_queued_per_user
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._active: Set[int] = set()
+        self._last_reap = 0.0
+        self._succeeded = 0
+        self._failed = 0
+        self._retried = 0
+
+    def register(self, kind: str) -> Callable[[JobHandler], JobHandler]:
+        """Register the handler of a job kind (decorator)."""
+        def decorator(handler: JobHandler) -> JobHandler:
+            self._handlers[kind] = handler
+            return handler
+        return decorator
+
+    @property
+    def kinds(self) -> Tuple[str, ...]:
+        return tuple(self._handlers)
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop."""
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop the worker tasks and queue their running jobs again."""
+        interrupted = set(self._active)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if not interrupted:
+            return
+        # The interrupted attempt does not count
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.Job)
+                .where(models.Job.id.in_(interrupted), models.Job.status == RUNNING)
+                .values(status=QUEUED, attempts=models.Job.attempts - 1, run_after=datetime.utcnow())
+            )
+            await db.commit()
+
+    async def submit(self, db: AsyncSession, kind: str, user_id: int, project_id: int, language: str) -> Tuple[models.Job, bool]:
+        """
+        Queue a job, unless an identical job is queued or running.
+
+        Parameters:
+        - db: Async database session.
+        - kind: A registered job kind.
+        - user_id: ID of the user.
+        - project_id: ID of the project.
+        - language: Language of the generated text.
+
+        Returns:
+        - The job and whether it is an identical job that was already queued or running.
+
+        Raises:
+        - ValueError: If the job kind is unknown.
+        - JobQueueFull: If the user has `max_queued_per_user` queued jobs.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        key = dedup_key(kind, user_id, project_id, language)
+        existing = await self._in_flight(db, key)
+        if existing is not None:
+            return existing, True
+
+        queued = await db.scalar(
+            select(func.count()).select_from(models.Job)
+            .where(models.Job.user_id == user_id, models.Job.status == QUEUED)
+        )
+        if queued >= self.max_queued_per_user:
+            raise JobQueueFull()
+
+        job = models.Job(
+            kind=kind, user_id=user_id, project_id=project_id, language=language,
+            dedup_key=key, status=QUEUED, attempts=0
+        )
+        db.add(job)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # An identical job was submitted concurrently
+            await db.rollback()
+            existing = await self._in_flight(db, key)
+            if existing is None:
+                raise
+            return existing, True
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job, False
+
+    async def _in_flight(self, db: AsyncSession, key: str) -> Optional[models.Job]:
+        return (await db.scalars(
+            select(models.Job).where(models.Job.dedup_key == key, models.Job.status.in_([QUEUED, RUNNING]))
+        )).first()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the counters of the workers of this process."""
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "active_jobs": len(self._active),
+            "succeeded": self._succeeded,
+            "failed": self._failed,
+            "retried": self._retried,
+            "max_attempts": self.max_attempts,
+            "timeout_seconds": self.timeout_seconds,
+            "max_running_per_user": self.max_running_per_user,
+            "max_queued_per_user": self.max_queued_per_user,
+        }
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Claiming a job failed")
+                job = None
+
+            if job is None:
+                await self._reap()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._execute(job)
+
+    async def _claim(self) -> Optional[models.Job]:
+        """Mark the next due job of a user below the running cap as running and return it."""
+        now = datetime.utcnow()
+        running = aliased(models.Job)
+        running_of_user = (
+            select(func.count())
+            .where(running.user_id == models.Job.user_id, running.status == RUNNING)
+            .scalar_subquery()
+        )
+        # Users whose cap another worker reached while this one waited for the lock
+        capped: Set[int] = set()
+        async with AsyncSessionLocal() as db:
+            while True:
+                job = (await db.scalars(
+                    select(models.Job)
+                    .where(
+                        models.Job.status == QUEUED,
+                        models.Job.run_after <= now,
+                        models.Job.user_id.notin_(capped),
+                        running_of_user < self.max_running_per_user
+                    )
+                    .order_by(models.Job.run_after, models.Job.id)
+                    .limit(1)
+                    .with_for_update(of=models.Job, skip_locked=True)
+                )).first()
+                if job is None:
+                    return None
+
+                # The count above does not see the jobs that other workers are claiming for
+                # the same user; the lock waits for their claims, which are committed when
+                # it is granted, and the count is repeated
+                await db.execute(
+                    text("SELECT pg_advisory_xact_lock(:namespace, :user_id)"),
+                    {"namespace": CLAIM_LOCK_NAMESPACE, "user_id": job.user_id}
+                )
+                running_count = await db.scalar(
+                    select(func.count()).select_from(models.Job)
+                    .where(models.Job.user_id == job.user_id, models.Job.status == RUNNING)
+                )
+                if running_count < self.max_running_per_user:
+                    break
+
+                capped.add(job.user_id)
+                await db.rollback()
+
+            job.status = RUNNING
+            job.attempts += 1
+            job.started_at = now
+            await db.commit()
+            return job
+
+    async def _execute(self, job: models.Job) -> None:
+        self._active.add(job.id)
+        try:
+            with track_usage(endpoint=f"/jobs/{job.kind}", user_id=job.user_id, project_id=job.project_id) as tracker:
+                try:
+                    result = await asyncio.wait_for(self._run(job), timeout=self.timeout_seconds)
+                finally:
+                    # A failed or timed out attempt was paid for as well
+                    record_remaining_calls(tracker)
+        except Exception as e:
+            await self._fail(job, e)
+        else:
+            await self._finish(job, result)
+        finally:
+            self._active.discard(job.id)
+
+    async def _run(self, job: models.Job) -> Any:
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            raise HTTPException(status_code=400, detail=f"Unknown job kind: {job.kind}")
+
+        async with AsyncSessionLocal() as db:
+            user = await db.get(models.User, job.user_id)
+            if user is None:
+                raise HTTPException(status_code=404, detail="User not found.")
+            model = await aget_chat_model()
+            return await handler(db, user, job, model)
+
+    async def _finish(self, job: models.Job, result: Any) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(models.Job).where(models.Job.id == job.id)
+                    .values(status=SUCCEEDED, result=jsonable_encoder(result), error=None, finished_at=datetime.utcnow())
+                )
+                await db.commit()
+            self._succeeded += 1
+        except Exception:
+            logger.exception("Saving the result of job %s failed", job.id)
+
+    async def _fail(self, job: models.Job, error: Exception) -> None:
+        now = datetime.utcnow()
+        values: Dict[str, Any] = {"error": _error_message(error)}
+        retry = _is_retryable(error) and job.attempts < self.max_attempts
+        if retry:
+            backoff = self.retry_backoff_seconds * 2 ** (job.attempts - 1)
+            values.update(status=QUEUED, run_after=now + timedelta(seconds=backoff))
+        else:
+            values.update(status=FAILED, finished_at=now)
+        logger.warning("Job %s (%s) failed on attempt %s: %s", job.id, job.kind, job.attempts, values["error"])
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(models.Job).where(models.Job.id == job.id).values(**values))
+                await db.commit()
+        except Exception:
+            logger.exception("Saving the failure of job %s failed", job.id)
+            return
+        if retry:
+            self._retried += 1
+        else:
+            self._failed += 1
+
+    async def _reap(self) -> None:
+        """Queue the jobs again that a dead process left running, or fail them after the last attempt."""
+        if time.monotonic() - self._last_reap < REAP_INTERVAL_SECONDS:
+            return
+        self._last_reap = time.monotonic()
+
+        now = datetime.utcnow()
+        stale = and_(
+            models.Job.status == RUNNING,
+            models.Job.started_at < now - timedelta(seconds=self.timeout_seconds + REAP_INTERVAL_SECONDS)
+        )
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(models.Job).where(stale, models.Job.attempts >= self.max_attempts)
+                    .values(status=FAILED, error="The job was interrupted.", finished_at=now)
+                )
+                await db.execute(
+                    update(models.Job).where(stale)
+                    .values(status=QUEUED, error="The job was interrupted.", run_after=now)
+                )
+                await db.commit()
+        except Exception:
+            logger.exception("Queueing interrupted jobs again failed")
+
+job_queue = JobQueue(
+    workers=config.JOB_WORKERS,
+    poll_seconds=config.JOB_POLL_SECONDS,
+    max_attempts=config.JOB_MAX_ATTEMPTS,
+    retry_backoff_seconds=config.JOB_RETRY_BACKOFF_SECONDS,
+    timeout_seconds=config.JOB_TIMEOUT_SECONDS,
+    max_running_per_user=config.JOB_MAX_RUNNING_PER_USER,
+    max_queued_per_user=config.JOB_MAX_QUEUED_PER_USER
+)
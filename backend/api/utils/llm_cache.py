@@ -0,0 +1,143 @@
+"""
+The `database` backend of the response cache of `ai_tools.intellichek.cache`.
+
+The responses are stored in the `llm_response_cache` table, so all worker processes share
+them. `main.py` registers the backend on startup, which keeps the `ai_tools` package
+independent of the database layer.
+
+- A response is written with one `INSERT ... ON CONFLICT DO UPDATE`, so workers storing
+  the same response concurrently do not fail on the primary key.
+- A hit only updates `last_used_at` if it is older than `LAST_USED_RESOLUTION_SECONDS`, so
+  frequent hits of the same response are reads.
+- Expired and least recently used entries are evicted by a background task every
+  `LLM_CACHE_EVICT_SECONDS` instead of on every write; in between the table may hold more
+  than `LLM_CACHE_MAX_ENTRIES` entries.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from langchain_core.load import dumpd, load
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+
+import config
+from ai_tools.intellichek.cache import MISSING, ResponseCache, get_cache
+from api.models import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Precision of `last_used_at`: a hit within this time of the last update does not write
+LAST_USED_RESOLUTION_SECONDS = 300
+
+class DatabaseResponseCache(ResponseCache):
+    """Cache stored in the `llm_response_cache` table, shared by all workers."""
+
+    name = "database"
+    blocking = True
+
+    def _get(self, key: str) -> Any:
+        db = SessionLocal()
+        try:
+            entry = (
+                db.query(models.LLMResponseCache.response, models.LLMResponseCache.created_at, models.LLMResponseCache.last_used_at)
+                .filter(models.LLMResponseCache.key == key)
+                .first()
+            )
+            if entry is None:
+                return MISSING
+            now = datetime.utcnow()
+            if now - entry.created_at > timedelta(seconds=self.ttl_seconds):
+                # Deleted by the next eviction
+                return MISSING
+            if now - entry.last_used_at > timedelta(seconds=LAST_USED_RESOLUTION_SECONDS):
+                db.execute(
+                    update(models.LLMResponseCache)
+                    .where(models.LLMResponseCache.key == key)
+                    .values(last_used_at=now)
+                )
+                db.commit()
+            return load(json.loads(entry.response))
+        finally:
+            db.close()
+
+    def _set(self, key: str, value: Any):
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            statement = insert(models.LLMResponseCache).values(
+                key=key,
+                response=json.dumps(dumpd(value)),
+                created_at=now,
+                last_used_at=now
+            )
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[models.LLMResponseCache.key],
+                set_={
+                    "response": statement.excluded.response,
+                    "created_at": statement.excluded.created_at,
+                    "last_used_at": statement.excluded.last_used_at,
+                }
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def evict(self) -> int:
+        """
+        Delete the expired entries and the least recently used entries beyond `max_entries`.
+
+        Returns:
+            int: The number of deleted entries.
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            deleted = db.query(models.LLMResponseCache).filter(
+                models.LLMResponseCache.created_at < now - timedelta(seconds=self.ttl_seconds)
+            ).delete(synchronize_session=False)
+
+            # Keep the most recently used entries
+            stale = (
+                db.query(models.LLMResponseCache.key)
+                .order_by(models.LLMResponseCache.last_used_at.desc())
+                .offset(self.max_entries)
+            )
+            deleted += db.query(models.LLMResponseCache).filter(
+                models.LLMResponseCache.key.in_(stale.scalar_subquery())
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def size(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(models.LLMResponseCache).count()
+        finally:
+            db.close()
+
+async def evict_llm_cache_periodically() -> None:
+    """Background task that evicts the entries of the database response cache every `LLM_CACHE_EVICT_SECONDS`."""
+    response_cache = get_cache()
+    if not isinstance(response_cache, DatabaseResponseCache):
+        return
+    while True:
+        try:
+            deleted = await asyncio.to_thread(response_cache.evict)
+            if deleted:
+                logger.info("Evicted %s LLM cache entries", deleted)
+        except Exception:
+            logger.exception("Evicting the LLM cache entries failed")
+        await asyncio.sleep(config.LLM_CACHE_EVICT_SECONDS)
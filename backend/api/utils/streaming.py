@@ -0,0 +1,61 @@
+"""
+Server-Sent Events (SSE) for the streamed AI responses.
+
+Routes that generate long texts offer a streaming mode (`?stream=true`), answered with a
+`text/event-stream` of these events:
+
+- `token`: A chunk of the response as it is generated; the data is a JSON string.
+- `done`: The end of the stream; the data is the JSON body of the non-streaming mode, sent
+  after the complete response has been saved.
+- `error`: The generation or saving failed; the data is a JSON object with a `detail`.
+"""
+
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from fastapi.responses import StreamingResponse
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with JSON encoded data."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_ai_response(
+    chunks: AsyncIterator[str],
+    on_complete: Optional[Callable[[str], Awaitable[Dict[str, Any]]]] = None,
+    on_end: Optional[Callable[[], None]] = None
+) -> AsyncIterator[str]:
+    """
+    Turn the chunks of an AI response into Server-Sent Events.
+
+    Parameters:
+    - chunks: The chunks of the response.
+    - on_complete: Called with the complete response before the `done` event, e.g. to save it;
+      returns the data of the `done` event. Without it, the data is {"message": response}.
+    - on_end: Called when the stream ends, also if it failed or the client disconnected,
+      e.g. to record the cost of the model calls.
+
+    Yields:
+    - str: The formatted events.
+    """
+    parts = []
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event("token", chunk)
+
+        response = "".join(parts)
+        body = await on_complete(response) if on_complete is not None else {"message": response}
+        yield sse_event("done", body)
+    except Exception as e:
+        yield sse_event("error", {"detail": f"An unexpected error occurred: {str(e)}"})
+    finally:
+        if on_end is not None:
+            on_end()
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Return a streaming response of Server-Sent Events that is not buffered by proxies."""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,5 +1,22 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
 from passlib.context import CryptContext
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+import config
+
+# Hashes with a different cost than BCRYPT_ROUNDS are flagged by needs_update, so that they
+# are rehashed with the configured cost on the next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=config.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=config.BCRYPT_ROUNDS,
+)
 
 def hash_pass(password:str) -> str:
     """
@@ -28,6 +45,125 @@ def verify_password(non_hashed_pass, hashed_pass):
     return pwd_context.verify(non_hashed_pass, hashed_pass)
 
 
+class PasswordHashingOverloaded(Exception):
+    """Exception raised when too many password hashes are waiting for the pool."""
+    pass
+
+
+class PasswordHasher:
+    """
+    Runs the bcrypt hashes in a dedicated, bounded thread pool.
+
+    bcrypt releases the GIL, so the hashes run in parallel on the worker threads without
+    blocking the event loop or occupying the threadpool of the sync endpoints. At most
+    `max_queue` hashes wait for a worker; further requests are rejected instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._max_queued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _run(self, submitted_at: float, function, *args):
+        wait = time.monotonic() - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    async def run(self, function, *args):
+        """
+        Run a hashing function in the pool.
+
+        Raises:
+            PasswordHashingOverloaded: If `max_queue` hashes are already waiting.
+        """
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise PasswordHashingOverloaded("Too many password hashes are waiting.")
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        future = self._executor.submit(self._run, time.monotonic(), function, *args)
+        future.add_done_callback(self._dequeue_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _dequeue_cancelled(self, future) -> None:
+        # A hash whose caller was cancelled while it waited for a worker never runs `_run`
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return the queue depth and the wait times of the pool."""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "workers": self.workers,
+                "bcrypt_rounds": config.BCRYPT_ROUNDS,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "max_queued": self._max_queued,
+                "average_wait_ms": round(1000 * self._total_wait / started, 2) if started else 0.0,
+                "max_wait_ms": round(1000 * self._max_wait, 2),
+            }
+
+
+password_hasher = PasswordHasher(config.PASSWORD_HASH_WORKERS, config.PASSWORD_HASH_MAX_QUEUE)
+
+
+async def ahash_pass(password: str) -> str:
+    """
+    Hashes the provided password in the password hashing pool.
+
+    Parameters:
+        password (str): The password to be hashed.
+
+    Returns:
+        str: The hashed password.
+
+    Raises:
+        PasswordHashingOverloaded: If the pool is overloaded.
+    """
+    return await password_hasher.run(pwd_context.hash, password)
+
+
+async def averify_and_update_password(non_hashed_pass: str, hashed_pass: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a password in the password hashing pool and rehashes it if the stored hash does
+    not use the configured bcrypt cost.
+
+    Parameters:
+        non_hashed_pass (str): The non-hashed password to be verified.
+        hashed_pass (str): The stored hashed password.
+
+    Returns:
+        tuple: Whether the password matches, and the new hash to store or None if the stored
+        hash is up to date.
+
+    Raises:
+        PasswordHashingOverloaded: If the pool is overloaded.
+    """
+    return await password_hasher.run(pwd_context.verify_and_update, non_hashed_pass, hashed_pass)
+
+
 def is_strong_password(password: str) -> bool:
     """
     Checks if the provided password is strong.
@@ -0,0 +1,79 @@
+"""
+Load test of the event loop of the async route handlers under concurrent database queries.
+
+Runs concurrent "handlers" that each execute a few queries, together with a probe that
+measures how late the event loop wakes it up (the event loop lag), and prints the p50 and
+p99 lag and the duration of both scenarios:
+
+- before: the queries run on the synchronous Session, as in an `async def` handler using
+  `get_db`. Every query blocks the event loop, so the lag grows with the query time.
+- after: the queries run on the AsyncSession of `get_async_db`. The event loop keeps
+  serving other requests while the queries wait for the database.
+
+The queries use `pg_sleep` to simulate the database time of a handler. Run it in the backend
+environment against a development database:
+
+    python benchmark_event_loop.py --handlers 50 --queries 5 --query-ms 20
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+from sqlalchemy import text
+
+from benchmark_utils import ScenarioResults, compare, percentiles
+from database import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+PROBE_INTERVAL = 0.005
+
+async def _probe(lags: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+async def _sync_handler(queries: int, query_seconds: float) -> None:
+    db = SessionLocal()
+    try:
+        for _ in range(queries):
+            db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": query_seconds})
+    finally:
+        db.close()
+
+async def _async_handler(queries: int, query_seconds: float) -> None:
+    async with AsyncSessionLocal() as db:
+        for _ in range(queries):
+            await db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": query_seconds})
+
+async def _run(scenario: str, handlers: int, queries: int, query_seconds: float) -> ScenarioResults:
+    handler = _sync_handler if scenario == "before" else _async_handler
+    lags: List[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(queries, query_seconds) for _ in range(handlers)))
+    duration = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    return {"event loop lag": {**percentiles(lags or [0.0]), "duration_s": round(duration, 2)}}
+
+async def _main(args: argparse.Namespace) -> None:
+    query_seconds = args.query_ms / 1000
+    await compare(lambda scenario: _run(scenario, args.handlers, args.queries, query_seconds))
+
+    await async_engine.dispose()
+    engine.dispose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handlers", type=int, default=50, help="Number of concurrent handlers.")
+    parser.add_argument("--queries", type=int, default=5, help="Queries per handler.")
+    parser.add_argument("--query-ms", type=float, default=20, help="Database time per query in milliseconds.")
+    asyncio.run(_main(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
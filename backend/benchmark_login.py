@@ -0,0 +1,70 @@
+"""
+Benchmark of the password verification of the login under concurrent load.
+
+Simulates bursts of concurrent logins together with cheap requests of sync endpoints, which
+FastAPI runs in its shared threadpool (40 threads by default), and prints the p50 and p99
+latencies of both:
+
+- before: the bcrypt verification runs in the shared threadpool, as in a sync login endpoint.
+- after: the bcrypt verification runs in the dedicated password hashing pool.
+
+No database or server is needed. Run it in the backend environment:
+
+    python benchmark_login.py --logins 200 --requests 400
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import config
+from api.utils.utils import PasswordHasher, pwd_context
+from benchmark_utils import ScenarioResults, compare, percentiles
+
+SHARED_THREADPOOL_SIZE = 40
+
+async def _timed(coroutine, latencies: List[float]) -> None:
+    started = time.perf_counter()
+    await coroutine
+    latencies.append(time.perf_counter() - started)
+
+def _cheap_request() -> None:
+    time.sleep(0.002)
+
+async def _run(scenario: str, logins: int, requests: int, stored_hash: str, workers: int) -> ScenarioResults:
+    loop = asyncio.get_running_loop()
+    shared = ThreadPoolExecutor(max_workers=SHARED_THREADPOOL_SIZE)
+    hasher = PasswordHasher(workers=workers, max_queue=logins)
+
+    async def login():
+        if scenario == "before":
+            await loop.run_in_executor(shared, pwd_context.verify, "password1!", stored_hash)
+        else:
+            await hasher.run(pwd_context.verify, "password1!", stored_hash)
+
+    login_latencies: List[float] = []
+    request_latencies: List[float] = []
+    await asyncio.gather(
+        *(_timed(login(), login_latencies) for _ in range(logins)),
+        *(_timed(loop.run_in_executor(shared, _cheap_request), request_latencies) for _ in range(requests)),
+    )
+    shared.shutdown()
+    return {"login": percentiles(login_latencies), "other requests": percentiles(request_latencies)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200, help="Number of concurrent logins.")
+    parser.add_argument("--requests", type=int, default=400, help="Number of concurrent cheap requests.")
+    parser.add_argument("--workers", type=int, default=config.PASSWORD_HASH_WORKERS,
+                        help="Workers of the password hashing pool (default PASSWORD_HASH_WORKERS).")
+    args = parser.parse_args()
+
+    workers = args.workers
+    stored_hash = pwd_context.hash("password1!")
+    print(f"bcrypt rounds: {config.BCRYPT_ROUNDS}, hashing workers: {workers}, shared threadpool: {SHARED_THREADPOOL_SIZE}")
+    asyncio.run(compare(lambda scenario: _run(scenario, args.logins, args.requests, stored_hash, workers)))
+
+if __name__ == "__main__":
+    main()
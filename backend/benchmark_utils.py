@@ -0,0 +1,42 @@
+"""
+Shared helpers of the benchmark scripts, which compare a scenario before and after a change.
+
+- `percentiles`: Returns the p50 and p99 of measured durations in milliseconds.
+- `compare`: Runs the "before" and the "after" scenario and prints their results.
+"""
+
+import statistics
+from typing import Awaitable, Callable, Dict, List
+
+SCENARIOS = ("before", "after")
+
+# The results of a scenario: the percentiles (and other values) of every measurement
+ScenarioResults = Dict[str, Dict[str, float]]
+
+def percentiles(durations: List[float]) -> Dict[str, float]:
+    """Return the p50 and p99 of durations in seconds, in milliseconds."""
+    durations = sorted(durations)
+    p99_index = max(0, int(round(0.99 * len(durations))) - 1)
+    return {
+        "p50_ms": round(1000 * statistics.median(durations), 1),
+        "p99_ms": round(1000 * durations[p99_index], 1),
+    }
+
+def _format(scenario: str, name: str, values: Dict[str, float]) -> str:
+    line = f"{scenario:<7} {name:<15} p50 {values['p50_ms']:>8} ms   p99 {values['p99_ms']:>8} ms"
+    for key, value in values.items():
+        if key not in ("p50_ms", "p99_ms"):
+            line += f"   {key} {value:>6}"
+    return line
+
+async def compare(run: Callable[[str], Awaitable[ScenarioResults]]) -> None:
+    """
+    Run the scenarios one after the other and print the results.
+
+    Args:
+        run (callable): Runs a scenario ("before" or "after") and returns its results.
+    """
+    for scenario in SCENARIOS:
+        results = await run(scenario)
+        for name, values in results.items():
+            print(_format(scenario, name, values))
@@ -0,0 +1,197 @@
+"""
+Query plan check for the hot queries of the API.
+
+Seeds the configured PostgreSQL database with a realistic amount of data inside a transaction,
+runs `EXPLAIN` on the per-project and per-user queries of the handlers and fails if any of them
+reads one of the filtered tables with a sequential scan. The transaction is rolled back, so the
+check leaves no data behind. Run it after `alembic upgrade head` against a development or CI
+database:
+
+    python check_query_plans.py
+
+Exits with status 1 if a query is not served by an index.
+"""
+
+import sys
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query, Session
+
+from api.models import models
+from database import engine
+
+USERS = 50
+PROJECTS_PER_USER = 20
+ROWS_PER_PROJECT = 20
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (first_name, last_name, municipality, city, country, language, zip_code, email, password)
+    SELECT 'Check', 'User', 'Bolzano', 'Bolzano', 'Italy', 'English', '39100', 'check-' || n || '@example.com', 'x'
+    FROM generate_series(1, :users) AS n
+    """,
+    """
+    INSERT INTO projects (name, user_id, created_at)
+    SELECT 'Check project ' || n, u.id, now()
+    FROM users u CROSS JOIN generate_series(1, :projects_per_user) AS n
+    WHERE u.email LIKE 'check-%@example.com'
+    """,
+    """
+    INSERT INTO bpmn_data (content, project_id)
+    SELECT '<bpmn/>', p.id FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO bpm_extraction (content, project_id, user_id)
+    SELECT 'extraction', p.id, p.user_id FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO questionnaire_entries (project_id, category, maturity_category, question_number, answer_number, description, user_id)
+    SELECT p.id, 'Category ' || n, CASE WHEN n % 2 = 0 THEN 'Information' ELSE 'Organization' END, n, 1, 'answer', p.user_id
+    FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO maturity_assessment (dimension, label, level, justification, user_id, project_id)
+    SELECT d.dimension, 'Label ' || n, 1, 'justification', p.user_id, p.id
+    FROM check_projects p
+    CROSS JOIN (VALUES ('technology'), ('process'), ('information'), ('organisation')) AS d(dimension)
+    CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO roadmaps (kma, start_date, end_date, user_id, project_id)
+    SELECT 'KMA ' || n, '2025-01-01', '2025-04-01', p.user_id, p.id
+    FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO benchmark_model (kma, level_difference, user_id, project_id)
+    SELECT 'KMA ' || n, 1, p.user_id, p.id FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO report_as_is (content, user_id, project_id)
+    SELECT 'report', p.user_id, p.id FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO report_maturity (content, user_id, project_id)
+    SELECT 'report', p.user_id, p.id FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO report_roadmap (content, user_id, project_id)
+    SELECT 'report', p.user_id, p.id FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+    """
+    INSERT INTO chat_info (user_id, project_id, total_cost, created_at, prompt_tokens, completion_tokens)
+    SELECT p.user_id, p.id, 0.01, now() - n * interval '1 hour', 100, 100
+    FROM check_projects p CROSS JOIN generate_series(1, :rows) AS n
+    """,
+]
+
+# Tables that must be read through an index by the hot queries
+CHECKED_TABLES = {
+    "projects", "bpmn_data", "bpm_extraction", "questionnaire_entries", "maturity_assessment",
+    "roadmaps", "benchmark_model", "report_as_is", "report_maturity", "report_roadmap", "chat_info",
+}
+
+def _seed(db: Session) -> None:
+    params = {"users": USERS, "projects_per_user": PROJECTS_PER_USER, "rows": ROWS_PER_PROJECT}
+    db.execute(text(SEED_STATEMENTS[0]), params)
+    db.execute(text(SEED_STATEMENTS[1]), params)
+    db.execute(text("""
+        CREATE TEMPORARY TABLE check_projects ON COMMIT DROP AS
+        SELECT p.id, p.user_id FROM projects p JOIN users u ON u.id = p.user_id
+        WHERE u.email LIKE 'check-%@example.com'
+    """))
+    for statement in SEED_STATEMENTS[2:]:
+        db.execute(text(statement), params)
+    for table in CHECKED_TABLES:
+        db.execute(text(f"ANALYZE {table}"))
+
+def _hot_queries(user_id: int, project_id: int) -> List[Tuple[str, Callable[[Session], Query]]]:
+    """The queries of the handlers, with the filters and orderings they use."""
+    def last_report(report_model):
+        return lambda db: (
+            db.query(report_model)
+            .filter(report_model.project_id == project_id, report_model.user_id == user_id)
+            .order_by(report_model.id.desc())
+            .limit(1)
+        )
+
+    return [
+        ("projects of a user", lambda db: db.query(models.Project).filter(models.Project.user_id == user_id)),
+        ("last BPMN data for user", lambda db: (
+            db.query(models.BPMNData)
+            .join(models.Project)
+            .filter(models.Project.user_id == user_id)
+            .filter(models.Project.id == project_id)
+            .order_by(models.BPMNData.id.desc())
+            .limit(1)
+        )),
+        ("last BPMN extraction for user", lambda db: (
+            db.query(models.BPMNExtraction)
+            .join(models.Project)
+            .filter(models.Project.user_id == user_id)
+            .filter(models.Project.id == project_id)
+            .order_by(models.BPMNExtraction.created_at.desc())
+            .limit(1)
+        )),
+        ("questionnaire entries of a category", lambda db: db.query(models.QuestionnaireEntry).filter(
+            models.QuestionnaireEntry.user_id == user_id,
+            models.QuestionnaireEntry.project_id == project_id,
+            models.QuestionnaireEntry.maturity_category == "Information"
+        )),
+        ("maturity entries of a dimension", lambda db: db.query(models.MaturityModelInformation).filter(
+            models.MaturityModelInformation.user_id == user_id,
+            models.MaturityModelInformation.project_id == project_id
+        )),
+        ("maturity entries of all dimensions", lambda db: (
+            db.query(models.MaturityAssessment)
+            .filter(models.MaturityAssessment.project_id == project_id)
+            .filter(models.MaturityAssessment.user_id == user_id)
+            .order_by(models.MaturityAssessment.dimension, models.MaturityAssessment.id)
+        )),
+        ("roadmaps of a project", lambda db: db.query(models.Roadmap).filter(
+            models.Roadmap.project_id == project_id, models.Roadmap.user_id == user_id
+        )),
+        ("benchmark of a project", lambda db: db.query(models.BenchmarkModel).filter(
+            models.BenchmarkModel.project_id == project_id
+        )),
+        ("last as-is report", last_report(models.ReportAsIs)),
+        ("last maturity report", last_report(models.ReportMaturity)),
+        ("last roadmap report", last_report(models.ReportRoadmap)),
+        ("cost ledger of a user", lambda db: (
+            db.query(models.ChatInfo)
+            .filter(models.ChatInfo.user_id == user_id)
+            .order_by(models.ChatInfo.created_at.desc(), models.ChatInfo.id.desc())
+            .limit(100)
+        )),
+    ]
+
+def _scans(plan: Dict) -> Iterator[Tuple[str, str]]:
+    yield plan["Node Type"], plan.get("Relation Name", "")
+    for child in plan.get("Plans", []):
+        yield from _scans(child)
+
+def main() -> int:
+    failures = 0
+    with Session(engine) as db:
+        try:
+            _seed(db)
+            user_id, project_id = db.execute(text("SELECT user_id, id FROM check_projects ORDER BY id LIMIT 1")).one()
+
+            for name, build in _hot_queries(user_id, project_id):
+                sql = build(db).statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+
+                plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]["Plan"]
+                seq_scans = sorted({relation for node, relation in _scans(plan) if node == "Seq Scan" and relation in CHECKED_TABLES})
+                if seq_scans:
+                    failures += 1
+                    print(f"FAIL  {name}: sequential scan on {', '.join(seq_scans)}")
+                else:
+                    print(f"OK    {name}")
+        finally:
+            db.rollback()
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
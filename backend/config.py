@@ -9,6 +9,69 @@ GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0")) 
 
+# Build the chat model and retrievers on startup instead of on the first AI request
+INTELLICHEK_WARMUP = os.getenv("INTELLICHEK_WARMUP", "false").lower() == "true"
+
+# LLM Response Cache Configuration (backend: memory, database or none)
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+# Interval of the eviction of expired and least recently used entries of the database backend
+LLM_CACHE_EVICT_SECONDS = int(os.getenv("LLM_CACHE_EVICT_SECONDS", "600"))
+
+# Single-flight of identical concurrent LLM calls across worker processes (Postgres advisory lock,
+# requires the database cache backend). The locks are held on a separate pool of this many
+# connections per worker process; calls beyond it are made without the cross-worker lock.
+LLM_SINGLE_FLIGHT_ACROSS_WORKERS = os.getenv("LLM_SINGLE_FLIGHT_ACROSS_WORKERS", "false").lower() == "true"
+LLM_SINGLE_FLIGHT_LOCK_CONNECTIONS = int(os.getenv("LLM_SINGLE_FLIGHT_LOCK_CONNECTIONS", "2"))
+
+# Token Budget: process maps whose prompt (template and process map) has more tokens are split
+# into parts that are sent to the model concurrently, at most this many calls at a time
+LLM_INPUT_TOKEN_BUDGET = int(os.getenv("LLM_INPUT_TOKEN_BUDGET", "8000"))
+LLM_CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", "4"))
+
+# Roadmap Schedule Configuration
+ROADMAP_START_DATE = os.getenv("ROADMAP_START_DATE", "2025-01-01")
+ROADMAP_MONTHS_PER_LEVEL = int(os.getenv("ROADMAP_MONTHS_PER_LEVEL", "3"))
+
+# Vector Store Configuration
+VECTORSTORE_DIR = os.getenv("VECTORSTORE_DIR", "./data/vectorstores")
+
+# BPMN Autosave History: the most recent versions are kept, older ones are thinned out to
+# the last version per day and removed after the retention period
+BPMN_HISTORY_KEEP_RECENT = int(os.getenv("BPMN_HISTORY_KEEP_RECENT", "20"))
+BPMN_HISTORY_RETENTION_DAYS = int(os.getenv("BPMN_HISTORY_RETENTION_DAYS", "90"))
+
+# Authentication User Cache: user records are reused for this many seconds (0 disables the cache)
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Token Revocation: revocations of other workers are picked up after the refresh interval,
+# revocations of expired tokens are purged from the database every purge interval
+TOKEN_REVOCATION_REFRESH_SECONDS = float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "5"))
+TOKEN_REVOCATION_PURGE_SECONDS = int(os.getenv("TOKEN_REVOCATION_PURGE_SECONDS", "3600"))
+
+# Password Hashing: stored hashes with another cost are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Cost Ledger Writer: queued OpenAI calls are written in batches of this size or after this interval;
+# at most this many calls are queued
+COST_WRITER_BATCH_SIZE = int(os.getenv("COST_WRITER_BATCH_SIZE", "100"))
+COST_WRITER_FLUSH_SECONDS = float(os.getenv("COST_WRITER_FLUSH_SECONDS", "2"))
+COST_WRITER_MAX_QUEUE = int(os.getenv("COST_WRITER_MAX_QUEUE", "10000"))
+
+# Background Jobs: every worker process runs queued report and evaluation jobs in this many tasks;
+# failed jobs are retried with exponential backoff, jobs running longer than the timeout are cancelled
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "10"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "600"))
+JOB_MAX_RUNNING_PER_USER = int(os.getenv("JOB_MAX_RUNNING_PER_USER", "2"))
+JOB_MAX_QUEUED_PER_USER = int(os.getenv("JOB_MAX_QUEUED_PER_USER", "10"))
+
 # PostgreSQL Configuration
 POSTGRES_DB = os.getenv("POSTGRES_DB", "")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "")
@@ -16,6 +79,14 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "fraunhoferlab")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "")
 
+# Connection Pool Configuration (per pool, every worker process has a sync and an async pool):
+# connections are checked for liveness before use and replaced after the recycle interval
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "")
 ALGORITHM = os.getenv("ALGORITHM", "")
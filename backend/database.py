@@ -1,21 +1,176 @@
-
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import config
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from typing import Any, Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
 
 POSTGRES_DB = config.POSTGRES_DB
 POSTGRES_USER = config.POSTGRES_USER
 POSTGRES_PASSWORD = config.POSTGRES_PASSWORD
 POSTGRES_HOST = config.POSTGRES_HOST
-POSTGRES_PORT = config.POSTGRES_PORT 
+POSTGRES_PORT = config.POSTGRES_PORT
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+# Checkouts that wait longer than this for a free connection are logged
+SLOW_CHECKOUT_SECONDS = 1.0
+
+class PoolMetrics:
+    """Counters of the connection pool of the process: checkouts, waits for a free connection and hold times."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+            self.hold_seconds_total = 0.0
+            self.hold_seconds_max = 0.0
+
+    def observe_wait(self, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+        if seconds >= SLOW_CHECKOUT_SECONDS:
+            logger.warning("Waited %.2f s for a database connection (timed out: %s)", seconds, timed_out)
+
+    def observe_checkout(self) -> None:
+        with self._lock:
+            self.checkouts += 1
+
+    def observe_checkin(self, held_seconds: float) -> None:
+        with self._lock:
+            self.hold_seconds_total += held_seconds
+            self.hold_seconds_max = max(self.hold_seconds_max, held_seconds)
+
+    def observe_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def observe_invalidation(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self, pool: QueuePool) -> Dict[str, Any]:
+        with self._lock:
+            checkouts = self.checkouts
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "max_overflow": config.DB_MAX_OVERFLOW,
+                "checkouts": checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(1000 * self.wait_seconds_total / checkouts, 2) if checkouts else 0.0,
+                "wait_ms_max": round(1000 * self.wait_seconds_max, 2),
+                "hold_ms_avg": round(1000 * self.hold_seconds_total / checkouts, 2) if checkouts else 0.0,
+                "hold_ms_max": round(1000 * self.hold_seconds_max, 2),
+            }
+
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+class _InstrumentedPoolMixin:
+    """Measures how long a checkout waits for a free connection."""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - started, timed_out)
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics = pool_metrics
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+POOL_OPTIONS = {
+    "pool_size": config.DB_POOL_SIZE,
+    "max_overflow": config.DB_MAX_OVERFLOW,
+    "pool_timeout": config.DB_POOL_TIMEOUT,
+    "pool_recycle": config.DB_POOL_RECYCLE,
+    "pool_pre_ping": config.DB_POOL_PRE_PING,
+}
+
+def _instrument(engine, metrics: PoolMetrics) -> None:
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.observe_connect()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        metrics.observe_checkout()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            metrics.observe_checkin(time.perf_counter() - checked_out_at)
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.observe_invalidation()
+
+# Synchronous engine for the sync route handlers, scripts and migrations
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
+_instrument(engine, pool_metrics)
+
+# Asyncio engine (asyncpg) for the async route handlers, so that queries do not block the event loop
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=InstrumentedAsyncAdaptedQueuePool, **POOL_OPTIONS)
+_instrument(async_engine.sync_engine, async_pool_metrics)
+
+# Separate small pool for the advisory locks of the cross-worker single-flight of model calls
+# (`ai_tools.intellichek.chains`), so that a lock held during a model call does not occupy a
+# connection of the request pool
+lock_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    pool_size=config.LLM_SINGLE_FLIGHT_LOCK_CONNECTIONS,
+    max_overflow=0,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+)
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Return the gauges and counters of the connection pools of this process."""
+    return {
+        "sync": pool_metrics.snapshot(engine.pool),
+        "async": async_pool_metrics.snapshot(async_engine.pool),
+    }
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Objects are not expired on commit: an AsyncSession cannot lazy load expired attributes
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -24,3 +179,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def release_connection(db: Session) -> None:
+    """
+    Return the connection of a session to the pool before a long wait, e.g. a model call.
+
+    The reads of the current transaction are committed without expiring the loaded objects,
+    so they stay usable without a new query. The session checks out a connection again on
+    its next query or flush, e.g. when the results of the model call are saved.
+
+    Parameters:
+    - db: Database session.
+    """
+    if not db.in_transaction():
+        return
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
+
+async def arelease_connection(db: AsyncSession) -> None:
+    """
+    Async version of `release_connection`.
+
+    Parameters:
+    - db: Async database session.
+    """
+    if db.in_transaction():
+        await db.commit()
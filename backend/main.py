@@ -8,12 +8,14 @@ Author: Elias Niederwieser (Fraunhofer Italia)
 Date: 2024
 """
 
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from api.routers.limiter import limiter
 from slowapi.errors import RateLimitExceeded
-from database import engine
+from database import async_engine, engine, get_pool_stats, lock_engine
 import config as config 
 
 from api.routers import (
@@ -21,15 +23,27 @@ from api.routers import (
     users, authentification, projects,
     user_info, bpmn, maturity_models, 
     report, extraction_evaluation, 
-    recaptcha, roadmap, email
+    recaptcha, roadmap, email, jobs
 )
 from api.models import models
+from ai_tools.intellichek import cache as llm_cache
+from ai_tools.intellichek.chains import set_lock_engine
+from ai_tools.intellichek.providers import warm_up
+from api.authentication.revocation import purge_expired_revocations_periodically
+from api.utils.utils import PasswordHashingOverloaded
+from api.utils.costs import LLMUsageMiddleware, cost_writer
+from api.utils.jobs import job_queue
+from api.utils.llm_cache import DatabaseResponseCache, evict_llm_cache_periodically
+from api.authentication.oauth import check_admin_role
 import logging
 
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(docs_url=None, redoc_url=None)
 
+# The ai_tools package does not import the database layer: the database backend of the response
+# cache and the engine of the cross-worker single-flight locks are provided here
+llm_cache.register_backend("database", DatabaseResponseCache)
+set_lock_engine(lock_engine)
+
 app.state.limiter = limiter
 
 app.add_exception_handler(
@@ -37,6 +51,10 @@ app.add_exception_handler(
     _rate_limit_exceeded_handler
     )
 
+@app.exception_handler(PasswordHashingOverloaded)
+async def password_hashing_overloaded_handler(request: Request, exc: PasswordHashingOverloaded):
+    return JSONResponse(status_code=503, content={"detail": "Too many login requests, please try again."}, headers={"Retry-After": "1"})
+
 logging.basicConfig(level=logging.INFO)
 
 origins = ["*"]
@@ -47,11 +65,42 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+app.add_middleware(LLMUsageMiddleware)
+
 @app.on_event("startup")
-def startup_event():
-    models.Base.metadata.create_all(bind=engine)
+async def startup_event():
+    await asyncio.to_thread(models.Base.metadata.create_all, bind=engine)
+    app.state.revocation_purge_task = asyncio.create_task(purge_expired_revocations_periodically())
+    app.state.llm_cache_eviction_task = asyncio.create_task(evict_llm_cache_periodically())
+    cost_writer.start()
+    job_queue.start()
+    if config.INTELLICHEK_WARMUP:
+        app.state.warm_up_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Queue the running jobs again and write the queued cost ledger rows before the worker exits
+    await job_queue.stop()
+    await cost_writer.stop()
+    engine.dispose()
+    await async_engine.dispose()
+    await lock_engine.dispose()
+
+@app.get("/api/v1/health", tags=['Health'], summary="Health Check")
+async def health_check():
+    return {"status": "ok"}
+
+@app.get(
+    "/api/v1/health/db_pool",
+    tags=['Health'],
+    summary="Database Connection Pool Statistics (Admin Only)",
+    dependencies=[Depends(check_admin_role)]
+)
+async def db_pool_stats():
+    return get_pool_stats()
 
 app.include_router(authentification.router, prefix="/api/v1")
 app.include_router(email.router, prefix="/api/v1")
@@ -67,3 +116,4 @@ app.include_router(maturity_models.router, prefix="/api/v1")
 app.include_router(roadmap.router, prefix="/api/v1/roadmap")
 app.include_router(report.router, prefix="/api/v1/reports")
 app.include_router(prices.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1/jobs")
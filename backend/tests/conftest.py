@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+def pytest_sessionfinish(session, exitstatus):
+    """Fail a CI run that skipped tests, e.g. because langchain or the database drivers are missing."""
+    if not os.getenv("CI") or exitstatus != pytest.ExitCode.OK:
+        return
+    reporter = session.config.pluginmanager.get_plugin("terminalreporter")
+    if reporter is not None and reporter.stats.get("skipped"):
+        reporter.write_line(f"CI: {len(reporter.stats['skipped'])} skipped tests count as failures", red=True)
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
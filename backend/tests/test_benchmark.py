@@ -0,0 +1,72 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+pydantic = pytest.importorskip("pydantic")
+
+from ai_tools.intellichek import benchmark
+
+BUNDLED_BENCHMARK = Path(__file__).resolve().parents[1] / "ai_tools" / "chek_database" / "benchmark.json"
+
+def _write(path, entries):
+    path.write_text(json.dumps({"Key Maturity Areas": entries}))
+    return str(path)
+
+def test_entry_fields_are_normalized_to_lists():
+    entry = benchmark.BenchmarkEntry.model_validate({
+        "kma": "Processes",
+        "check level": 3,
+        "dependencies": benchmark.NO_DEPENDENCY,
+        "actions": ["  Have process map ", "", None],
+        "check tools": "CHEK Virtual Assistant",
+    })
+
+    assert entry.check_level == 3
+    assert entry.dependencies == []
+    assert entry.actions == ["Have process map"]
+    assert entry.chek_tools == ["CHEK Virtual Assistant"]
+
+def test_empty_and_missing_fields_are_empty_lists():
+    entry = benchmark.BenchmarkEntry.model_validate({"kma": "Technology", "check level": 2, "dependencies": ""})
+
+    assert (entry.dependencies, entry.actions, entry.chek_tools) == ([], [], [])
+
+def test_entry_without_level_is_rejected(tmp_path):
+    path = _write(tmp_path / "benchmark.json", [{"kma": "Technology"}])
+
+    with pytest.raises(pydantic.ValidationError):
+        benchmark.BenchmarkCatalogue.load(path)
+
+def test_catalogue_indexes_kmas_and_actions(tmp_path):
+    path = _write(tmp_path / "benchmark.json", [
+        {"kma": "A", "check level": 2, "actions": ["x", "y"]},
+        {"kma": "B", "check level": 3, "actions": "x", "dependencies": ["y"]},
+    ])
+
+    catalogue = benchmark.BenchmarkCatalogue.load(path)
+
+    assert catalogue.get("B").dependencies == ["y"]
+    assert catalogue.get("C") is None
+    assert [entry.kma for entry in catalogue.providers("x")] == ["A", "B"]
+    assert catalogue.providers("z") == []
+
+def test_bundled_catalogue_is_valid():
+    catalogue = benchmark.BenchmarkCatalogue.load(str(BUNDLED_BENCHMARK))
+
+    assert len(catalogue.entries) == len(catalogue.by_kma)
+    assert all(benchmark.NO_DEPENDENCY not in entry.dependencies for entry in catalogue.entries)
+
+def test_catalogue_is_cached_and_reloaded_when_the_file_changes(tmp_path):
+    path = _write(tmp_path / "benchmark.json", [{"kma": "A", "check level": 2}])
+    first = benchmark.get_benchmark_catalogue(path)
+
+    assert benchmark.get_benchmark_catalogue(path) is first
+
+    _write(tmp_path / "benchmark.json", [{"kma": "A", "check level": 4}])
+    os.utime(path, (first.mtime + 10, first.mtime + 10))
+    reloaded = benchmark.get_benchmark_catalogue(path)
+
+    assert reloaded is not first
+    assert reloaded.get("A").check_level == 4
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from ai_tools.intellichek.bpmn_parser import line_lane, parse_bpmn
+
+BUNDLED_BPMN = Path(__file__).resolve().parents[2] / "frontend" / "public" / "AS_IS_Map4GPT_completed.bpmn"
+
+POOLS = ["APPLICANT", "BUILDING AUTHORITY", "PUBLIC", "THIRD PARTIES"]
+
+LANES_BPMN = """<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://www.omg.org/spec/BPMN/20100524/MODEL">
+  <collaboration id="Collaboration_1">
+    <participant id="Participant_1" name="MUNICIPALITY" processRef="Process_1" />
+  </collaboration>
+  <process id="Process_1">
+    <laneSet id="LaneSet_1">
+      <lane id="Lane_1" name="Front Office">
+        <flowNodeRef>Start</flowNodeRef>
+        <flowNodeRef>Receive</flowNodeRef>
+      </lane>
+      <lane id="Lane_2" name="Technical Office">
+        <flowNodeRef>Check</flowNodeRef>
+      </lane>
+    </laneSet>
+    <task id="Check" name="Check Application" />
+    <task id="Receive" name="Receive Application" />
+    <startEvent id="Start" />
+    <sequenceFlow id="Flow_1" sourceRef="Start" targetRef="Receive" />
+    <sequenceFlow id="Flow_2" sourceRef="Receive" targetRef="Check" />
+  </process>
+</definitions>
+"""
+
+def test_bundled_map_has_pools_and_message_flows():
+    model = parse_bpmn(BUNDLED_BPMN.read_bytes())
+    text = model.to_text()
+
+    assert len(model.elements) == 63
+    assert all(element.pool in POOLS for element in model.elements)
+    for pool in POOLS:
+        assert f"Pool: {pool}" in text
+
+    message_lines = [line for line in text.split("\n") if line.startswith("Message flow: ")]
+    assert len(model.messages) == 14
+    assert len(message_lines) == 14
+    assert all(" -> " in line for line in message_lines)
+    assert "(APPLICANT) -> " in text and "(BUILDING AUTHORITY)" in text
+
+def test_bundled_map_is_ordered_pool_by_pool_from_the_start_events():
+    model = parse_bpmn(BUNDLED_BPMN.read_bytes())
+    pools = [element.pool for element in model.elements]
+
+    # Every pool forms one consecutive block, in the order of the collaboration
+    assert [pool for index, pool in enumerate(pools) if index == 0 or pools[index - 1] != pool] == POOLS
+    assert model.elements[0].type == "startEvent"
+
+def test_lanes_within_a_pool():
+    model = parse_bpmn(LANES_BPMN)
+    lines = model.to_text().split("\n")
+
+    assert [element.id for element in model.elements] == ["Start", "Receive", "Check"]
+    assert [line_lane(line) for line in lines] == [
+        "MUNICIPALITY / Front Office", "MUNICIPALITY / Front Office", "MUNICIPALITY / Technical Office"
+    ]
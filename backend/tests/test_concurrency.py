@@ -0,0 +1,71 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+chains = pytest.importorskip("ai_tools.intellichek.chains")
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate
+
+# Latency of a call of the fake model
+DELAY = 0.2
+CALLS = 10
+
+class SlowChatModel(BaseChatModel):
+    """Fake chat model that answers after `DELAY` seconds without blocking the event loop."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise AssertionError("the blocking variant of the model was called")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(DELAY)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=messages[-1].content))])
+
+def _chain():
+    prompt = ChatPromptTemplate.from_messages([("human", "{question}")])
+    return prompt | SlowChatModel() | StrOutputParser()
+
+async def _run(inputs):
+    # A single thread: calls that held a thread while waiting for the model would run one by one
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+    chain = _chain()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(chains.ainvoke_with_cost(chain, call) for call in inputs))
+    return results, time.perf_counter() - start
+
+def test_concurrent_calls_overlap_without_holding_threads():
+    inputs = [{"question": f"Question {index}"} for index in range(CALLS)]
+
+    results, elapsed = asyncio.run(_run(inputs))
+
+    assert [response for response, _ in results] == [call["question"] for call in inputs]
+    # Sequential calls, or calls queued for the thread, would take CALLS * DELAY seconds
+    assert elapsed < DELAY * CALLS / 2
+
+def test_identical_concurrent_calls_share_one_model_call():
+    calls_before = chains.single_flight_stats()["calls"]
+
+    results, _ = asyncio.run(_run([{"question": "Same question"}] * CALLS))
+
+    assert [response for response, _ in results] == ["Same question"] * CALLS
+    assert chains.single_flight_stats()["calls"] - calls_before == 1
+
+def test_shared_calls_are_tracked_without_cost():
+    async def scenario():
+        with chains.track_usage() as tracker:
+            await _run([{"question": "Tracked question"}] * CALLS)
+        return tracker.drain()
+
+    calls = asyncio.run(scenario())
+
+    assert sorted(call.source for call in calls) == [chains.MODEL] + [chains.SHARED] * (CALLS - 1)
+    assert all(call.total_cost == 0 for call in calls if call.source == chains.SHARED)
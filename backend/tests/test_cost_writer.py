@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+costs = pytest.importorskip("api.utils.costs")
+
+from sqlalchemy import exc
+
+from ai_tools.intellichek.chains import CACHE, MODEL, SHARED, LLMCall
+
+class FakeCostWriter(costs.CostWriter):
+    """Cost writer that records the written batches instead of writing them to the database."""
+
+    def __init__(self, batch_size=3, flush_seconds=60, max_queue=100):
+        super().__init__(batch_size, flush_seconds, max_queue)
+        self.batches = []
+        # Outcomes of the next writes in order: an error to raise, or None to write
+        self.errors = []
+        # Users whose rows cannot be written
+        self.bad_users = set()
+
+    def _write(self, entries):
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        if any(entry[0] in self.bad_users for entry in entries):
+            raise exc.IntegrityError("INSERT INTO chat_info", {}, ValueError("user does not exist"))
+        self.batches.append(list(entries))
+
+def _database_down():
+    return exc.OperationalError("INSERT INTO chat_info", {}, ConnectionError("connection refused"))
+
+def _entries(count, user_id=1):
+    return [
+        (user_id, None, "/test", datetime(2026, 1, 1), LLMCall("gpt-4o", 10, 5, 0.01 * index))
+        for index in range(count)
+    ]
+
+async def _queue(writer, entries):
+    # Rows queued on the event loop are not written before the writer is started
+    writer.enqueue(entries)
+
+def test_enqueue_outside_of_an_event_loop_writes_immediately():
+    writer = FakeCostWriter()
+    entries = _entries(2)
+
+    writer.enqueue(entries)
+
+    assert writer.batches == [entries]
+    assert writer.queue_depth() == 0
+
+def test_enqueue_on_the_event_loop_queues_until_flushed():
+    writer = FakeCostWriter(batch_size=3)
+    entries = _entries(7)
+
+    asyncio.run(_queue(writer, entries))
+
+    assert writer.batches == []
+    assert writer.queue_depth() == 7
+    while writer.queue_depth():
+        assert writer.flush()
+    assert writer.batches == [entries[:3], entries[3:6], entries[6:]]
+    assert writer.stats()["written"] == 7
+    assert writer.stats()["batches"] == 3
+
+def test_full_queue_drops_rows():
+    writer = FakeCostWriter(max_queue=4)
+
+    asyncio.run(_queue(writer, _entries(6)))
+
+    assert writer.queue_depth() == 4
+    assert writer.stats()["dropped"] == 2
+
+def test_unavailable_database_requeues_the_batch():
+    writer = FakeCostWriter(batch_size=3)
+    entries = _entries(4)
+    asyncio.run(_queue(writer, entries))
+    writer.errors.append(_database_down())
+
+    assert not writer.flush()
+    assert writer.queue_depth() == 4
+    assert writer.stats()["failures"] == 1
+
+    assert writer.flush()
+    assert writer.batches == [entries[:3]]
+
+def test_bad_row_is_dropped_and_the_others_are_written():
+    writer = FakeCostWriter(batch_size=3)
+    entries = _entries(1) + _entries(1, user_id=2) + _entries(1)
+    writer.bad_users.add(2)
+    asyncio.run(_queue(writer, entries))
+
+    assert writer.flush()
+
+    assert writer.batches == [[entries[0]], [entries[2]]]
+    assert writer.stats()["written"] == 2
+    assert writer.stats()["dropped"] == 1
+    assert writer.queue_depth() == 0
+
+def test_unavailable_database_while_writing_rows_one_by_one_requeues_the_rest():
+    writer = FakeCostWriter(batch_size=3)
+    entries = _entries(3)
+    asyncio.run(_queue(writer, entries))
+    # The batch fails because of a row, the first row is written, then the database goes away
+    writer.errors += [exc.IntegrityError("INSERT INTO chat_info", {}, ValueError()), None, _database_down()]
+
+    assert not writer.flush()
+
+    assert writer.batches == [[entries[0]]]
+    assert writer.queue_depth() == 2
+    assert writer.flush()
+    assert writer.batches == [[entries[0]], entries[1:]]
+
+def test_running_writer_flushes_a_full_batch():
+    async def scenario():
+        writer = FakeCostWriter(batch_size=3, flush_seconds=60)
+        writer.start()
+        writer.enqueue(_entries(3))
+        for _ in range(100):
+            if writer.batches:
+                break
+            await asyncio.sleep(0.01)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert len(writer.batches) == 1
+    assert not writer.running
+
+def test_stop_writes_the_queued_rows():
+    async def scenario():
+        writer = FakeCostWriter(batch_size=3, flush_seconds=60)
+        writer.start()
+        writer.enqueue(_entries(2))
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert sum(len(batch) for batch in writer.batches) == 2
+    assert writer.queue_depth() == 0
+
+def test_metrics_count_reused_calls_without_cost():
+    calls = [
+        LLMCall("gpt-4o", 100, 20, 0.5),
+        LLMCall("gpt-4o", 0, 0, 0.0, source=CACHE),
+        LLMCall("gpt-4o", 0, 0, 0.0, source=SHARED),
+    ]
+
+    assert costs._metrics(calls) == {
+        "total_cost": 0.5,
+        "calls": 3,
+        "reused_calls": 2,
+        "prompt_tokens": 100,
+        "completion_tokens": 20,
+    }
+    assert costs._metrics([LLMCall("gpt-4o", 1, 1, 0.1, source=MODEL)])["reused_calls"] == 0
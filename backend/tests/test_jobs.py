@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+jobs = pytest.importorskip("api.utils.jobs")
+
+import httpx
+import openai
+from fastapi import HTTPException
+from sqlalchemy import exc
+
+def _wrapped(error: Exception, explicit: bool) -> HTTPException:
+    """Raise an error in a handler that wraps it in an HTTPException, as the routes do."""
+    try:
+        try:
+            raise error
+        except Exception as e:
+            if explicit:
+                raise HTTPException(status_code=500, detail=str(e)) from e
+            raise HTTPException(status_code=500, detail=str(e))
+    except HTTPException as wrapper:
+        return wrapper
+
+def _database_down() -> exc.OperationalError:
+    return exc.OperationalError("SELECT 1", {}, ConnectionError("connection refused"))
+
+def _model_unreachable() -> openai.APIConnectionError:
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+def test_dedup_key_identifies_identical_jobs():
+    key = jobs.dedup_key("report_as_is", 1, 2, "English")
+
+    assert key == jobs.dedup_key("report_as_is", 1, 2, "English")
+    assert len({
+        key,
+        jobs.dedup_key("report_maturity", 1, 2, "English"),
+        jobs.dedup_key("report_as_is", 3, 2, "English"),
+        jobs.dedup_key("report_as_is", 1, 4, "English"),
+        jobs.dedup_key("report_as_is", 1, 2, "German"),
+    }) == 5
+
+@pytest.mark.parametrize("error", [_database_down(), _model_unreachable()])
+def test_transient_errors_are_retried(error):
+    assert jobs._is_retryable(error)
+
+@pytest.mark.parametrize("explicit", [True, False])
+def test_transient_errors_wrapped_by_a_handler_are_retried(explicit):
+    assert jobs._is_retryable(_wrapped(_database_down(), explicit))
+    assert jobs._is_retryable(_wrapped(_model_unreachable(), explicit))
+
+def test_deterministic_errors_fail_the_job():
+    assert not jobs._is_retryable(ValueError("invalid process map"))
+    assert not jobs._is_retryable(_wrapped(KeyError("language"), explicit=False))
+    assert not jobs._is_retryable(HTTPException(status_code=404, detail="Project not found."))
+
+def test_job_timeout_fails_the_job():
+    assert not jobs._is_retryable(asyncio.TimeoutError())
+
+def test_error_message_of_a_timeout():
+    assert jobs._error_message(asyncio.TimeoutError()) == "The job timed out."
+    assert jobs._error_message(HTTPException(status_code=404, detail="Project not found.")) == "Project not found."
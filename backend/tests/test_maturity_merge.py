@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+helpers = pytest.importorskip("api.utils.helpers")
+
+from sqlalchemy.dialects import postgresql
+
+from api.models import models
+
+USER_ID = 7
+PROJECT_ID = 11
+
+def _compile(statement):
+    return statement.compile(dialect=postgresql.dialect())
+
+def _answer(category, level, description):
+    return SimpleNamespace(category=category, answer_number=level, description=description)
+
+def test_last_ai_evaluation_and_questionnaire_answers_take_precedence():
+    ai_response = [
+        {"Label": "Data", "Level": "1", "Justification": "first"},
+        {"Label": "Tools", "Level": "2", "Justification": "tools"},
+        {"Label": "Data", "Level": "3", "Justification": "last"},
+    ]
+    answers = [_answer("Tools", 4, "answered"), _answer("Skills", 1, "skills")]
+
+    labels, upsert, _ = helpers._merge_maturity_statements(
+        models.MaturityModelInformation, USER_ID, PROJECT_ID, ai_response, answers
+    )
+
+    assert labels == ["Data", "Tools", "Skills"]
+    values = list(_compile(upsert).params.values())
+    assert "last" in values and "first" not in values
+    assert "answered" in values and "tools" not in values
+    assert values.count("information") == 3
+
+def test_one_upsert_on_the_constraint_and_one_delete_of_stale_labels():
+    labels, upsert, stale = helpers._merge_maturity_statements(
+        models.MaturityModelProcess, USER_ID, PROJECT_ID,
+        [{"Label": "Data", "Level": 2, "Justification": "data"}], None
+    )
+
+    sql = str(_compile(upsert))
+    assert "ON CONFLICT ON CONSTRAINT uq_maturity_assessment_project_user_dimension_label DO UPDATE" in sql
+    assert "RETURNING" in sql
+
+    compiled = _compile(stale)
+    assert str(compiled).startswith("DELETE FROM")
+    assert "NOT IN" in str(compiled)
+    params = list(compiled.params.values())
+    assert USER_ID in params and PROJECT_ID in params and "process" in params
+    assert ["Data"] in params or "Data" in params
+
+def test_without_entries_all_labels_of_the_dimension_are_stale():
+    labels, upsert, stale = helpers._merge_maturity_statements(
+        models.MaturityModelTechnology, USER_ID, PROJECT_ID, None, None
+    )
+
+    assert labels == []
+    assert upsert is None
+    assert str(_compile(stale)).startswith("DELETE FROM")
+
+def test_level_that_is_not_a_number_is_rejected():
+    with pytest.raises(ValueError):
+        helpers._merge_maturity_statements(
+            models.MaturityModelOrganisation, USER_ID, PROJECT_ID,
+            [{"Label": "Data", "Level": "high", "Justification": "data"}], None
+        )
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+import pytest
+
+utils = pytest.importorskip("api.utils.utils")
+
+def test_cancelled_queued_hash_leaves_the_queue():
+    async def scenario():
+        hasher = utils.PasswordHasher(workers=1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(hasher.run(release.wait))
+        await asyncio.sleep(0.05)
+
+        queued = asyncio.ensure_future(hasher.run(lambda: "never"))
+        await asyncio.sleep(0)
+        assert hasher.stats()["queued"] == 1
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+        release.set()
+        assert await running is True
+        assert hasher.stats()["queued"] == 0
+        assert await hasher.run(lambda: "hashed") == "hashed"
+
+    asyncio.run(scenario())
+
+def test_full_queue_is_rejected():
+    async def scenario():
+        hasher = utils.PasswordHasher(workers=1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(hasher.run(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(hasher.run(lambda: "queued"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(utils.PasswordHashingOverloaded):
+            await hasher.run(lambda: "rejected")
+
+        release.set()
+        assert await queued == "queued"
+        await running
+        assert hasher.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
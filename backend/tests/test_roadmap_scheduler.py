@@ -0,0 +1,88 @@
+from datetime import date
+
+import pytest
+
+from ai_tools.intellichek.roadmap_scheduler import RoadmapCycleError, add_months, schedule_roadmap
+
+START = date(2025, 1, 1)
+
+def _entry(kma, level_difference, actions=(), dependencies=(), chek_tools=()):
+    return {
+        "kma": kma,
+        "level_difference": level_difference,
+        "actions": list(actions),
+        "dependencies": list(dependencies),
+        "chek_tools": list(chek_tools),
+    }
+
+def _by_kma(roadmap):
+    return {entry["kma"]: entry for entry in roadmap}
+
+@pytest.mark.parametrize("start, months, expected", [
+    (date(2025, 1, 31), 1, date(2025, 2, 28)),
+    (date(2024, 1, 31), 1, date(2024, 2, 29)),
+    (date(2025, 3, 31), 3, date(2025, 6, 30)),
+    (date(2025, 11, 15), 3, date(2026, 2, 15)),
+    (date(2025, 5, 10), 0, date(2025, 5, 10)),
+])
+def test_add_months_clamps_the_day(start, months, expected):
+    assert add_months(start, months) == expected
+
+def test_dependent_kma_starts_after_its_provider():
+    roadmap = _by_kma(schedule_roadmap([
+        _entry("Processes", 1, dependencies=["Digital submission"]),
+        _entry("Technology", 2, actions=["Digital submission"]),
+    ], START, 3))
+
+    assert roadmap["Technology"]["start_date"] == "2025-01-01"
+    assert roadmap["Technology"]["end_date"] == "2025-07-01"
+    assert roadmap["Processes"]["start_date"] == "2025-07-01"
+    assert roadmap["Processes"]["end_date"] == "2025-10-01"
+
+def test_kma_waits_for_the_latest_of_several_providers():
+    roadmap = _by_kma(schedule_roadmap([
+        _entry("A", 1, actions=["a"]),
+        _entry("B", 3, actions=["b"]),
+        _entry("C", 1, dependencies=["a", "b"]),
+    ], START, 1))
+
+    assert roadmap["C"]["start_date"] == "2025-04-01"
+
+def test_roadmap_is_ordered_by_start_date():
+    roadmap = schedule_roadmap([
+        _entry("Late", 1, dependencies=["x"]),
+        _entry("Early", 1, actions=["x"]),
+    ], START, 1)
+
+    assert [entry["kma"] for entry in roadmap] == ["Early", "Late"]
+
+def test_kma_without_level_difference_needs_no_work():
+    roadmap = _by_kma(schedule_roadmap([
+        _entry("Done", 0, actions=["x"], dependencies=["y"], chek_tools=["Tool"]),
+        _entry("Open", 1, dependencies=["x"]),
+    ], START, 3))
+
+    assert roadmap["Done"] == {
+        "kma": "Done", "start_date": "2025-01-01", "end_date": "2025-01-01",
+        "dependencies": [], "actions": [], "chek_tools": [],
+    }
+    # The actions of a finished KMA do not delay the others
+    assert roadmap["Open"]["start_date"] == "2025-01-01"
+
+def test_own_and_unknown_dependencies_do_not_delay():
+    roadmap = _by_kma(schedule_roadmap([
+        _entry("Self", 1, actions=["x"], dependencies=["x", "unknown"]),
+    ], START, 2))
+
+    assert roadmap["Self"]["start_date"] == "2025-01-01"
+    assert roadmap["Self"]["end_date"] == "2025-03-01"
+
+def test_cycle_is_reported_with_its_kmas():
+    with pytest.raises(RoadmapCycleError) as error:
+        schedule_roadmap([
+            _entry("A", 1, actions=["a"], dependencies=["b"]),
+            _entry("B", 1, actions=["b"], dependencies=["a"]),
+            _entry("C", 1),
+        ], START, 1)
+
+    assert error.value.kmas == ["A", "B"]
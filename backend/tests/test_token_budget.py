@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import pytest
+
+from ai_tools.intellichek.bpmn_parser import line_lane, parse_bpmn
+
+token_budget = pytest.importorskip("ai_tools.intellichek.token_budget")
+
+BUNDLED_BPMN = Path(__file__).resolve().parents[2] / "frontend" / "public" / "AS_IS_Map4GPT_completed.bpmn"
+
+def _pool_map(pools, elements_per_pool):
+    lines = []
+    for pool in pools:
+        for _ in range(elements_per_pool):
+            index = len(lines) + 1
+            lines.append(f"{index}. Task: Review the submitted documents | Pool: {pool} | Next: {index + 1}")
+    return "\n".join(lines)
+
+def test_split_cuts_at_pool_boundaries():
+    pools = ["APPLICANT", "AUTHORITY", "AGENCIES"]
+    text = _pool_map(pools, 10)
+    first_pool = "\n".join(text.split("\n")[:10])
+    budget = token_budget.count_tokens(first_pool) * 3 // 2
+
+    parts = token_budget.split_process_map(text, budget)
+
+    assert "\n".join(parts) == text
+    assert [{line_lane(line) for line in part.split("\n")} for part in parts] == [{pool} for pool in pools]
+
+def test_split_keeps_the_order_of_the_bundled_map():
+    text = parse_bpmn(BUNDLED_BPMN.read_bytes()).to_text()
+
+    parts = token_budget.split_process_map(text, 600)
+
+    assert len(parts) > 1
+    assert "\n".join(parts) == text
+    assert all(token_budget.count_tokens(part) <= 600 for part in parts)
+
+def test_extraction_prompts_stay_within_the_budget(monkeypatch):
+    extraction = pytest.importorskip("ai_tools.intellichek.extraction")
+    model = extraction.ChatOpenAI(model_name="gpt-4o", openai_api_key="test")
+    text = parse_bpmn(BUNDLED_BPMN.read_bytes()).to_text()
+    monkeypatch.setattr(token_budget.config, "LLM_INPUT_TOKEN_BUDGET", 2000)
+
+    estimate = extraction.estimate_extraction_process(text, "English", model)
+
+    assert estimate["calls"] > 1
+    assert estimate["max_prompt_tokens"] <= 2000